@@ -0,0 +1,45 @@
+"""
+How many frames per second the entire plate widget can draw when scrubbing through a measurement of a 2m plate:
+resizing the frame, mapping it through the color LUT and turning it into a pixmap.
+
+Usage: python benchmarks/render_benchmark.py [degree]
+"""
+from __future__ import print_function
+import sys
+import time
+
+import numpy as np
+from PySide import QtGui
+
+from pawlabeling.functions import utility
+
+rows, columns = 256, 63
+
+
+def benchmark(frames, degree, n_max, buffer=None):
+    start = time.time()
+    for frame in frames:
+        utility.get_qpixmap(frame, degree, n_max, buffer=buffer)
+    return len(frames) / (time.time() - start)
+
+
+def main(degree=4):
+    # QPixmaps need an application, which has to stay alive until we're done drawing
+    app = QtGui.QApplication(sys.argv)
+    random_state = np.random.RandomState(0)
+    frames = [random_state.rand(rows, columns) * 100 for _ in range(200)]
+    buffer = utility.ColorMapBuffer()
+    # Only the color mapping, without resizing or creating the pixmap
+    resized = np.repeat(np.repeat(frames[0], degree, axis=0), degree, axis=1)
+    start = time.time()
+    for _ in range(200):
+        buffer.render(resized, 100)
+    print("Plate of {}x{} at degree {}".format(rows, columns, degree))
+    print("color mapping: {:.2f} ms".format((time.time() - start) / 200 * 1000))
+    print("new buffer every frame: {:.0f} fps".format(benchmark(frames, degree, 100)))
+    print("reused buffer: {:.0f} fps".format(benchmark(frames, degree, 100, buffer=buffer)))
+    app.quit()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4)
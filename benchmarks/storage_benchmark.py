@@ -0,0 +1,98 @@
+"""
+Compares chunk shapes and codecs for storing a measurement: the latency of reading a random frame
+(like the slider does) and the throughput of reading the whole measurement.
+
+Usage: python benchmarks/storage_benchmark.py [number_of_frames]
+"""
+from __future__ import print_function
+import os
+import sys
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import tables
+
+from pawlabeling.models import table
+
+rows, columns = 256, 63
+
+chunk_policies = [
+    ("auto", lambda shape, itemsize: None),
+    ("frame-aligned", lambda shape, itemsize: table.chunk_shape("measurement", shape, itemsize)),
+    # Spans many frames, so a single frame touches several chunks that are mostly other frames
+    ("tiles 32x32x64", lambda shape, itemsize: (32, 32, min(64, shape[2]))),
+]
+
+# The storage profiles and a few alternatives
+codecs = sorted(table.STORAGE_PROFILES.items()) + [
+    ("blosc 9", dict(complib="blosc", complevel=9)),
+    ("blosc:lz4 5", dict(complib="blosc:lz4", complevel=5)),
+    ("zlib 9", dict(complib="zlib", complevel=9)),
+]
+
+
+def create_measurement(number_of_frames):
+    """
+    A few contacts moving over the plate, most of the plate is empty, just like a real measurement
+    """
+    data = np.zeros((rows, columns, number_of_frames))
+    x, y = np.mgrid[0:rows, 0:columns]
+    for index, start in enumerate(range(0, number_of_frames - 60, 40)):
+        center_x = 20 + (index * 37) % (rows - 40)
+        center_y = 15 + (index * 11) % (columns - 30)
+        blob = np.exp(-((x - center_x) ** 2 + (y - center_y) ** 2) / 30.)
+        blob[blob < 0.05] = 0
+        for frame in range(60):
+            data[:, :, start + frame] += blob * 100 * np.sin(np.pi * frame / 60.)
+    return np.round(data, 1)
+
+
+def benchmark(folder, data, codec, policy, repeat=50):
+    file_name = os.path.join(folder, "storage.h5")
+    with tables.open_file(file_name, mode="w") as database:
+        array = database.create_carray("/", "measurement", atom=tables.Atom.from_dtype(data.dtype),
+                                       shape=data.shape, filters=tables.Filters(**codec),
+                                       chunkshape=policy(data.shape, data.dtype.itemsize))
+        array[:] = data
+        chunkshape = array.chunkshape
+    size = os.path.getsize(file_name)
+
+    frames = np.random.RandomState(0).randint(0, data.shape[2], repeat)
+    with tables.open_file(file_name, mode="r") as database:
+        array = database.root.measurement
+        start = time.time()
+        for frame in frames:
+            array[:, :, frame]
+        frame_latency = (time.time() - start) / repeat
+
+    with tables.open_file(file_name, mode="r") as database:
+        start = time.time()
+        database.root.measurement.read()
+        throughput = data.nbytes / (time.time() - start) / 1024 ** 2
+    os.remove(file_name)
+    return chunkshape, size, frame_latency, throughput
+
+
+def main(number_of_frames=500):
+    data = create_measurement(number_of_frames)
+    folder = tempfile.mkdtemp()
+    try:
+        print("Measurement of {}x{}x{} ({:.1f} MB)".format(rows, columns, number_of_frames, data.nbytes / 1024. ** 2))
+        print("{:<16} {:<14} {:<16} {:>10} {:>10} {:>12}".format("chunks", "codec", "chunkshape", "size MB",
+                                                                 "frame ms", "read MB/s"))
+        for policy_name, policy in chunk_policies:
+            for codec_name, codec in codecs:
+                if tables.which_lib_version(codec["complib"].split(":")[0]) is None:
+                    continue
+                chunkshape, size, frame_latency, throughput = benchmark(folder, data, codec, policy)
+                chunkshape = str(tuple(int(length) for length in chunkshape))
+                print("{:<16} {:<14} {:<16} {:>10.2f} {:>10.3f} {:>12.0f}".format(
+                    policy_name, codec_name, chunkshape, size / 1024. ** 2, frame_latency * 1000, throughput))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
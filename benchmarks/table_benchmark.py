@@ -0,0 +1,77 @@
+"""
+Times the lookups in the PyTables layer on a session with 10k contacts,
+once with the column indexes and once after dropping them.
+
+Usage: python benchmarks/table_benchmark.py [number_of_contacts]
+"""
+from __future__ import print_function
+import os
+import sys
+import shutil
+import tempfile
+import timeit
+
+from pawlabeling.models import table
+
+
+def create_database(database_file, number_of_contacts):
+    database = table.load_table(database_file)
+    subjects_table = table.SubjectsTable(table=database)
+    subjects_table.create_subject(subject_id="subject_1", first_name="Bench", last_name="Mark",
+                                  birthday="2010-01-01")
+    sessions_table = table.SessionsTable(table=database, subject_id="subject_1")
+    sessions_table.create_session(session_id="session_1", subject_id="subject_1", session_name="Benchmark")
+    measurements_table = table.MeasurementsTable(table=database, subject_id="subject_1", session_id="session_1")
+    measurements_table.create_measurement(measurement_id="measurement_1", session_id="session_1",
+                                          subject_id="subject_1", measurement_name="Benchmark")
+    contacts_table = table.ContactsTable(table=database, subject_id="subject_1", session_id="session_1",
+                                         measurement_id="measurement_1")
+
+    # Fill the table directly, creating 10k groups would dominate the benchmark
+    row = contacts_table.contacts_table.row
+    for index in range(number_of_contacts):
+        row["contact_id"] = "contact_{}".format(index)
+        row["contact_label"] = index % 4
+        row.append()
+    contacts_table.contacts_table.flush()
+    return database, contacts_table
+
+
+def run_lookups(contacts_table, number_of_contacts, repeat=200):
+    last_id = "contact_{}".format(number_of_contacts - 1)
+    free_id = "contact_{}".format(number_of_contacts)
+    contacts = contacts_table.contacts_table
+    timings = [
+        ("search_table", lambda: contacts_table.get_contact(contact_id=last_id)),
+        ("check_availability", lambda: contacts_table.check_availability(contacts, "contact_id",
+                                                                         {"contact_id": free_id})),
+        ("update_contact", lambda: contacts_table.update_contact(contact_id=last_id, contact_label=1)),
+        ("find_rows", lambda: contacts_table.find_rows(contacts, "contact_id", last_id)),
+    ]
+    results = []
+    for name, function in timings:
+        seconds = timeit.timeit(function, number=repeat) / repeat
+        results.append((name, seconds * 1000.))
+    return results
+
+
+def main(number_of_contacts=10000):
+    folder = tempfile.mkdtemp()
+    database_file = os.path.join(folder, "benchmark.h5")
+    database, contacts_table = create_database(database_file, number_of_contacts)
+    try:
+        indexed = run_lookups(contacts_table, number_of_contacts)
+        contacts_table.contacts_table.cols.contact_id.remove_index()
+        unindexed = run_lookups(contacts_table, number_of_contacts)
+
+        print("{} contacts in one session".format(number_of_contacts))
+        print("{:<20} {:>12} {:>12}".format("lookup", "indexed ms", "scan ms"))
+        for (name, with_index), (_, without_index) in zip(indexed, unindexed):
+            print("{:<20} {:>12.3f} {:>12.3f}".format(name, with_index, without_index))
+    finally:
+        database.close()
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
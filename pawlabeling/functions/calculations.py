@@ -1,4 +1,4 @@
-from collections import defaultdict
+from collections import defaultdict, deque
 import numpy as np
 from ..settings import settings
 
@@ -13,15 +13,12 @@ def asymmetry_index(left, right, absolute=False):
     during a 10-second recording and XL is the mean of a given gait variable
     for left footfalls during a 10-second recording
     See Oosterlinck et al. as a references.
+    left and right can be numbers, but also arrays or DataFrame columns, to get the ASI of each pair at once
     """
-    # This function only accepts ints and floats
-    assert isinstance(left, int) or isinstance(left, float)
-    assert isinstance(right, int) or isinstance(right, float)
-
     if absolute:
-        return (100. * abs(left - right)) / (0.5 * abs(left + right))
+        return (100. * np.abs(left - right)) / (0.5 * np.abs(left + right))
     else:
-        return (100. * (left - right)) / (0.5 * abs(left + right))
+        return (100. * (left - right)) / (0.5 * np.abs(left + right))
 
 
 def interpolate_time_series(data, length=100):
@@ -39,6 +36,51 @@ def interpolate_time_series(data, length=100):
     return data_new
 
 
+def resample_positions(lengths, length):
+    """
+    Where length evenly spaced samples fall in series of the given lengths: the sample before, the sample after
+    and how far in between. Every result is an (n_series, length) array
+    """
+    lengths = np.asarray(lengths)
+    positions = np.linspace(0, 1, num=length)[np.newaxis, :] * (lengths[:, np.newaxis] - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, lengths[:, np.newaxis] - 1)
+    return lower, upper, positions - lower
+
+
+def interpolate_time_series_batch(series, length=101):
+    """
+    Interpolate a list of 1D time series, each of its own length, to the same length in one go.
+    Returns an (n_series, length) array, every row is the same as what interpolate_time_series would return
+    """
+    if not len(series):
+        return np.zeros((0, length))
+    lengths = np.array([len(data) for data in series])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    flat = np.concatenate([np.asarray(data, dtype=np.float64) for data in series])
+
+    lower, upper, fraction = resample_positions(lengths, length)
+    lower += starts[:, np.newaxis]
+    upper += starts[:, np.newaxis]
+    return flat[lower] * (1 - fraction) + flat[upper] * fraction
+
+
+def interpolate_contacts_batch(data, lengths, length=101):
+    """
+    Resample the time axis of a stack of contacts to the same number of frames in one go.
+    data is an (n_contacts, x, y, z) array, with every contact padded with zeros to the same size,
+    lengths tells how many frames every contact really has. Returns an (n_contacts, x, y, length) array,
+    float32 data stays float32
+    """
+    lower, upper, fraction = resample_positions(lengths, length)
+    contacts = np.arange(len(data))[:, np.newaxis]
+    # Else the float64 fractions would upcast the two (n_contacts, length, x, y) temporaries
+    fraction = fraction.astype(np.result_type(data.dtype, np.float32))[:, :, np.newaxis, np.newaxis]
+    # Indexing the first and last axis puts the (n_contacts, length) axes in front
+    resampled = data[contacts, :, :, lower] * (1 - fraction) + data[contacts, :, :, upper] * fraction
+    return np.rollaxis(resampled, 1, 4)
+
+
 def calculate_cop(contact, version="scipy"):
     assert len(contact.data.shape) == 3
     if version == "scipy":
@@ -232,90 +274,107 @@ def vertical_impulse(contact, frequency, version=1):
 
 ##########################################################################################
 # Spatiotemporal functions
-def temporal_spatial(contacts, sensor_width, sensor_height, frequency):
-    distances = defaultdict()
-    label_lookup = defaultdict(dict)
-    for index, contact in enumerate(contacts):
-        direction_modifier = -1. if contact.orientation else 1.
-        lookup_table = defaultdict(int)
-        distance = defaultdict()
-        for index2 in range(1, 5):
-            new_index = index + index2
-            # Don't bother if we're near the end
-            if new_index >= len(contacts):
-                continue
-
-            other_contact = contacts[new_index]
-            other_label = other_contact.contact_label
-            # If we hit a contact for the second time
-            if other_label in lookup_table:
-                break
-
-            label_lookup[index][other_label] = new_index
-
-            # Lets skip bad contacts mkay?
-            lookup_table[other_label] = 1
-            if other_contact.contact_label < 0:
-                continue
-
-            x_dist = ((other_contact.min_x + ((other_contact.max_x - other_contact.min_x) / 2.)) -
-                      (contact.min_x + ((contact.max_x - contact.min_x) / 2.)))
-            y_dist = ((other_contact.min_y + ((other_contact.max_y - other_contact.min_y) / 2.)) -
-                      (contact.min_y + ((contact.max_y - contact.min_y) / 2.)))
-            z_dist = other_contact.min_z - contact.min_z
-
-            # Flip directions is the measurement is the other way around
-            x_dist *= sensor_height * direction_modifier
-            y_dist *= sensor_width * direction_modifier
-            z_dist = (1000 * z_dist) / frequency
-
-            distance[other_label] = (x_dist, y_dist, z_dist)
-
-        distances[index] = distance
-    return distances, label_lookup
-
-
-def gait_velocity(contacts, distances):
-    """
-    Calculate the velocity of the gait by dividing the average stride length
-    by the average swing time.
+# The label of the stride, step, ipsilateral and diagonal contact of every label
+GAIT_RELATIONS = ["stride", "step", "ipsi", "diag"]
+RELATION_LABELS = np.array([[0, 2, 1, 3],
+                            [1, 3, 0, 2],
+                            [2, 0, 3, 1],
+                            [3, 1, 2, 0]])
+
+
+def contact_arrays(contacts):
+    """
+    The labels, bounding boxes (min_x, max_x, min_y, max_y), min_z and orientation of a list of contacts as arrays
+    """
+    labels = np.array([contact.contact_label for contact in contacts], dtype=np.int64)
+    bounding_boxes = np.array([(contact.min_x, contact.max_x, contact.min_y, contact.max_y) for contact in contacts],
+                              dtype=np.float64).reshape(len(contacts), 4)
+    min_z = np.array([contact.min_z for contact in contacts], dtype=np.float64)
+    orientation = np.array([contact.orientation for contact in contacts], dtype=bool)
+    return labels, bounding_boxes, min_z, orientation
+
+
+def temporal_spatial(labels, bounding_boxes, min_z, orientation, sensor_width, sensor_height, frequency,
+                     groups=None, window=4):
+    """
+    Compares every contact with the next few contacts, up to the first label that shows up twice,
+    and returns the distances and durations to its stride, step, ipsi and diag contact as columns:
+    {"stride_width": (n,), "stride_length": (n,), "stride_duration": (n,), "stride_index": (n,), ...}
+    Missing contacts are NaN with an index of -1.
+
+    The contacts have to be sorted by min_z. Pass groups (like the measurement of every contact) to do
+    an entire session at once, contacts are only compared within their own group. frequency
+    (and the sensor sizes) can also be an array, with a value for every contact.
+    """
+    labels = np.asarray(labels)
+    number_of_contacts = len(labels)
+    centers = np.column_stack([(bounding_boxes[:, 0] + bounding_boxes[:, 1]) / 2.,
+                               (bounding_boxes[:, 2] + bounding_boxes[:, 3]) / 2.])
+
+    # The index of the next window contacts, for every contact
+    others = np.arange(number_of_contacts)[:, None] + np.arange(1, window + 1)[None, :]
+    valid = others < number_of_contacts
+    others = np.minimum(others, max(number_of_contacts - 1, 0))
+    if groups is not None:
+        groups = np.asarray(groups)
+        valid &= groups[others] == groups[:, None]
+    # Labels that aren't there can't match anything, not even each other
+    other_labels = np.where(valid, labels[others], np.iinfo(np.int64).min + np.arange(window)[None, :])
+
+    # We stop looking once a label shows up for the second time, everything after that is out of reach
+    repeated = np.zeros(other_labels.shape, dtype=bool)
+    for position in range(1, window):
+        repeated[:, position] = np.any(other_labels[:, :position] == other_labels[:, position:position + 1], axis=1)
+    reachable = valid & ~np.logical_or.accumulate(repeated, axis=1)
+
+    direction_modifier = np.where(orientation, -1., 1.)
+    x_dist = (centers[others, 0] - centers[:, None, 0]) * (np.asarray(sensor_height) * direction_modifier)[..., None]
+    y_dist = (centers[others, 1] - centers[:, None, 1]) * (np.asarray(sensor_width) * direction_modifier)[..., None]
+    z_dist = (1000. * (min_z[others] - min_z[:, None])) / np.asarray(frequency, dtype=np.float64)[..., None]
+
+    results = {}
+    labeled = labels >= 0
+    rows = np.arange(number_of_contacts)
+    for relation_index, relation in enumerate(GAIT_RELATIONS):
+        target = np.where(labeled, RELATION_LABELS[np.clip(labels, 0, 3), relation_index], -1)
+        match = reachable & (other_labels == target[:, None]) & labeled[:, None]
+        found = np.any(match, axis=1)
+        position = np.argmax(match, axis=1)
+        results["{}_index".format(relation)] = np.where(found, others[rows, position], -1)
+        for name, distance in [("width", x_dist), ("length", y_dist), ("duration", z_dist)]:
+            results["{}_{}".format(relation, name)] = np.where(found, distance[rows, position], np.nan)
+    return results
+
+
+def gait_velocity(results, groups=None):
+    """
+    Calculate the velocity of the gait by dividing the distance to the stride and step contacts
+    by the time it took to get there, averaged over all contacts.
+    With groups, every contact gets the velocity of its own group, NaN if there's nothing to average
 
     Can't this be calculated from taking steps between front paws for example?
     """
-    step_lookup = {0: 2, 1: 3, 2: 0, 3: 1}
-    speed = []
-    contact_labels = {}
-    for index, contact in enumerate(contacts):
-        contact_labels[index] = contact.contact_label
-
-    # Loop through distances and check if we find the same contact in
-    # the embedded distance dictionary
-    for contact_id, distance in distances.items():
-        contact_label_1 = contact_labels[contact_id]
-        if contact_label_1 < 0:
-            continue
-        for contact_label_2, (x, y, z) in distance.items():
-            if contact_label_1 == contact_label_2:
-                if not z:
-                    continue
-                # The * 1000 is to turn it into meters/second
-                new_x = x * 1000.
-                new_z = z * 1000.
-                speed.append(new_x / new_z)
-            if contact_label_2 == step_lookup[contact_label_1]:
-                # How could this not be there? Because of defaultdict?
-                if not z:
-                    continue
-                # The * 1000 is to turn it into meters/second
-                new_x = x * 1000.
-                new_z = z * 1000.
-                speed.append(new_x / new_z)
-
-    if speed:
-        return np.mean(speed)
-    else:
+    distances = np.concatenate([results["stride_width"], results["step_width"]])
+    durations = np.concatenate([results["stride_duration"], results["step_duration"]])
+    # Missing contacts are NaN and contacts in the same frame would divide by zero
+    usable = ~np.isnan(durations) & (durations != 0)
+    speed = np.zeros(len(durations))
+    speed[usable] = distances[usable] / durations[usable]
+
+    if groups is None:
+        if np.any(usable):
+            return np.mean(speed[usable])
         return np.nan
 
+    groups = np.asarray(groups)
+    group_ids, inverse = np.unique(groups, return_inverse=True)
+    inverse = np.concatenate([inverse, inverse])
+    totals = np.bincount(inverse[usable], weights=speed[usable], minlength=len(group_ids))
+    counts = np.bincount(inverse[usable], minlength=len(group_ids))
+    velocity = np.full(len(group_ids), np.nan)
+    velocity[counts > 0] = totals[counts > 0] / counts[counts > 0]
+    return velocity[inverse[:len(groups)]]
+
 
 # I seem to have multiple versions of this code
 # def gait_velocity(contacts, sensor_width=sensor_width, sensor_height=sensor_height, frequency=frequency):
@@ -383,78 +442,151 @@ def get_percentile(data, percent=5):
     return [x for x in data if x > low and x < high]
 
 
-def find_gait_pattern(pattern):
-    stride_patterns = {'0-2-1-3': ['0-2-1-3',
-                                   '0-2-1',
-                                   '2-1-3-0',
-                                   '2-1-3',
-                                   '1-3-0-2',
-                                   '1-3-0',
-                                   '3-0-2-1',
-                                   '3-0-2'],
-                       '0-2-3-1': ['0-2-3-1',
-                                   '0-2-3',
-                                   '2-3-1-0',
-                                   '2-3-1',
-                                   '3-1-0-2',
-                                   '3-1-0',
-                                   '1-0-2-3',
-                                   '1-0-2'],
-                       '0-3-2-1': ['0-3-2-1',
-                                   '0-3-2',
-                                   '3-2-1-0',
-                                   '3-2-1',
-                                   '2-1-0-3',
-                                   '2-1-0',
-                                   '1-0-3-2',
-                                   '1-0-3'],
-                       '2-0-1-3': ['2-0-1-3',
-                                   '2-0-1',
-                                   '0-1-3-2',
-                                   '0-1-3',
-                                   '1-3-2-0',
-                                   '1-3-2',
-                                   '3-2-0-1',
-                                   '3-2-0'],
-                       '2-0-3-1': ['2-0-3-1',
-                                   '2-0-3',
-                                   '0-3-1-2',
-                                   '0-3-1',
-                                   '3-1-2-0',
-                                   '3-1-2',
-                                   '1-2-0-3',
-                                   '1-2-0'],
-                       '2-3-0-1': ['2-3-0-1',
-                                   '2-3-0',
-                                   '3-0-1-2',
-                                   '3-0-1',
-                                   '0-1-2-3',
-                                   '0-1-2',
-                                   '1-2-3-0',
-                                   '1-2-3']}
+# Every gait pattern with the windows of three and four labels that belong to it
+STRIDE_PATTERNS = {'0-2-1-3': ['0-2-1-3',
+                               '0-2-1',
+                               '2-1-3-0',
+                               '2-1-3',
+                               '1-3-0-2',
+                               '1-3-0',
+                               '3-0-2-1',
+                               '3-0-2'],
+                   '0-2-3-1': ['0-2-3-1',
+                               '0-2-3',
+                               '2-3-1-0',
+                               '2-3-1',
+                               '3-1-0-2',
+                               '3-1-0',
+                               '1-0-2-3',
+                               '1-0-2'],
+                   '0-3-2-1': ['0-3-2-1',
+                               '0-3-2',
+                               '3-2-1-0',
+                               '3-2-1',
+                               '2-1-0-3',
+                               '2-1-0',
+                               '1-0-3-2',
+                               '1-0-3'],
+                   '2-0-1-3': ['2-0-1-3',
+                               '2-0-1',
+                               '0-1-3-2',
+                               '0-1-3',
+                               '1-3-2-0',
+                               '1-3-2',
+                               '3-2-0-1',
+                               '3-2-0'],
+                   '2-0-3-1': ['2-0-3-1',
+                               '2-0-3',
+                               '0-3-1-2',
+                               '0-3-1',
+                               '3-1-2-0',
+                               '3-1-2',
+                               '1-2-0-3',
+                               '1-2-0'],
+                   '2-3-0-1': ['2-3-0-1',
+                               '2-3-0',
+                               '3-0-1-2',
+                               '3-0-1',
+                               '0-1-2-3',
+                               '0-1-2',
+                               '1-2-3-0',
+                               '1-2-3']}
+
+
+def build_automaton(patterns):
+    """
+    Builds an Aho-Corasick automaton for {key: [dash-joined labels, ...]}, so all patterns can be matched against
+    a sequence of labels in a single pass. Returns the transitions, failure links and output of every state
+    """
+    transitions = [{}]
+    failures = [0]
+    outputs = [[]]
+    for key, sequences in sorted(patterns.items()):
+        for sequence in sequences:
+            labels = [int(label) for label in sequence.split("-")]
+            state = 0
+            for label in labels:
+                if label not in transitions[state]:
+                    transitions.append({})
+                    failures.append(0)
+                    outputs.append([])
+                    transitions[state][label] = len(transitions) - 1
+                state = transitions[state][label]
+            outputs[state].append((len(labels), key))
+
+    # Breadth first, so the failure link of a state's parent is always there already
+    queue = deque(transitions[0].values())
+    while queue:
+        state = queue.popleft()
+        for label, next_state in transitions[state].items():
+            queue.append(next_state)
+            failure = failures[state]
+            while failure and label not in transitions[failure]:
+                failure = failures[failure]
+            failures[next_state] = transitions[failure].get(label, 0)
+            outputs[next_state] = outputs[next_state] + outputs[failures[next_state]]
+    return transitions, failures, outputs
+
+
+# The stride patterns don't change, so we only have to build this once
+stride_automaton = build_automaton(STRIDE_PATTERNS)
+
+
+def find_gait_patterns(labels, automaton=stride_automaton):
+    """
+    Returns (start, stop, pattern) for every window of labels that matches a pattern, ordered by where they end
+    """
+    transitions, failures, outputs = automaton
     matches = []
-    for i in range(len(pattern) - 4):
-        if pattern[i] != "-":
-            for j in [5, 7]:
-                pat = pattern[i:i + j]
-                for key, values in stride_patterns.items():
-                    if pat in values:
-                        matches.append(key)
-
-    if not matches:
+    state = 0
+    for index, label in enumerate(labels):
+        while state and label not in transitions[state]:
+            state = failures[state]
+        state = transitions[state].get(label, 0)
+        for length, key in outputs[state]:
+            matches.append((index + 1 - length, index + 1, key))
+    return matches
+
+
+def find_gait_pattern(labels):
+    """
+    The pattern most of the measurement matches, or an empty string if nothing matches.
+    If there's a tie, the pattern that showed up first wins
+    """
+    counts = defaultdict(int)
+    first = {}
+    for start, stop, key in find_gait_patterns(labels):
+        counts[key] += 1
+        first.setdefault(key, start)
+    if not counts:
         return ""
-    elif len(set(matches)) == 1:
-        return matches[0]
-    else:
-        most_common = None
-        most_count = 0
-        for match in set(matches):
-            c = matches.count(match)
-            if c > most_count:
-                most_count = c
-                most_common = match
+    return max(counts, key=lambda key: (counts[key], -first[key]))
+
+
+def assign_gait_patterns(labels):
+    """
+    The pattern of the stride every contact belongs to, an empty string if it doesn't belong to any.
+    Full strides (four labels) take precedence over the windows of three labels and when strides overlap,
+    the later one wins, so a change of gait starts at the first stride with the new pattern
+    """
+    patterns = [""] * len(labels)
+    matches = find_gait_patterns(labels)
+    for start, stop, key in sorted(matches, key=lambda match: (match[1] - match[0], match[1])):
+        patterns[start:stop] = [key] * (stop - start)
+    return patterns
+
 
-        return most_common
+def segment_gait_patterns(labels):
+    """
+    Splits a measurement in (start, stop, pattern) segments of contacts with the same pattern, for mixed gaits
+    """
+    segments = []
+    for index, key in enumerate(assign_gait_patterns(labels)):
+        if segments and segments[-1][2] == key:
+            segments[-1] = (segments[-1][0], index + 1, key)
+        else:
+            segments.append((index, index + 1, key))
+    return segments
 
 
 #######################################################################################
@@ -463,8 +595,7 @@ def find_gait_pattern(pattern):
 
 def check_valid(contact_list, weight):
     contact_order = [contact.contact_label for contact in contact_list]
-    pattern = "-".join([str(contact.contact_label) for contact in contact_list])
-    pattern = find_gait_pattern(pattern)
+    pattern = find_gait_pattern(contact_order)
 
     speed = gait_velocity(contact_list)[1:-1]
     distances = temporal_spatial(contact_list)
@@ -1,3 +1,4 @@
+from functools import partial
 from PySide import QtGui, QtCore
 
 class Toolbar(QtGui.QToolBar):
@@ -55,3 +56,24 @@ def create_action(parent=None, text="", shortcut=None, icon=None,
     return action
 
 
+class Dispatcher(QtCore.QObject):
+    """
+    Calls functions on the thread it was created on, which is the GUI thread.
+    The signal is queued, so emitting it from a worker thread is safe
+    """
+    called = QtCore.Signal(object)
+
+    def __init__(self):
+        super(Dispatcher, self).__init__()
+        self.called.connect(self.call, QtCore.Qt.QueuedConnection)
+
+    def call(self, function):
+        function()
+
+
+# This module gets imported on the GUI thread, so that's where the dispatcher lives
+dispatcher = Dispatcher()
+
+
+def call_in_gui_thread(function, *args, **kwargs):
+    dispatcher.called.emit(partial(function, *args, **kwargs))
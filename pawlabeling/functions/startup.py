@@ -0,0 +1,60 @@
+"""
+Keeps track of how long starting the application takes, so we can keep an eye on the cold-start time.
+
+Running this module prints how long importing each of the heavy dependencies takes:
+python -m pawlabeling.functions.startup
+"""
+from __future__ import print_function
+import subprocess
+import sys
+import time
+
+# This module is imported first, so this is as close to the start of the application as we get
+start_time = time.time()
+marks = []
+
+heavy_modules = ["numpy", "tables", "PySide.QtGui", "pubsub.pub", "scipy.ndimage", "cv2", "pandas",
+                 "matplotlib", "matplotlib.backends.backend_qt4agg",
+                 "pawlabeling.settings.settings", "pawlabeling.models.model", "pawlabeling.widgets.mainwindow"]
+
+
+def mark(label):
+    """
+    Remember how long it took to get to this point
+    """
+    marks.append((label, time.time() - start_time))
+
+
+def report():
+    lines = ["Startup times:"]
+    for label, seconds in marks:
+        lines.append("{:<40} {:>8.3f}s".format(label, seconds))
+    return "\n".join(lines)
+
+
+def time_import(module_name):
+    """
+    Import the module in a fresh interpreter, so nothing has been imported yet.
+    Returns the time in seconds or None if it couldn't be imported
+    """
+    code = "import time; start = time.time(); import {}; print(time.time() - start)".format(module_name)
+    process = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, _ = process.communicate()
+    if process.returncode != 0:
+        return None
+    return float(output.strip().splitlines()[-1])
+
+
+def import_report(module_names=heavy_modules):
+    lines = ["{:<40} {:>10}".format("module", "import")]
+    for module_name in module_names:
+        seconds = time_import(module_name)
+        if seconds is None:
+            lines.append("{:<40} {:>10}".format(module_name, "failed"))
+        else:
+            lines.append("{:<40} {:>9.3f}s".format(module_name, seconds))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(import_report(sys.argv[1:] or heavy_modules))
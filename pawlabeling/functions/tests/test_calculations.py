@@ -206,4 +206,108 @@ class TestInterpolateTimeSeries(TestCase):
     def test_interpolate_time_series_with_2d_array(self):
         data = np.zeros((3, 3))
         with self.assertRaises(Exception):
-            calculations.interpolate_time_series(data)
\ No newline at end of file
+            calculations.interpolate_time_series(data)
+
+    def test_interpolate_time_series_batch(self):
+        series = [np.sin(np.linspace(0, np.pi, length)) for length in [5, 12, 30]] + [np.array([3.])]
+        new_data = calculations.interpolate_time_series_batch(series, length=101)
+        self.assertEqual(new_data.shape, (4, 101))
+        for data, row in zip(series[:-1], new_data):
+            np.testing.assert_allclose(row, calculations.interpolate_time_series(data, length=101))
+        # A single sample can only be repeated
+        np.testing.assert_array_equal(new_data[-1], 3.)
+
+    def test_interpolate_contacts_batch(self):
+        lengths = [4, 9, 6]
+        data = np.zeros((3, 2, 3, 9))
+        for index, length in enumerate(lengths):
+            data[index, :, :, :length] = np.random.rand(2, 3, length)
+        new_data = calculations.interpolate_contacts_batch(data, lengths, length=21)
+        self.assertEqual(new_data.shape, (3, 2, 3, 21))
+        for index, length in enumerate(lengths):
+            np.testing.assert_allclose(new_data[index, 1, 2],
+                                       calculations.interpolate_time_series(data[index, 1, 2, :length], length=21))
+
+
+class TestTemporalSpatial(TestCase):
+    def setUp(self):
+        # Walking along x, the left paws at y=1, the right paws at y=11, a new contact every 5 frames
+        self.labels = np.array([0, 1, 2, 3, 0, 1, 2, 3])
+        self.bounding_boxes = np.array([(10. * index, 10. * index + 4, 10. * (label >= 2), 10. * (label >= 2) + 2)
+                                        for index, label in enumerate(self.labels)])
+        self.min_z = 5. * np.arange(8)
+        self.orientation = np.zeros(8, dtype=bool)
+
+    def temporal_spatial(self, **kwargs):
+        return calculations.temporal_spatial(self.labels, self.bounding_boxes, self.min_z, self.orientation,
+                                             sensor_width=1., sensor_height=1., frequency=100, **kwargs)
+
+    def test_relations(self):
+        results = self.temporal_spatial()
+        self.assertEqual(list(results["stride_index"]), [4, 5, 6, 7, -1, -1, -1, -1])
+        self.assertEqual(list(results["step_index"][:3]), [2, 3, 4])
+        self.assertEqual(list(results["ipsi_index"][:2]), [1, 4])
+        self.assertEqual(list(results["diag_index"][:2]), [3, 2])
+        self.assertEqual(results["stride_width"][0], 40.)
+        self.assertEqual(results["stride_length"][0], 0.)
+        self.assertEqual(results["stride_duration"][0], 200.)
+        self.assertEqual(results["step_length"][0], 10.)
+        self.assertTrue(np.isnan(results["stride_width"][4]))
+
+    def test_repeated_label(self):
+        # Once a label shows up for the second time, we stop looking
+        self.labels = np.array([0, 1, 1, 0, 2, 3, 2, 3])
+        results = self.temporal_spatial()
+        self.assertEqual(results["stride_index"][0], -1)
+        self.assertEqual(results["ipsi_index"][0], 1)
+
+    def test_groups(self):
+        results = self.temporal_spatial(groups=[0, 0, 0, 0, 1, 1, 1, 1])
+        self.assertEqual(list(results["stride_index"]), [-1] * 8)
+        self.assertEqual(results["step_index"][2], -1)
+        self.assertEqual(results["step_index"][4], 6)
+
+    def test_gait_velocity(self):
+        self.assertAlmostEqual(calculations.gait_velocity(self.temporal_spatial()), 0.2)
+        self.orientation[:] = True
+        self.assertAlmostEqual(calculations.gait_velocity(self.temporal_spatial()), -0.2)
+        groups = [0, 0, 0, 0, 1, 1, 1, 1]
+        velocity = calculations.gait_velocity(self.temporal_spatial(groups=groups), groups=groups)
+        np.testing.assert_allclose(velocity, -0.2)
+
+
+class TestGaitPattern(TestCase):
+    def test_find_gait_pattern(self):
+        labels = [0, 3, 2, 1, 0, 3, 2, 1, 0]
+        self.assertEqual(calculations.find_gait_pattern(labels), "0-3-2-1")
+        # Starting halfway a stride doesn't matter
+        self.assertEqual(calculations.find_gait_pattern(labels[2:]), "0-3-2-1")
+
+    def test_no_pattern(self):
+        self.assertEqual(calculations.find_gait_pattern([]), "")
+        self.assertEqual(calculations.find_gait_pattern([0, 0, 1, 1, -1, 2]), "")
+
+    def test_find_gait_patterns(self):
+        matches = calculations.find_gait_patterns([-1, 2, 3, 0, 1])
+        self.assertEqual(matches, [(1, 4, "2-3-0-1"), (1, 5, "2-3-0-1"), (2, 5, "2-3-0-1")])
+
+    def test_segment_gait_patterns(self):
+        # Two strides of one pattern, an unlabeled contact and two strides of another
+        labels = [0, 3, 2, 1, 0, 3, 2, 1, -1, 2, 3, 0, 1, 2, 3, 0, 1]
+        patterns = calculations.assign_gait_patterns(labels)
+        self.assertEqual(patterns[8], "")
+        self.assertEqual(set(patterns[9:]), {"2-3-0-1"})
+        segments = calculations.segment_gait_patterns(labels)
+        self.assertEqual(segments, [(0, 8, "0-3-2-1"), (8, 9, ""), (9, 17, "2-3-0-1")])
+
+
+class TestAsymmetryIndex(TestCase):
+    def test_asymmetry_index(self):
+        self.assertAlmostEqual(calculations.asymmetry_index(110., 90.), 20.)
+        self.assertAlmostEqual(calculations.asymmetry_index(90., 110., absolute=True), 20.)
+
+    def test_asymmetry_index_with_arrays(self):
+        left = np.array([110., 90., 100.])
+        right = np.array([90., 110., 100.])
+        np.testing.assert_allclose(calculations.asymmetry_index(left, right), [20., -20., 0.])
+        np.testing.assert_allclose(calculations.asymmetry_index(left, right, absolute=True), [20., 20., 0.])
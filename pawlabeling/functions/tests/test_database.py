@@ -0,0 +1,120 @@
+from unittest import TestCase
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import traceback
+from pawlabeling.models import table, access, database
+
+
+class TestDatabaseWorker(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.database_file = os.path.join(self.folder, "data.h5")
+        self.worker = database.DatabaseWorker(open_database=lambda: table.load_table(self.database_file),
+                                              close_database=lambda table_handle: table_handle.close())
+        self.worker.start()
+
+    def tearDown(self):
+        self.worker.stop()
+        shutil.rmtree(self.folder)
+
+    def create_subject(self, table_handle, subject_id):
+        subjects_table = table.SubjectsTable(table=table_handle)
+        subjects_table.create_subject(subject_id=subject_id, first_name="Berdi", last_name="Flipse",
+                                      birthday="2010-01-01")
+        return threading.current_thread().name
+
+    def count_subjects(self, table_handle):
+        return len(table.SubjectsTable(table=table_handle).get_subjects())
+
+    def test_requests_run_in_order_on_worker(self):
+        futures = [self.worker.submit(self.create_subject, "subject_{}".format(index)) for index in range(3)]
+        count = self.worker.submit(self.count_subjects)
+        self.assertEqual(count.result(timeout=10), 3)
+        self.assertEqual(set(future.result() for future in futures), set(["DatabaseWorker"]))
+
+    def test_exception(self):
+        future = self.worker.submit(self.create_subject, "subject_1")
+        duplicate = self.worker.submit(self.create_subject, "subject_1")
+        future.result(timeout=10)
+        self.assertRaises(AssertionError, duplicate.result, 10)
+
+    def test_exception_traceback(self):
+        def fail(table_handle):
+            raise ValueError("Failed on the worker")
+
+        future = self.worker.submit(fail)
+        try:
+            future.result(timeout=10)
+        except ValueError:
+            # The traceback still goes back to where it was raised on the worker
+            names = [frame[2] for frame in traceback.extract_tb(sys.exc_info()[2])]
+            self.assertEqual(names[-1], "fail")
+        else:
+            self.fail("The exception of the worker wasn't raised")
+
+    def test_tables_hold_the_lock(self):
+        table_handle = table.load_table(os.path.join(self.folder, "other.h5"))
+        results = []
+        reader = threading.Thread(target=lambda: results.append(self.count_subjects(table_handle)))
+        with database.hdf5_lock:
+            reader.start()
+            reader.join(0.2)
+            # It has to wait until we let go of the lock
+            self.assertEqual(results, [])
+        reader.join(10)
+        self.assertEqual(results, [0])
+        table_handle.close()
+
+    def test_cancel(self):
+        blocker = threading.Event()
+        first = self.worker.submit(lambda table_handle: blocker.wait(10))
+        second = self.worker.submit(self.count_subjects)
+        self.assertTrue(second.cancel())
+        blocker.set()
+        self.assertTrue(first.result(timeout=10))
+        self.assertRaises(database.CancelledError, second.result, 10)
+        self.assertFalse(first.cancel())
+
+    def test_callback(self):
+        results = []
+        future = self.worker.submit(self.count_subjects)
+        future.add_done_callback(lambda future: results.append(future.result()))
+        future.result(timeout=10)
+        future.add_done_callback(lambda future: results.append(future.result()))
+        self.assertEqual(results, [0, 0])
+
+
+class TestSnapshotReader(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.database_file = os.path.join(self.folder, "data.h5")
+        self.table = table.load_table(self.database_file)
+        table.SubjectsTable(table=self.table).create_subject(subject_id="subject_1", first_name="Berdi",
+                                                             last_name="Flipse", birthday="2010-01-01")
+
+    def tearDown(self):
+        self.table.close()
+        shutil.rmtree(self.folder)
+
+    def test_reads_newest_snapshot(self):
+        count_subjects = lambda table_handle: len(table.SubjectsTable(table=table_handle).get_subjects())
+        reader = database.SnapshotReader(self.database_file)
+        reader.start()
+        # There's no snapshot yet
+        self.assertRaises(IOError, reader.submit(count_subjects).result, 10)
+        reader.stop()
+
+        access.publish_snapshot(self.table)
+        reader = database.SnapshotReader(self.database_file)
+        reader.start()
+        try:
+            self.assertEqual(reader.submit(count_subjects).result(timeout=10), 1)
+            table.SubjectsTable(table=self.table).create_subject(subject_id="subject_2", first_name="Ivo",
+                                                                 last_name="Flipse", birthday="1985-01-01")
+            access.publish_snapshot(self.table)
+            self.assertEqual(reader.submit(count_subjects).result(timeout=10), 2)
+        finally:
+            reader.stop()
@@ -0,0 +1,38 @@
+from unittest import TestCase
+from PySide import QtGui
+from pubsub import pub
+from pawlabeling.models import model, measurementmodel
+from pawlabeling.widgets import measurementtree
+
+
+class TestMeasurementTree(TestCase):
+    def setUp(self):
+        self.app = QtGui.QApplication.instance() or QtGui.QApplication([])
+        self.model = model.model
+        measurement = measurementmodel.Measurement(subject_id="subject_1", session_id="session_1")
+        measurement.measurement_id = "measurement_1"
+        measurement.measurement_name = "measurement_1"
+        measurement.processed = False
+        self.model.measurements = {"measurement_1": measurement}
+        self.model.contacts.clear()
+
+    def tearDown(self):
+        self.model.measurements = {}
+
+    def test_analysis_tree_after_loading(self):
+        processing_widget = QtGui.QWidget()
+        processing_tree = measurementtree.MeasurementTree()
+        QtGui.QVBoxLayout(processing_widget).addWidget(processing_tree)
+        pub.sendMessage("update_measurement_status")
+
+        # The analysis tab only gets created after the session has been loaded
+        analysis_widget = QtGui.QWidget()
+        analysis_tree = measurementtree.MeasurementTree()
+        QtGui.QVBoxLayout(analysis_widget).addWidget(analysis_tree)
+        self.assertIsNot(analysis_tree, processing_tree)
+        # The processing tab still has its filled tree
+        self.assertIs(processing_tree.parent(), processing_widget)
+        self.assertEqual(processing_tree.measurement_tree.topLevelItemCount(), 1)
+
+        pub.sendMessage("update_measurement_status")
+        self.assertEqual(analysis_tree.measurement_tree.topLevelItemCount(), 1)
@@ -1,10 +1,13 @@
 from unittest import TestCase
 import os
+import shutil
+import tempfile
 import numpy as np
+import pandas as pd
 import logging
 from pawlabeling.settings import settings
 from pawlabeling.functions import io, calculations
-from pawlabeling.models import contactmodel, measurementmodel, platemodel
+from pawlabeling.models import contactmodel, measurementmodel, platemodel, sessionmodel, table
 
 logger = logging.getLogger("logger")
 logger.disabled = True
@@ -81,4 +84,367 @@ class TestContactValidation(TestCase):
             if contact.unfinished_contact:
                 unfinished_count += 1
 
-        self.assertEqual(unfinished_count, 3)
\ No newline at end of file
+        self.assertEqual(unfinished_count, 3)
+
+
+class TestContactDataCache(TestCase):
+    def test_least_recently_used_dropped(self):
+        cache = contactmodel.ContactDataCache(max_bytes=3 * 80)
+        for index in range(3):
+            cache.put(index, np.zeros(10))
+        # Using the first one, makes the second one the least recently used
+        cache.get(0)
+        cache.put(3, np.zeros(10))
+        self.assertIsNone(cache.get(1))
+        self.assertIsNotNone(cache.get(0))
+        self.assertEqual(cache.size, 3 * 80)
+
+    def test_too_large(self):
+        cache = contactmodel.ContactDataCache(max_bytes=80)
+        cache.put("data", np.zeros(20))
+        self.assertIsNone(cache.get("data"))
+        self.assertEqual(cache.size, 0)
+
+
+class TestLazyContact(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.table = table.load_table(os.path.join(self.folder, "data.h5"))
+        table.SubjectsTable(table=self.table).create_subject(subject_id="subject_1", first_name="Berdi",
+                                                             last_name="Flipse", birthday="2010-01-01")
+        table.SessionsTable(table=self.table, subject_id="subject_1").create_session(session_id="session_1",
+                                                                                     subject_id="subject_1",
+                                                                                     session_name="Session 1")
+        table.MeasurementsTable(table=self.table, subject_id="subject_1",
+                                session_id="session_1").create_measurement(measurement_id="measurement_1",
+                                                                           session_id="session_1",
+                                                                           subject_id="subject_1",
+                                                                           measurement_name="Measurement 1")
+        self.contact_data_table = table.ContactDataTable(table=self.table, subject_id="subject_1",
+                                                         session_id="session_1", measurement_id="measurement_1")
+        self.data = np.random.rand(5, 6, 7)
+        self.contact_data_table.store_contact_data(contact_id="contact_1", arrays={"data": self.data})
+
+        self.contact = contactmodel.Contact(subject_id="subject_1", session_id="session_1",
+                                            measurement_id="measurement_1")
+        self.contact.contact_id = "contact_1"
+        self.contact.contact_data_table = self.contact_data_table
+        contactmodel.contact_data_cache.discard_measurement("subject_1", "session_1", "measurement_1")
+
+    def tearDown(self):
+        contactmodel.contact_data_cache.discard_measurement("subject_1", "session_1", "measurement_1")
+        self.table.close()
+        shutil.rmtree(self.folder)
+
+    def test_data_loaded_on_access(self):
+        self.assertFalse("data" in self.contact.__dict__)
+        np.testing.assert_array_equal(self.contact.data, self.data)
+        # It's kept in the cache, not on the contact
+        self.assertFalse("data" in self.contact.__dict__)
+        key = ("subject_1", "session_1", "measurement_1", "contact_1", "data")
+        self.assertIsNotNone(contactmodel.contact_data_cache.get(key))
+
+    def test_missing_array(self):
+        self.assertIsNone(self.contact.cop_x)
+        with self.assertRaises(AttributeError):
+            self.contact.not_an_array
+
+    def test_load_data(self):
+        self.contact.load_data()
+        self.assertIsNone(self.contact.contact_data_table)
+        np.testing.assert_array_equal(self.contact.__dict__["data"], self.data)
+
+
+class TestAverageData(TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.contacts = {"measurement_1": [], "measurement_2": []}
+        for index in range(12):
+            contact = contactmodel.MockContact("contact_{}".format(index), random.rand(5 + index % 3, 4, 6 + index))
+            contact.contact_label = index % 4
+            contact.invalid = False
+            contact.filtered = index % 5 == 0
+            self.contacts["measurement_{}".format(index % 2 + 1)].append(contact)
+        self.shape = (11, 8, 17)
+
+    def full_average(self, filtering):
+        average_data = {}
+        for contact_label in range(4):
+            contacts = [contact for contact_list in self.contacts.values() for contact in contact_list
+                        if contact.contact_label == contact_label and
+                        not (filtering and (contact.filtered or contact.invalid))]
+            if not contacts:
+                continue
+            data = np.zeros(self.shape)
+            for contact in contacts:
+                x, y, z = contact.data.shape
+                offset_x, offset_y = int((self.shape[0] - x) / 2), int((self.shape[1] - y) / 2)
+                data[offset_x:offset_x + x, offset_y:offset_y + y, :z] += contact.data
+            average_data[contact_label] = data / len(contacts)
+        return average_data
+
+    def assert_average(self, average, filtering):
+        expected = self.full_average(filtering)
+        self.assertEqual(sorted(average.average_data.keys()), sorted(expected.keys()))
+        for contact_label, data in expected.items():
+            np.testing.assert_allclose(average.average_data[contact_label], data)
+
+    def test_relabel(self):
+        average = sessionmodel.AverageData()
+        average.update(contacts=self.contacts, shape=self.shape, filtering=False)
+        self.assert_average(average, filtering=False)
+
+        contact = self.contacts["measurement_1"][0]
+        contact.contact_label = 1
+        changed = average.update(contacts=self.contacts, shape=self.shape, filtering=False)
+        self.assertEqual(changed, set([0, 1]))
+        self.assert_average(average, filtering=False)
+
+        # Nothing changed, so nothing has to be added again
+        self.assertEqual(average.update(contacts=self.contacts, shape=self.shape, filtering=False), set())
+
+    def test_remove_label(self):
+        average = sessionmodel.AverageData()
+        average.update(contacts=self.contacts, shape=self.shape, filtering=False)
+        for contact_list in self.contacts.values():
+            for contact in contact_list:
+                if contact.contact_label == 3:
+                    contact.contact_label = -2
+        average.update(contacts=self.contacts, shape=self.shape, filtering=False)
+        self.assertNotIn(3, average.average_data)
+        self.assert_average(average, filtering=False)
+
+    def test_filtering(self):
+        average = sessionmodel.AverageData()
+        average.update(contacts=self.contacts, shape=self.shape, filtering=False)
+        self.contacts["measurement_2"][1].invalid = True
+        average.update(contacts=self.contacts, shape=self.shape, filtering=True)
+        self.assert_average(average, filtering=True)
+        average.update(contacts=self.contacts, shape=self.shape, filtering=False)
+        self.assert_average(average, filtering=False)
+
+    def test_removed_contact(self):
+        average = sessionmodel.AverageData()
+        average.update(contacts=self.contacts, shape=self.shape, filtering=False)
+        self.contacts["measurement_1"].pop()
+        average.update(contacts=self.contacts, shape=self.shape, filtering=False)
+        self.assert_average(average, filtering=False)
+
+
+class TestRunningStatistics(TestCase):
+    def test_mean_and_variance(self):
+        random = np.random.RandomState(1)
+        shape = (9, 8, 14)
+        statistics = sessionmodel.RunningStatistics(shape)
+        padded = []
+        for index in range(6):
+            data = random.rand(5 + index % 2, 4, 8 + index) * 50
+            statistics.add(data)
+            array = np.zeros(shape)
+            offset_x, offset_y = int((shape[0] - data.shape[0]) / 2), int((shape[1] - data.shape[1]) / 2)
+            array[offset_x:offset_x + data.shape[0], offset_y:offset_y + data.shape[1], :data.shape[2]] = data
+            padded.append(array)
+
+        self.assertEqual(statistics.count, 6)
+        self.assertEqual(statistics.mean.dtype, np.float32)
+        np.testing.assert_allclose(statistics.mean, np.mean(padded, axis=0), rtol=1e-5, atol=1e-4)
+        np.testing.assert_allclose(statistics.variance(), np.var(padded, axis=0), rtol=1e-4, atol=1e-3)
+
+    def test_contacts_key(self):
+        contact = contactmodel.MockContact("contact_1", np.zeros((2, 2, 2)))
+        contacts = {"measurement_1": [contact]}
+        key = sessionmodel.contacts_key(contacts, shape=(6, 6, 2))
+        self.assertEqual(key, sessionmodel.contacts_key(contacts, shape=(6, 6, 2)))
+        self.assertNotEqual(key, sessionmodel.contacts_key(contacts, shape=(6, 6, 3)))
+        contact.contact_label = 1
+        self.assertNotEqual(key, sessionmodel.contacts_key(contacts, shape=(6, 6, 2)))
+
+    def test_contacts_key_results(self):
+        contact = contactmodel.MockContact("contact_1", np.zeros((2, 2, 2)))
+        contact.length = 2
+        contact.step_duration = 0.5
+        contacts = {"measurement_1": [contact]}
+        key = sessionmodel.contacts_key(contacts)
+        # Recalculating the results after tracking the contacts again keeps their id and label
+        contact.step_duration = 0.6
+        self.assertNotEqual(key, sessionmodel.contacts_key(contacts))
+        contact.step_duration = 0.5
+        contact.length = 3
+        self.assertNotEqual(key, sessionmodel.contacts_key(contacts))
+        contact.length = 2
+        self.assertEqual(key, sessionmodel.contacts_key(contacts))
+
+
+class TestSessionSummary(TestCase):
+    def setUp(self):
+        self.contacts = {}
+        for measurement in range(2):
+            contact_list = []
+            for index, contact_label in enumerate([0, 1, 2, 3, 0, 2]):
+                contact = contactmodel.MockContact("contact_{}".format(index), np.ones((2, 3, 4 + index)))
+                contact.width, contact.height, contact.length = contact.data.shape
+                contact.contact_label = contact_label
+                for column in sessionmodel.SUMMARY_COLUMNS:
+                    setattr(contact, column, 10. + contact_label + index + measurement)
+                contact.pressure_over_time = np.sin(np.linspace(0, np.pi, 20 + index)) * (contact_label + 1)
+                contact.force_over_time = contact.pressure_over_time * 2
+                contact.surface_over_time = np.ones(20 + index)
+                contact.cop_x = np.linspace(1, 3, 20 + index)
+                contact.cop_y = np.linspace(2, 4, 20 + index)
+                contact_list.append(contact)
+            self.contacts["measurement_{}".format(measurement)] = contact_list
+        # The last contact of the first measurement gets filtered
+        self.contacts["measurement_0"][-1].filtered = True
+        self.summary = sessionmodel.MockSessions("subject_1").calculate_summary(self.contacts)
+
+    def test_results(self):
+        values = [10. + 0 + index + measurement for measurement in range(2) for index in [0, 4]]
+        mean, std = self.summary["all"]["results"][0]["peak_force"]
+        self.assertAlmostEqual(mean, np.mean(values))
+        self.assertAlmostEqual(std, np.std(values))
+        # Without the filtered contact, label 2 only has three contacts left
+        values = [10. + 2 + index + measurement for measurement, index in [(0, 2), (1, 2), (1, 5)]]
+        mean, std = self.summary["filtered"]["results"][2]["peak_force"]
+        self.assertAlmostEqual(mean, np.mean(values))
+
+    def test_asymmetry(self):
+        asi = []
+        for measurement in range(2):
+            left = np.mean([10. + 0 + index + measurement for index in [0, 4]])
+            right = np.mean([10. + 2 + index + measurement for index in [2, 5]])
+            asi.append(calculations.asymmetry_index(left, right))
+        mean, std = self.summary["all"]["asymmetry"]["front"]["peak_force"]
+        self.assertAlmostEqual(mean, np.mean(asi))
+        self.assertAlmostEqual(std, np.std(asi))
+
+    def test_asymmetry_report(self):
+        data_frame = sessionmodel.MockSessions("subject_1").create_dataframe(self.contacts)
+        # The same contacts as two sessions, the second one without the right front contacts
+        data_frame["session_id"] = "session_1"
+        other_session = data_frame[data_frame["contact_label"] != 2].copy()
+        other_session["session_id"] = "session_2"
+        data_frame = pd.concat([data_frame, other_session])
+        report = sessionmodel.asymmetry_report(data_frame, by=["session_id", "measurement_id"])
+        self.assertEqual(len(report), 4)
+        summary = sessionmodel.asymmetry_summary(report, by="session_id")
+        mean = summary[("front", "peak_force", "mean")]
+        self.assertAlmostEqual(mean["session_1"], self.summary["all"]["asymmetry"]["front"]["peak_force"][0])
+        self.assertTrue(np.isnan(mean["session_2"]))
+        self.assertFalse(np.isnan(summary[("hind", "peak_force", "mean")]["session_2"]))
+
+    def test_curves(self):
+        curves = self.summary["all"]["curves"][1]
+        self.assertEqual(curves["pressure"].shape, (2, sessionmodel.INTERPOLATE_LENGTH))
+        self.assertEqual(list(curves["length"]), [23, 23])
+        np.testing.assert_allclose(curves["mean_force"], curves["mean_pressure"] * 2)
+        self.assertEqual(self.summary["all"]["max"]["duration"], 27)
+        self.assertAlmostEqual(self.summary["all"]["max"]["pressure"], 4, places=1)
+        np.testing.assert_allclose(curves["cop_x"][0], np.linspace(1, 3, sessionmodel.INTERPOLATE_LENGTH))
+
+    def test_normalized_average(self):
+        average = self.summary["all"]["average"]
+        self.assertEqual(sorted(average.keys()), [0, 1, 2, 3])
+        # Padded just like the average contacts, but every contact lasts the whole average
+        self.assertEqual(average[0].shape, (6, 7, sessionmodel.INTERPOLATE_LENGTH))
+        np.testing.assert_allclose(average[0][2:4, 2:5], 1.)
+        self.assertEqual(np.sum(average[0][:2]), 0)
+
+    def test_normalized_average_chunks(self):
+        sessions = sessionmodel.MockSessions("subject_1")
+        shape = sessions.calculate_shape(self.contacts)
+        chunk_size = sessionmodel.INTERPOLATE_CHUNK_SIZE
+        try:
+            # Label 0 has four contacts, so these get resampled one at a time
+            sessionmodel.INTERPOLATE_CHUNK_SIZE = 1
+            chunked = sessions.calculate_normalized_average(self.contacts, shape, filtering=False)
+        finally:
+            sessionmodel.INTERPOLATE_CHUNK_SIZE = chunk_size
+        average = self.summary["all"]["average"]
+        for contact_label in average:
+            self.assertEqual(chunked[contact_label].dtype, np.float32)
+            np.testing.assert_allclose(chunked[contact_label], average[contact_label], rtol=1e-5)
+
+    def test_relabel(self):
+        curves = sessionmodel.NormalizedCurves()
+        curves.update(self.contacts)
+        contact = self.contacts["measurement_1"][1]
+        row = curves.rows[id(contact)][1]["pressure"]
+        contact.contact_label = 3
+        curves.update(self.contacts)
+        # The contact didn't get resampled, its row simply moved to the other label
+        self.assertIs(curves.rows[id(contact)][1]["pressure"], row)
+        matrices = curves.get_matrices(self.contacts, filtering=False)
+        self.assertEqual(len(matrices[1]["pressure"]), 1)
+        self.assertEqual(len(matrices[3]["pressure"]), 3)
+
+
+class TestOutlierFilter(TestCase):
+    def setUp(self):
+        self.contacts = {"measurement_1": []}
+        peaks = [10., 11., 9., 10.5, 9.5, 10., 30.]
+        for index, peak in enumerate(peaks):
+            contact = contactmodel.MockContact("contact_{}".format(index), np.ones((2, 2, 5)))
+            contact.contact_label = 0
+            contact.length = 20 + index % 2
+            contact.peak_pressure = peak
+            contact.peak_force = peak * 2
+            contact.peak_surface = 2.
+            self.contacts["measurement_1"].append(contact)
+        # An unlabeled contact shouldn't be judged at all
+        self.contacts["measurement_1"][0].contact_label = -1
+        self.session_model = sessionmodel.MockSessions("subject_1")
+
+    def filtered(self):
+        return [contact.filtered for contact in self.contacts["measurement_1"]]
+
+    def test_rules(self):
+        for rule in sessionmodel.OUTLIER_RULES:
+            self.session_model.calculate_results(self.contacts, rule=rule)
+            self.assertEqual(self.filtered(), [False] * 6 + [True], rule)
+
+    def test_standard_deviation_bounds(self):
+        values = np.array([[1., 10.], [2., 20.], [3., 30.]])
+        lower_bound, upper_bound = sessionmodel.standard_deviation_bounds(values)
+        np.testing.assert_allclose(lower_bound, np.mean(values, axis=0) - 1.96 * np.std(values, axis=0))
+        np.testing.assert_allclose(upper_bound, np.mean(values, axis=0) + 1.96 * np.std(values, axis=0))
+
+    def test_relabel(self):
+        outliers = sessionmodel.OutlierFilter()
+        self.session_model.calculate_results(self.contacts, outliers=outliers)
+        contact = self.contacts["measurement_1"][-1]
+        row = outliers.rows[id(contact)][1]
+        # On its own, the outlier can't be compared to anything
+        contact.contact_label = 1
+        self.session_model.calculate_results(self.contacts, outliers=outliers)
+        self.assertIs(outliers.rows[id(contact)][1], row)
+        self.assertEqual(self.filtered(), [False] * 7)
+
+
+class TestMultiContactResults(TestCase):
+    def test_calculate_multi_contact_results(self):
+        contacts = []
+        for index, contact_label in enumerate([0, 1, 2, 3, 0, 1]):
+            contact = contactmodel.MockContact("contact_{}".format(index), np.ones((2, 2, 5)))
+            contact.contact_label = contact_label
+            contact.min_x, contact.max_x = 10 * index, 10 * index + 4
+            contact.min_y, contact.max_y = 10 * (contact_label >= 2), 10 * (contact_label >= 2) + 2
+            contact.min_z = 5 * index
+            contact.stance_duration = 50.
+            contacts.append(contact)
+        plate = platemodel.Plate()
+        plate.sensor_width = 1.
+        plate.sensor_height = 1.
+        measurement = measurementmodel.MockMeasurement(measurement_id="measurement_1",
+                                                       data=np.zeros((40, 20, 40)),
+                                                       frequency=100)
+        contact_model = contactmodel.MockContacts("subject_1", "session_1", "measurement_1")
+        contact_model.calculate_multi_contact_results(contacts, plate, measurement)
+
+        self.assertEqual(contacts[0].stride_width, 40.)
+        self.assertEqual(contacts[0].stride_duration, 200.)
+        self.assertEqual(contacts[0].swing_duration, 150.)
+        self.assertEqual(contacts[0].stance_percentage, 25.)
+        self.assertEqual(contacts[1].diag_length, 10.)
+        # There's no next contact of the same paw
+        self.assertTrue(np.isnan(contacts[4].stride_width))
+        self.assertAlmostEqual(contacts[5].gait_velocity, 0.2)
@@ -0,0 +1,524 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import numpy as np
+import tables
+from pawlabeling.models import table, access
+
+
+class TableTestCase(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.database_file = os.path.join(self.folder, "data.h5")
+        self.table = table.load_table(self.database_file)
+
+        self.subjects_table = table.SubjectsTable(table=self.table)
+        self.subjects_table.create_subject(subject_id="subject_1", first_name="Berdi", last_name="Flipse",
+                                           birthday="2010-01-01")
+        self.sessions_table = table.SessionsTable(table=self.table, subject_id="subject_1")
+        self.sessions_table.create_session(session_id="session_1", subject_id="subject_1", session_name="Session 1")
+        self.measurements_table = table.MeasurementsTable(table=self.table, subject_id="subject_1",
+                                                          session_id="session_1")
+        self.measurements_table.create_measurement(measurement_id="measurement_1", session_id="session_1",
+                                                   subject_id="subject_1", measurement_name="Measurement 1")
+        self.contacts_table = table.ContactsTable(table=self.table, subject_id="subject_1", session_id="session_1",
+                                                  measurement_id="measurement_1")
+
+    def tearDown(self):
+        self.table.close()
+        shutil.rmtree(self.folder)
+
+    def create_contacts(self, number_of_contacts):
+        for index in range(number_of_contacts):
+            self.contacts_table.create_contact(contact_id="contact_{}".format(index), contact_label=-2)
+
+
+class TestIndexes(TableTestCase):
+    def test_columns_indexed(self):
+        self.assertTrue(self.subjects_table.subjects_table.cols.subject_id.is_indexed)
+        self.assertTrue(self.subjects_table.subjects_table.cols.last_name.is_indexed)
+        self.assertTrue(self.sessions_table.sessions_table.cols.session_name.is_indexed)
+        self.assertTrue(self.measurements_table.measurements_table.cols.measurement_name.is_indexed)
+        self.assertTrue(self.contacts_table.contacts_table.cols.contact_id.is_indexed)
+
+    def test_index_existing_tables(self):
+        contacts = self.contacts_table.contacts_table
+        contacts.cols.contact_id.remove_index()
+        self.assertFalse(contacts.cols.contact_id.is_indexed)
+        table.index_tables(self.table)
+        self.assertTrue(contacts.cols.contact_id.is_indexed)
+
+    def test_query_uses_index(self):
+        contacts = self.contacts_table.contacts_table
+        used = contacts.will_query_use_indexing("(contact_id == value)", condvars={"value": "contact_1"})
+        self.assertEqual(len(used), 1)
+
+
+class TestLookups(TableTestCase):
+    def test_check_availability(self):
+        self.create_contacts(3)
+        with self.assertRaises(AssertionError):
+            self.contacts_table.check_availability(self.contacts_table.contacts_table, "contact_id",
+                                                   {"contact_id": "contact_1"})
+        # This one is still available, so it shouldn't raise
+        self.contacts_table.check_availability(self.contacts_table.contacts_table, "contact_id",
+                                               {"contact_id": "contact_3"})
+
+    def test_update_contact(self):
+        self.create_contacts(5)
+        updated = self.contacts_table.update_contact(contact_id="contact_3", contact_label=2)
+        self.assertTrue(updated)
+        self.assertEqual(self.contacts_table.contacts_table.cols.contact_label[3], 2)
+        # The other contacts shouldn't have changed
+        self.assertEqual(self.contacts_table.contacts_table.cols.contact_label[2], -2)
+
+    def test_update_missing_contact(self):
+        self.create_contacts(2)
+        updated = self.contacts_table.update_contact(contact_id="contact_10", contact_label=2)
+        self.assertFalse(updated)
+
+    def test_update_measurement(self):
+        self.measurements_table.update_measurement(item_id="measurement_1", processed=True)
+        self.assertTrue(self.measurements_table.measurements_table.cols.processed[0])
+
+    def test_remove_row(self):
+        self.create_contacts(3)
+        self.contacts_table.remove_row(table=self.contacts_table.contacts_table,
+                                       name_id="contact_id", item_id="contact_1")
+        self.assertEqual(self.contacts_table.contacts_table.nrows, 2)
+        self.assertEqual(len(self.contacts_table.find_rows(self.contacts_table.contacts_table,
+                                                           "contact_id", "contact_1")), 0)
+
+    def test_search_table(self):
+        self.create_contacts(3)
+        self.assertTrue(self.contacts_table.get_contact(contact_id="contact_2"))
+        self.assertEqual(self.contacts_table.get_contact(contact_id="contact_4"), [])
+
+
+class TestIdCounters(TableTestCase):
+    def test_new_id_follows_counter(self):
+        self.create_contacts(3)
+        self.assertEqual(self.contacts_table.contacts_table.attrs.last_id, 3)
+        self.assertEqual(self.contacts_table.get_new_id(), "contact_4")
+
+    def test_ids_are_not_reused(self):
+        self.create_contacts(3)
+        self.contacts_table.remove_row(table=self.contacts_table.contacts_table,
+                                       name_id="contact_id", item_id="contact_2")
+        self.assertEqual(self.contacts_table.get_new_id(), "contact_4")
+
+    def test_backfill_counter(self):
+        self.measurements_table.create_measurement(measurement_id="measurement_7", session_id="session_1",
+                                                   subject_id="subject_1", measurement_name="Measurement 7")
+        measurements = self.measurements_table.measurements_table
+        # Databases from before the counter won't have the attribute
+        del measurements.attrs.last_id
+        table.backfill_id_counters(self.table)
+        self.assertEqual(measurements.attrs.last_id, 7)
+        self.assertEqual(self.measurements_table.get_new_id(), "measurement_8")
+        self.assertEqual(self.subjects_table.get_new_id(), "subject_2")
+
+
+class TestWriteBatch(TableTestCase):
+    def test_rows_written_on_exit(self):
+        with self.contacts_table.write_batch():
+            self.create_contacts(3)
+            self.assertEqual(self.contacts_table.contacts_table.nrows, 0)
+        self.assertEqual(self.contacts_table.contacts_table.nrows, 3)
+
+    def test_pending_rows(self):
+        with self.contacts_table.write_batch():
+            self.create_contacts(2)
+            with self.assertRaises(AssertionError):
+                self.contacts_table.check_availability(self.contacts_table.contacts_table, "contact_id",
+                                                       {"contact_id": "contact_1"})
+            self.assertTrue(self.contacts_table.update_contact(contact_id="contact_1", contact_label=3))
+            self.assertEqual(self.contacts_table.get_new_id(), "contact_3")
+        self.assertEqual(self.contacts_table.contacts_table.cols.contact_label[1], 3)
+
+    def test_nested_batch(self):
+        with self.contacts_table.write_batch():
+            with self.measurements_table.write_batch():
+                self.create_contacts(2)
+            # The inner batch is part of the outer one, so nothing has been written yet
+            self.assertEqual(self.contacts_table.contacts_table.nrows, 0)
+        self.assertEqual(self.contacts_table.contacts_table.nrows, 2)
+
+    def test_rollback(self):
+        self.create_contacts(2)
+        self.contacts_table.create_group(parent=self.contacts_table.measurement_group, item_id="old")
+        with self.assertRaises(ValueError):
+            with self.contacts_table.write_batch():
+                self.contacts_table.create_contact(contact_id="contact_5", contact_label=1)
+                self.contacts_table.create_group(parent=self.contacts_table.measurement_group, item_id="new")
+                self.contacts_table.remove_group(where=self.contacts_table.measurement_group, name="old")
+                raise ValueError
+        self.assertEqual(self.contacts_table.contacts_table.nrows, 2)
+        self.assertFalse("new" in self.contacts_table.measurement_group)
+        self.assertTrue("old" in self.contacts_table.measurement_group)
+        self.assertEqual(self.contacts_table.get_new_id(), "contact_3")
+        self.assertFalse(self.table.is_undo_enabled())
+
+
+class TestContactData(TableTestCase):
+    def setUp(self):
+        super(TestContactData, self).setUp()
+        self.contact_data_table = table.ContactDataTable(table=self.table, subject_id="subject_1",
+                                                         session_id="session_1", measurement_id="measurement_1")
+        self.arrays = []
+        for index in range(3):
+            self.arrays.append({"data": np.random.rand(index + 2, 3, 4),
+                                "max_of_max": np.random.rand(index + 2, 3),
+                                "force_over_time": np.random.rand(4)})
+
+    def store_contacts(self):
+        for index, arrays in enumerate(self.arrays):
+            contact_id = "contact_{}".format(index)
+            self.contacts_table.create_contact(contact_id=contact_id)
+            self.contact_data_table.store_contact_data(contact_id=contact_id, arrays=arrays)
+
+    def store_legacy_contacts(self):
+        # This is how every contact used to get its own group
+        for index, arrays in enumerate(self.arrays):
+            contact_id = "contact_{}".format(index)
+            self.contacts_table.create_contact(contact_id=contact_id)
+            group = self.contacts_table.create_group(parent=self.contacts_table.measurement_group, item_id=contact_id)
+            for item_id, data in arrays.items():
+                self.contacts_table.store_data(group=group, item_id=item_id, data=data)
+
+    def assert_contact_data(self, contact_data):
+        self.assertEqual(len(contact_data), 3)
+        for arrays, stored in zip(self.arrays, contact_data):
+            for item_id, data in arrays.items():
+                np.testing.assert_array_equal(stored[item_id], data)
+            self.assertIsNone(stored["cop_x"])
+
+    def test_store_contact_data(self):
+        self.store_contacts()
+        group = self.contact_data_table.get_contact_data_group()
+        # One array per item for the entire measurement
+        self.assertEqual(group.data.nrows, sum(arrays["data"].size for arrays in self.arrays))
+        self.assertFalse("contact_0" in self.contacts_table.measurement_group)
+        self.assert_contact_data(self.contact_data_table.get_contact_data())
+
+    def test_remove_contact(self):
+        self.store_contacts()
+        self.contact_data_table.remove_contact("contact_1")
+        contact_data = self.contact_data_table.get_contact_data()
+        self.assertIsNone(contact_data[1]["data"])
+        np.testing.assert_array_equal(contact_data[2]["data"], self.arrays[2]["data"])
+
+    def test_consolidate_contact_data(self):
+        self.store_legacy_contacts()
+        self.assert_contact_data(self.contact_data_table.get_contact_data())
+
+        self.assertEqual(table.consolidate_contact_data(self.table), 1)
+        self.assertFalse("contact_0" in self.contacts_table.measurement_group)
+        self.assert_contact_data(self.contact_data_table.get_contact_data())
+        # There's nothing left to convert
+        self.assertEqual(table.consolidate_contact_data(self.table), 0)
+
+    def test_compact_contact_data(self):
+        self.store_contacts()
+        self.assertEqual(table.compact_contact_data(self.table), 0)
+        self.contact_data_table.remove_contact("contact_1")
+        self.assertEqual(table.compact_contact_data(self.table), 1)
+
+        group = self.contact_data_table.get_contact_data_group()
+        self.assertEqual(group.data.nrows, self.arrays[0]["data"].size + self.arrays[2]["data"].size)
+        contact_data = self.contact_data_table.get_contact_data()
+        self.assertIsNone(contact_data[1]["data"])
+        for index in [0, 2]:
+            for item_id, data in self.arrays[index].items():
+                np.testing.assert_array_equal(contact_data[index][item_id], data)
+
+    def test_repack_reclaims_space(self):
+        measurement_group = self.measurements_table.session_group.measurement_1
+        self.measurements_table.store_data(group=measurement_group, item_id="measurement_1",
+                                           data=np.random.rand(64, 63, 100), kind="measurement")
+        self.store_contacts()
+        # Space that isn't at the end of the file stays in use
+        self.measurements_table.remove_group(where=measurement_group, name="measurement_1")
+        self.contact_data_table.remove_contact("contact_1")
+        self.table.close()
+
+        self.assertGreater(table.repack_database(self.database_file), 0)
+        self.table = table.load_table(self.database_file)
+        self.assertEqual(table.get_storage_profile(self.table), table.DEFAULT_STORAGE_PROFILE)
+        contact_data_table = table.ContactDataTable(table=self.table, subject_id="subject_1",
+                                                    session_id="session_1", measurement_id="measurement_1")
+        np.testing.assert_array_equal(contact_data_table.get_item("contact_2", "data"), self.arrays[2]["data"])
+        self.assertIsNone(contact_data_table.get_item("contact_1", "data"))
+
+
+class TestSchema(TableTestCase):
+    class OldContacts(tables.IsDescription):
+        contact_id = tables.StringCol(16)
+        contact_label = tables.Int16Col()
+
+    def create_old_contacts_table(self):
+        measurement_group = self.contacts_table.measurement_group
+        self.table.remove_node(where=measurement_group, name="contacts")
+        old_contacts = self.table.create_table(where=measurement_group, name="contacts",
+                                               description=TestSchema.OldContacts)
+        old_contacts.append([("contact_{}".format(index), index % 4) for index in range(5)])
+        old_contacts.attrs.last_id = 5
+        return old_contacts
+
+    def test_schema_stamped(self):
+        self.assertTrue(table.check_schema(self.table))
+        self.assertEqual(self.table.root._v_attrs.schema_version, table.SCHEMA_VERSION)
+        # Once it's up to date, there's nothing left to do
+        self.assertFalse(table.check_schema(self.table))
+
+    def test_current_schema_skips_walk(self):
+        table.check_schema(self.table)
+        self.create_old_contacts_table()
+        table.check_schema(self.table)
+        contacts = self.contacts_table.measurement_group.contacts
+        self.assertFalse("peak_force" in contacts.colnames)
+
+    def test_migrate_old_table(self):
+        self.create_old_contacts_table()
+        table.check_schema(self.table)
+        contacts = self.contacts_table.measurement_group.contacts
+        self.assertEqual(sorted(contacts.colnames), sorted(table.ContactsTable.Contacts.columns))
+        self.assertEqual(contacts.nrows, 5)
+        self.assertEqual(list(contacts.col("contact_label")), [0, 1, 2, 3, 0])
+        self.assertEqual(contacts.col("contact_id")[4], b"contact_4")
+        self.assertFalse(contacts.col("invalid").any())
+        # The attributes and indexes carry over
+        self.assertEqual(contacts.attrs.last_id, 5)
+        self.assertTrue(contacts.cols.contact_id.is_indexed)
+
+
+class TestChunkShape(TableTestCase):
+    def test_measurement_chunks(self):
+        # A single frame of a 2m plate is larger than CHUNK_BYTES, so every frame gets its own chunk
+        self.assertEqual(table.chunk_shape("measurement", (256, 63, 500), 8), (256, 63, 1))
+        self.assertEqual(table.chunk_shape("measurement", (64, 63, 500), 4), (64, 63, 4))
+        self.assertEqual(table.chunk_shape("measurement", (64, 63, 2), 1), (64, 63, 2))
+
+    def test_whole_array_chunks(self):
+        self.assertEqual(table.chunk_shape("contact", (20, 15, 30), 8), (20, 15, 30))
+        self.assertEqual(table.chunk_shape("series", (30,), 8), (30,))
+        self.assertIsNone(table.chunk_shape(None, (30,), 8))
+        self.assertIsNone(table.chunk_shape("series", (0,), 8))
+
+    def test_store_data(self):
+        data = np.zeros((64, 63, 100))
+        measurement_group = self.measurements_table.session_group.measurement_1
+        self.measurements_table.store_data(group=measurement_group, item_id="measurement_1",
+                                           data=data, kind="measurement")
+        array = measurement_group.measurement_1
+        self.assertEqual(array.chunkshape, (64, 63, 2))
+
+
+class TestStorageProfiles(TableTestCase):
+    def store_measurement(self, measurements_table):
+        data = np.arange(64 * 63 * 10, dtype=np.float64).reshape((64, 63, 10))
+        measurement_group = measurements_table.session_group.measurement_1
+        measurements_table.store_data(group=measurement_group, item_id="measurement_1",
+                                           data=data, kind="measurement")
+        return data
+
+    def test_default_profile(self):
+        self.assertEqual(table.get_storage_profile(self.table), table.DEFAULT_STORAGE_PROFILE)
+        self.assertEqual(self.contacts_table.filters.complevel, 5)
+        self.assertRaises(ValueError, table.storage_filters, "tiny")
+
+    def test_set_storage_profile(self):
+        table.set_storage_profile(self.table, "fast")
+        measurements_table = table.MeasurementsTable(table=self.table, subject_id="subject_1", session_id="session_1")
+        self.assertEqual(measurements_table.filters.complevel, 1)
+        self.store_measurement(measurements_table)
+        array = measurements_table.session_group.measurement_1.measurement_1
+        self.assertEqual(array.filters.complevel, 1)
+
+    def test_repack_database(self):
+        data = self.store_measurement(self.measurements_table)
+        self.create_contacts(3)
+        self.table.close()
+
+        table.repack_database(self.database_file, "archival")
+        self.table = table.load_table(self.database_file)
+        self.assertEqual(table.get_storage_profile(self.table), "archival")
+        measurement_group = self.table.root.subject_1.session_1.measurement_1
+        array = measurement_group.measurement_1
+        self.assertEqual(array.filters.complib, "zlib")
+        self.assertEqual(array.chunkshape, (64, 63, 2))
+        np.testing.assert_array_equal(array.read(), data)
+        # The rows, counters and indexes are still there
+        contacts = measurement_group.contacts
+        self.assertEqual(contacts.nrows, 3)
+        self.assertEqual(contacts.attrs.last_id, 3)
+        self.assertTrue(contacts.cols.contact_id.is_indexed)
+        self.assertEqual(os.listdir(self.folder), ["data.h5"])
+
+
+class TestContactsIndex(TableTestCase):
+    def setUp(self):
+        super(TestContactsIndex, self).setUp()
+        self.contacts_index = table.ContactsIndexTable(table=self.table)
+
+    def create_index_contacts(self, measurement_id, labels, peak_force=1.):
+        contacts = []
+        for index, contact_label in enumerate(labels):
+            contacts.append({"subject_id": "subject_1", "session_id": "session_1", "measurement_id": measurement_id,
+                             "contact_id": "contact_{}".format(index), "contact_label": contact_label,
+                             "peak_force": peak_force + index})
+        self.contacts_index.replace_contacts("subject_1", "session_1", measurement_id, contacts)
+
+    def test_replace_contacts(self):
+        self.create_index_contacts("measurement_1", [0, 1, 2, 3])
+        self.create_index_contacts("measurement_2", [0, 1])
+        self.create_index_contacts("measurement_1", [2, 3, 0], peak_force=10.)
+        self.assertEqual(self.contacts_index.contacts_index.nrows, 5)
+        data_frame = self.contacts_index.query(measurement_id="measurement_1")
+        self.assertEqual(list(data_frame["contact_label"]), [2, 3, 0])
+        self.assertEqual(list(data_frame["peak_force"]), [10., 11., 12.])
+
+    def test_query(self):
+        self.create_index_contacts("measurement_1", [0, 1, 2, 3])
+        self.create_index_contacts("measurement_2", [0, 0, 1])
+        data_frame = self.contacts_index.query(columns=["measurement_id", "peak_force"], contact_label=0)
+        self.assertEqual(list(data_frame.columns), ["measurement_id", "peak_force"])
+        self.assertEqual(list(data_frame["measurement_id"]), ["measurement_1", "measurement_2", "measurement_2"])
+        data_frame = self.contacts_index.query(contact_label=[2, 3], measurement_id=["measurement_1"])
+        self.assertEqual(list(data_frame["contact_id"]), ["contact_2", "contact_3"])
+        self.assertEqual(len(self.contacts_index.query()), 7)
+
+    def test_remove_contacts(self):
+        self.create_index_contacts("measurement_1", [0, 1, 2, 3])
+        self.contacts_index.remove_contacts("subject_1", "session_1", "measurement_1", contact_id="contact_2")
+        self.assertEqual(list(self.contacts_index.query()["contact_id"]), ["contact_0", "contact_1", "contact_3"])
+        self.contacts_index.remove_contacts("subject_1", "session_1", "measurement_1")
+        self.assertEqual(self.contacts_index.contacts_index.nrows, 0)
+
+    def test_rebuild_contacts_index(self):
+        for index in range(3):
+            self.contacts_table.create_contact(contact_id="contact_{}".format(index), contact_label=index,
+                                               subject_id="subject_1", session_id="session_1",
+                                               measurement_id="measurement_1")
+        self.assertEqual(table.rebuild_contacts_index(self.table), 3)
+        contacts_index = table.ContactsIndexTable(table=self.table)
+        self.assertEqual(list(contacts_index.query(contact_label=[1, 2])["contact_id"]), ["contact_1", "contact_2"])
+
+
+class TestSharding(TableTestCase):
+    def tearDown(self):
+        table.close_shards(self.table)
+        super(TestSharding, self).tearDown()
+
+    def test_shard_database(self):
+        self.contacts_table.create_contact(contact_id="contact_0", contact_label=1, subject_id="subject_1",
+                                           session_id="session_1", measurement_id="measurement_1")
+        new_id = self.contacts_table.get_new_id()
+        self.assertEqual(table.shard_database(self.table), 1)
+        self.assertTrue(table.is_sharded(self.table))
+        self.assertFalse("subject_1" in self.table.root)
+        self.assertTrue("subjects" in self.table.root)
+        self.assertEqual(len(table.shard_files(self.database_file)), 1)
+
+        # The tables find their way to the shard on their own
+        contacts_table = table.ContactsTable(table=self.table, subject_id="subject_1", session_id="session_1",
+                                             measurement_id="measurement_1")
+        self.assertIsNot(contacts_table.table, self.table)
+        self.assertEqual(contacts_table.get_contact(contact_id="contact_0")["contact_label"], 1)
+        self.assertEqual(contacts_table.get_new_id(), new_id)
+        self.assertEqual(list(table.query_contacts(self.table, contact_label=1)["contact_id"]), ["contact_0"])
+
+    def test_new_subject_gets_shard(self):
+        table.shard_database(self.table)
+        self.subjects_table.create_subject(subject_id="subject_2", first_name="Ivo", last_name="Flipse",
+                                           birthday="1985-01-01")
+        sessions_table = table.SessionsTable(table=self.table, subject_id="subject_2")
+        sessions_table.create_session(session_id="session_1", subject_id="subject_2", session_name="Session 1")
+        self.assertTrue("session_1" in table.get_shard(self.table, "subject_2").root.subject_2)
+        self.assertEqual(len(table.shard_files(self.database_file)), 2)
+
+        self.subjects_table.remove_subject_group("subject_2")
+        self.assertEqual(len(table.shard_files(self.database_file)), 1)
+
+
+class TestSessionStatistics(TableTestCase):
+    def test_store_statistics(self):
+        session_data_table = table.SessionDataTable(table=self.table, subject_id="subject_1", session_id="session_1")
+        self.assertIsNone(session_data_table.get_statistics("key"))
+        mean = np.random.rand(4, 5, 6).astype(np.float32)
+        variance = np.random.rand(4, 5, 6).astype(np.float32)
+        session_data_table.store_statistics("key", {0: (3, mean, variance), 2: (1, mean, variance)})
+
+        statistics = session_data_table.get_statistics("key")
+        self.assertEqual(sorted(statistics.keys()), [0, 2])
+        count, stored_mean, stored_variance = statistics[0]
+        self.assertEqual(count, 3)
+        np.testing.assert_array_equal(stored_mean, mean)
+        np.testing.assert_array_equal(stored_variance, variance)
+        # Statistics of other contacts don't count
+        self.assertIsNone(session_data_table.get_statistics("other key"))
+
+        # Storing them again replaces the old ones
+        session_data_table.store_statistics("other key", {1: (2, mean, variance)})
+        self.assertEqual(list(session_data_table.get_statistics("other key").keys()), [1])
+
+    def test_store_summary(self):
+        session_data_table = table.SessionDataTable(table=self.table, subject_id="subject_1", session_id="session_1")
+        curve = np.random.rand(3, 100)
+        summary = {"all": {"results": {0: {"peak_force": (1.5, 0.5)}},
+                           "curves": {2: {"pressure": curve, "length": np.array([10, 12, 11])}},
+                           "max": {"duration": 12, "pressure": 3.5}},
+                   "filtered": {"results": {}, "curves": {}}}
+        session_data_table.store_summary("key", summary)
+        self.assertIsNone(session_data_table.get_summary("other key"))
+
+        stored = session_data_table.get_summary("key")
+        self.assertEqual(stored["all"]["results"][0]["peak_force"], (1.5, 0.5))
+        self.assertEqual(stored["all"]["max"], {"duration": 12, "pressure": 3.5})
+        np.testing.assert_array_equal(stored["all"]["curves"][2]["pressure"], curve)
+        self.assertEqual(stored["filtered"], {"results": {}, "curves": {}})
+
+
+class TestSnapshots(TableTestCase):
+    def setUp(self):
+        super(TestSnapshots, self).setUp()
+        table.check_schema(self.table)
+        self.create_contacts(2)
+
+    def tearDown(self):
+        table.close_shards(self.table)
+        super(TestSnapshots, self).tearDown()
+
+    def test_read_snapshot(self):
+        self.assertRaises(IOError, access.ReadOnlyDatabase, self.database_file)
+        self.assertEqual(access.publish_snapshot(self.table), 1)
+        with access.ReadOnlyDatabase(self.database_file) as database:
+            self.assertEqual(database.table.mode, "r")
+            contacts_table = table.ContactsTable(table=database.table, subject_id="subject_1",
+                                                 session_id="session_1", measurement_id="measurement_1")
+            self.assertEqual(len(contacts_table.get_contacts()), 2)
+
+            # The reader keeps its snapshot until it refreshes
+            self.contacts_table.create_contact(contact_id="contact_2", contact_label=-2)
+            self.assertFalse(database.refresh())
+            access.publish_snapshot(self.table)
+            self.assertEqual(len(contacts_table.get_contacts()), 2)
+            self.assertTrue(database.refresh())
+            contacts_table = table.ContactsTable(table=database.table, subject_id="subject_1",
+                                                 session_id="session_1", measurement_id="measurement_1")
+            self.assertEqual(len(contacts_table.get_contacts()), 3)
+
+    def test_remove_old_snapshots(self):
+        for _ in range(4):
+            access.publish_snapshot(self.table, keep=2)
+        self.assertEqual(access.list_snapshots(self.database_file), [3, 4])
+
+    def test_sharded_snapshot(self):
+        table.shard_database(self.table)
+        access.publish_snapshot(self.table)
+        with access.ReadOnlyDatabase(self.database_file) as database:
+            contacts_table = table.ContactsTable(table=database.table, subject_id="subject_1",
+                                                 session_id="session_1", measurement_id="measurement_1")
+            self.assertEqual(contacts_table.table.mode, "r")
+            self.assertEqual(len(contacts_table.get_contacts()), 2)
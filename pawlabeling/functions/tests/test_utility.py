@@ -0,0 +1,29 @@
+from unittest import TestCase
+import numpy as np
+from pawlabeling.functions import utility
+
+
+class TestColorMap(TestCase):
+    def test_color_lut(self):
+        self.assertEqual(utility.COLOR_LUT.dtype, np.uint32)
+        self.assertEqual(len(utility.COLOR_LUT), 256)
+        # Zero is black, the lowest pressures are blue and the highest almost red
+        self.assertEqual(utility.COLOR_LUT[0], 0xff000000)
+        self.assertEqual(utility.COLOR_LUT[1], 0xff0000ff)
+        self.assertEqual(utility.COLOR_LUT[255] & 0xffff0000, 0xffff0000)
+
+    def test_render(self):
+        buffer = utility.ColorMapBuffer()
+        data = np.array([[0., 50.], [255., -5.]])
+        rgb32 = buffer.render(data, n_max=255)
+        np.testing.assert_array_equal(rgb32, utility.COLOR_LUT[[[0, 50], [255, 0]]])
+        # Frames of the same shape reuse the buffer
+        self.assertIs(buffer.render(data * 2, n_max=255), rgb32)
+        # If the frame goes higher than n_max, the maximum is used instead
+        np.testing.assert_array_equal(rgb32, utility.COLOR_LUT[[[0, 50], [255, 0]]])
+
+    def test_render_without_n_max(self):
+        buffer = utility.ColorMapBuffer()
+        # Without an n_max, the frame isn't scaled to its own maximum, the values are used as they are
+        data = np.array([[0., 10.], [20., 300.]])
+        np.testing.assert_array_equal(buffer.render(data, n_max=0), utility.COLOR_LUT[[[0, 10], [20, 255]]])
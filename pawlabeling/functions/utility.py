@@ -227,26 +227,78 @@ def normalize(array, n_max):
     return array
 
 
-def array_to_qimage(array, color_table):
+# The colors pressures go through, from blue at the lowest pressure to red at 256, anything below 0.01 is black
+COLOR_THRESHOLDS = [0.01, 4.83, 10.74, 21.47, 93.94, 174.0, 256.0]
+COLOR_STOPS = [(0, 0, 255), (0, 0, 255), (0, 255, 255), (0, 255, 0), (255, 255, 0), (255, 128, 0), (255, 0, 0)]
+
+
+def create_color_lut():
     """
-    Convert the 2D numpy array  into a 8-bit QImage with a gray
-    colormap.  The first dimension represents the vertical image axis.
+    The RGB32 (0xffRRGGBB) color of every normalized value from 0 to 255, interpolated between the COLOR_STOPS
     """
-    array = np.require(array, np.uint8, 'C')
-    width, height = array.shape
-    result = QtGui.QImage(array.data, height, width, QtGui.QImage.Format_Indexed8)
-    result.ndarray = array
-    # Use the default one from this library
-    result.setColorTable(color_table)
-    # Convert it to RGB32
-    result = result.convertToFormat(QtGui.QImage.Format_RGB32)
-    return result
+    values = np.arange(256, dtype=np.float64)
+    stops = np.array(COLOR_STOPS, dtype=np.float64)
+    # Truncated, just like qRgb does
+    red, green, blue = [np.interp(values, COLOR_THRESHOLDS, stops[:, channel]).astype(np.uint32)
+                        for channel in range(3)]
+    lut = np.uint32(0xff000000) | (red << 16) | (green << 8) | blue
+    lut[values < COLOR_THRESHOLDS[0]] = 0xff000000
+    return lut
 
 
-def get_qpixmap(data, degree, n_max, color_table, interpolation="cubic"):
+# Every widget uses the same colors, so this only has to be calculated once
+COLOR_LUT = create_color_lut()
+
+
+class ColorMapBuffer(object):
+    """
+    Maps frames through COLOR_LUT into an RGB32 buffer, which is reused as long as the frames have the same shape.
+    The QImage wraps the buffer without copying it, so it's only valid until the next frame gets rendered.
+    That's fine for QPixmap.fromImage, which makes a copy of its own
+    """
+    def __init__(self):
+        self.scaled = None
+        self.indices = None
+        self.rgb32 = None
+
+    def render(self, data, n_max):
+        """
+        Normalizes the frame like normalize did and returns the color of every value as a uint32 array.
+        With an n_max of 0 the values aren't scaled at all, anything outside 0-255 gets clipped
+        """
+        if self.rgb32 is None or self.rgb32.shape != data.shape:
+            self.scaled = np.empty(data.shape, dtype=np.float64)
+            self.indices = np.empty(data.shape, dtype=np.uint8)
+            self.rgb32 = np.empty(data.shape, dtype=np.uint32)
+
+        if n_max == 0:
+            scale = 1.
+        else:
+            # If the frame goes higher than n_max, the normalization won't work as intended
+            max_value = np.max(data) if data.size else 0
+            if n_max < max_value:
+                n_max = max_value
+            scale = 255. / n_max if n_max > 0 else 1.
+        np.multiply(data, scale, out=self.scaled, casting="unsafe")
+        # This also gets rid of negative values
+        np.clip(self.scaled, 0, 255, out=self.scaled)
+        self.indices[...] = self.scaled
+        COLOR_LUT.take(self.indices, out=self.rgb32)
+        return self.rgb32
+
+    def to_qimage(self, data, n_max):
+        rgb32 = self.render(data, n_max)
+        height, width = rgb32.shape
+        qimage = QtGui.QImage(rgb32.data, width, height, width * 4, QtGui.QImage.Format_RGB32)
+        # Keep the buffer alive for as long as the image is
+        qimage.ndarray = rgb32
+        return qimage
+
+
+def get_qpixmap(data, degree, n_max, interpolation="cubic", buffer=None):
     """
     This function expects a single frame, it will interpolate/resize it with a given degree and
-    return a pixmap
+    return a pixmap. Pass a ColorMapBuffer when drawing frame after frame, so it doesn't need new buffers every time
     """
     import cv2
     # Need the sizes before reshaping
@@ -261,10 +313,10 @@ def get_qpixmap(data, degree, n_max, color_table, interpolation="cubic"):
 
     # This can be used to interpolate, but it doesn't seem to work entirely correct yet...
     data = cv2.resize(data, (height * degree, width * degree), interpolation=interpolation)
-    # Normalize the measurement_data
-    data = normalize(data, n_max)
+    if buffer is None:
+        buffer = ColorMapBuffer()
     # Convert it from numpy to qimage
-    qimage = array_to_qimage(data, color_table)
+    qimage = buffer.to_qimage(data, n_max)
     # Convert the image to a pixmap
     pixmap = QtGui.QPixmap.fromImage(qimage)
     # Scale up the image so its better visible
@@ -273,119 +325,6 @@ def get_qpixmap(data, degree, n_max, color_table, interpolation="cubic"):
     return pixmap
 
 
-def interpolate_rgb(start_color, start_value, end_color, end_value, actual_value):
-    delta_value = end_value - start_value
-    if delta_value == 0.0:
-        return start_color
-
-    multiplier = (actual_value - start_value) / delta_value
-
-    start_red = (start_color >> 16) & 0xff
-    end_red = (end_color >> 16) & 0xff
-    delta_red = end_red - start_red
-    red = start_red + (delta_red * multiplier)
-
-    if delta_red > 0:
-        if red < start_red:
-            red = start_red
-        elif red > end_red:
-            red = end_red
-    else:
-        if red > start_red:
-            red = start_red
-        elif red < end_red:
-            red = end_red
-
-    start_green = (start_color >> 8) & 0xff
-    end_green = (end_color >> 8) & 0xff
-    delta_green = end_green - start_green
-    green = start_green + (delta_green * multiplier)
-
-    if delta_green > 0:
-        if green < start_green:
-            green = start_green
-        elif green > end_green:
-            green = end_green
-    else:
-        if green > start_green:
-            green = start_green
-        elif green < end_green:
-            green = end_green
-
-    start_blue = start_color & 0xff
-    end_blue = end_color & 0xff
-    delta_blue = end_blue - start_blue
-    blue = start_blue + (delta_blue * multiplier)
-
-    if delta_blue > 0:
-        if blue < start_blue:
-            blue = start_blue
-        elif blue > end_blue:
-            blue = end_blue
-    else:
-        if blue > start_blue:
-            blue = start_blue
-        elif blue < end_blue:
-            blue = end_blue
-
-    return QtGui.qRgb(red, green, blue)
-
-
-class ImageColorTable():
-    def __init__(self):
-        self.black = QtGui.QColor(0, 0, 0).rgb()
-        self.lightblue = QtGui.QColor(0, 0, 255).rgb()
-        self.blue = QtGui.QColor(0, 0, 255).rgb()
-        self.cyan = QtGui.QColor(0, 255, 255).rgb()
-        self.green = QtGui.QColor(0, 255, 0).rgb()
-        self.yellow = QtGui.QColor(255, 255, 0).rgb()
-        self.orange = QtGui.QColor(255, 128, 0).rgb()
-        self.red = QtGui.QColor(255, 0, 0).rgb()
-        self.white = QtGui.QColor(255, 255, 255).rgb()
-
-        self.black_threshold = 0.01
-        self.lightblue_threshold = 1.00
-        self.blue_threshold = 4.83
-        self.cyan_threshold = 10.74
-        self.green_threshold = 21.47
-        self.yellow_threshold = 93.94
-        self.orange_threshold = 174.0
-        self.red_threshold = 256.0
-
-    def create_color_table(self):
-        color_table = [self.black for _ in xrange(255)]
-        for val in xrange(255):
-            if val < self.black_threshold:
-                color_table[val] = interpolate_rgb(self.black, self.black_threshold,
-                                                   self.blue, self.blue_threshold, val)
-            else:
-                if val <= self.yellow_threshold:
-                    if val <= self.cyan_threshold:
-                        if val <= self.blue_threshold:
-                            color_table[val] = interpolate_rgb(self.blue, self.black_threshold,
-                                                               self.lightblue, self.blue_threshold, val)
-                        else:
-                            color_table[val] = interpolate_rgb(self.lightblue, self.blue_threshold,
-                                                               self.cyan, self.cyan_threshold, val)
-                    else:
-                        if val <= self.green_threshold:
-                            color_table[val] = interpolate_rgb(self.cyan, self.cyan_threshold,
-                                                               self.green, self.green_threshold, val)
-                        else:
-                            color_table[val] = interpolate_rgb(self.green, self.green_threshold,
-                                                               self.yellow, self.yellow_threshold, val)
-                else:
-                    if val <= self.orange_threshold:
-                        color_table[val] = interpolate_rgb(self.yellow, self.yellow_threshold,
-                                                           self.orange, self.orange_threshold, val)
-                    elif val <= self.red_threshold:
-                        color_table[val] = interpolate_rgb(self.orange, self.orange_threshold,
-                                                           self.red, self.red_threshold, val)
-                    else:
-                        logger.warning(
-                            "There's an error in your color table. This is likely caused by incorrect normalization")
-        return color_table
-
 def agglomerative_clustering(data, num_clusters):
     from collections import defaultdict
     import heapq
@@ -0,0 +1,128 @@
+"""
+Read-only access to the database for other processes, like background analysis or export jobs.
+
+PyTables doesn't support HDF5's single writer/multiple reader mode and a file that's opened for writing
+by the GUI can't safely be read by anyone else. So instead the writer publishes snapshots: copies of the flushed
+database (and its shards) in <database>_snapshots/<generation>/. A snapshot never changes after it's published,
+readers open the newest one read-only and reopen it once a newer one shows up.
+
+Usage from another process:
+    with access.ReadOnlyDatabase(database_file) as database:
+        data_frame = table.query_contacts(database.table, contact_label=0)
+
+Or the asymmetry of every session of a subject:
+    with access.ReadOnlyDatabase(database_file) as database:
+        data_frame = table.query_contacts(database.table, subject_id="subject_1")
+        report = sessionmodel.asymmetry_report(data_frame, by=["session_id", "measurement_id"])
+        summary = sessionmodel.asymmetry_summary(report, by="session_id")
+"""
+import os
+import shutil
+
+import tables
+
+from pawlabeling.models import table
+
+
+def snapshot_folder(database_file):
+    return os.path.splitext(database_file)[0] + "_snapshots"
+
+
+def list_snapshots(database_file):
+    """
+    Returns the generations of the published snapshots, oldest first
+    """
+    folder = snapshot_folder(database_file)
+    if not os.path.isdir(folder):
+        return []
+    # Snapshots that are still being copied have a .tmp suffix, so they're skipped
+    return sorted(int(name) for name in os.listdir(folder) if name.isdigit())
+
+
+def snapshot_file(database_file, generation):
+    return os.path.join(snapshot_folder(database_file), str(generation), os.path.basename(database_file))
+
+
+def publish_snapshot(database, keep=2):
+    """
+    Copy the database and its shards to a new snapshot. This should be called by the process that's writing
+    to the database, at a point where everything it wrote is complete. Returns the generation of the snapshot
+    """
+    database_file = database.filename
+    # Readers can't rebuild indexes, so do it for them
+    handles = [database] + [shard for (master_file, _), shard in table.shards.items()
+                            if master_file == database_file and shard.isopen]
+    for handle in handles:
+        if "contacts_index" in handle.root:
+            handle.root.contacts_index.reindex_dirty()
+        handle.flush()
+
+    generations = list_snapshots(database_file)
+    generation = generations[-1] + 1 if generations else 1
+    folder = snapshot_folder(database_file)
+    temporary_folder = os.path.join(folder, "{}.tmp".format(generation))
+    database_folder = os.path.dirname(database_file)
+    for file_name in [database_file] + table.shard_files(database_file):
+        destination = os.path.join(temporary_folder, os.path.relpath(file_name, database_folder))
+        if not os.path.exists(os.path.dirname(destination)):
+            os.makedirs(os.path.dirname(destination))
+        shutil.copyfile(file_name, destination)
+    # Renaming to a name that isn't taken yet works everywhere, so readers never see half a snapshot
+    os.rename(temporary_folder, os.path.join(folder, str(generation)))
+
+    remove_snapshots(database_file, keep=keep)
+    return generation
+
+
+def remove_snapshots(database_file, keep=2):
+    """
+    Remove all but the newest snapshots. Snapshots that are still opened by a reader can't be removed on Windows,
+    those are tried again next time
+    """
+    for generation in list_snapshots(database_file)[:-keep]:
+        try:
+            shutil.rmtree(os.path.join(snapshot_folder(database_file), str(generation)))
+        except OSError:
+            pass
+
+
+class ReadOnlyDatabase(object):
+    """
+    Opens the newest snapshot of the database in read-only mode. Its table can be passed to the Table classes
+    just like settings.settings.table, only without writing to it.
+    """
+    def __init__(self, database_file):
+        self.database_file = database_file
+        self.generation = None
+        self.table = None
+        self.open()
+
+    def open(self):
+        generations = list_snapshots(self.database_file)
+        if not generations:
+            raise IOError("No snapshot of {} has been published yet".format(self.database_file))
+        self.generation = generations[-1]
+        self.table = tables.open_file(snapshot_file(self.database_file, self.generation), mode="r")
+
+    def refresh(self):
+        """
+        Reopen the newest snapshot if it's newer than ours. Returns True if it was reopened
+        """
+        generations = list_snapshots(self.database_file)
+        if not generations or generations[-1] == self.generation:
+            return False
+        self.close()
+        self.open()
+        return True
+
+    def close(self):
+        if self.table is not None:
+            table.close_shards(self.table)
+            self.table.close()
+            self.table = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,16 +1,55 @@
-from collections import defaultdict
-import cv2
-from itertools import izip
+from collections import defaultdict, OrderedDict
 
 import numpy as np
 from pubsub import pub
 
-from ..functions import utility, calculations, tracking
+from ..functions import utility, calculations
 from ..settings import settings
 from ..models import table
 
 # from memory_profiler import profile
 
+class ContactDataCache(object):
+    """
+    Keeps the most recently used contact arrays in memory, as long as they fit in max_bytes.
+    The keys are (subject_id, session_id, measurement_id, contact_id, item_id) tuples.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items = OrderedDict()
+
+    def get(self, key):
+        value = self.items.pop(key, None)
+        if value is not None:
+            # Put it back at the end, so it's the most recently used
+            self.items[key] = value
+        return value
+
+    def put(self, key, value):
+        self.discard(key)
+        if value.nbytes > self.max_bytes:
+            return
+        self.items[key] = value
+        self.size += value.nbytes
+        # Drop the least recently used arrays until everything fits again
+        while self.size > self.max_bytes:
+            _, oldest = self.items.popitem(last=False)
+            self.size -= oldest.nbytes
+
+    def discard(self, key):
+        value = self.items.pop(key, None)
+        if value is not None:
+            self.size -= value.nbytes
+
+    def discard_measurement(self, subject_id, session_id, measurement_id):
+        for key in [key for key in self.items if key[:3] == (subject_id, session_id, measurement_id)]:
+            self.discard(key)
+
+
+contact_data_cache = ContactDataCache(max_bytes=settings.settings.contact_cache_size() * 1024 ** 2)
+
+
 class Contacts(object):
     def __init__(self, subject_id, session_id, measurement_id):
         self.subject_id = subject_id
@@ -21,15 +60,40 @@ class Contacts(object):
                                                   subject_id=self.subject_id,
                                                   session_id=self.session_id,
                                                   measurement_id=self.measurement_id)
+        self.contact_data_table = table.ContactDataTable(table=self.table,
+                                                         subject_id=self.subject_id,
+                                                         session_id=self.session_id,
+                                                         measurement_id=self.measurement_id)
+        # In the sharded layout, every shard has its own index
+        self.contacts_index = table.ContactsIndexTable(table=self.contacts_table.table)
 
     def create_contacts(self, contacts):
         """
+        Replace the stored contacts with these contacts. Everything is written as one batch,
+        so if something goes wrong halfway, we don't end up with half of the contacts.
         """
-        self.delete_contacts()
-
-        # Make sure all the results are up to date
+        # Contacts restored from the database still get their arrays from the arrays we're about to remove
         for contact in contacts:
-            self.create_contact(contact)
+            contact.load_data()
+
+        try:
+            with self.contacts_table.write_batch():
+                self.delete_contacts()
+
+                # Make sure all the results are up to date
+                for contact in contacts:
+                    self.create_contact(contact)
+        except:
+            # The rollback restores the old contacts table, so get a fresh reference to it
+            self.contacts_table = table.ContactsTable(table=self.table,
+                                                      subject_id=self.subject_id,
+                                                      session_id=self.session_id,
+                                                      measurement_id=self.measurement_id)
+            raise
+
+        # Rows can't be rolled back, so the index only gets updated once everything else is stored
+        self.contacts_index.replace_contacts(self.subject_id, self.session_id, self.measurement_id,
+                                             [contact.to_dict() for contact in contacts])
 
     def create_contact(self, contact):
         # Convert the contact to a dict, like the table expects
@@ -37,9 +101,9 @@ class Contacts(object):
         # This doesn't seem to have an effect, because we just deleted everything (which is stupid)
         updated = self.contacts_table.update_contact(**contact_dict)
         if not updated:
-            self.contact_group = self.contacts_table.create_contact(**contact_dict)
+            self.contacts_table.create_contact(**contact_dict)
 
-        # We store the results separately
+        # We store the results separately, they get appended to the arrays of the entire measurement
         array_results = {
             "data": contact.data,
             "max_of_max": contact.max_of_max,
@@ -53,37 +117,21 @@ class Contacts(object):
             "vcop_x": contact.vcop_x,
             "vcop_y": contact.vcop_y,
         }
-
-        for item_id, data in array_results.iteritems():
-            result = self.contacts_table.get_data(group=self.contact_group, item_id=item_id)
-            if not result:  # result is None:
-                self.contacts_table.store_data(group=self.contact_group,
-                                               item_id=item_id,
-                                               data=data)
-                # If the arrays are not equal, drop the old one and write the new data
-            elif not np.array_equal(result, data):
-                # print "Item: {} is not equal to the stored version".format(item_id)
-                # Let's hope this will simply replace the old values
-                # http://hdf-forum.184993.n3.nabble.com/hdf-forum-Reset-data-in-pytables-array-td193311.html
-                # Supposedly I should use arr.__set__item(key, value)
-                # But I reckon that assumes the shapes stay the same
-                # Delete the old one
-                self.contacts_table.remove_group(
-                    where="/{}/{}/{}/{}".format(self.subject_id, self.session_id,
-                                                self.measurement_id, contact.contact_id),
-                    name=item_id)
-                # And store the new one
-                self.contacts_table.store_data(group=self.contact_group,
-                                               item_id=item_id,
-                                               data=data)
-
+        self.contact_data_table.store_contact_data(contact_id=contact.contact_id, arrays=array_results)
 
     def delete_contacts(self):
         # Drop any existing contacts before creating new ones
-        for contact in self.contacts_table.contacts_table:
+        # We don't bother removing their rows, because the whole table gets removed below
+        self.contact_data_table.remove_contact_data()
+        contact_data_cache.discard_measurement(self.subject_id, self.session_id, self.measurement_id)
+        # Databases that haven't been consolidated yet still have a group for every contact
+        for contact_id in self.contacts_table.contacts_table.col("contact_id"):
             try:
-                self.delete_contact(contact)
-            except NotImplementedError:
+                self.contacts_table.remove_group(
+                    where="/{}/{}/{}".format(self.subject_id, self.session_id, self.measurement_id),
+                    name=contact_id,
+                    recursive=True)
+            except table.NoSuchNodeError:
                 pass
 
         try:
@@ -107,10 +155,17 @@ class Contacts(object):
         self.contacts_table.remove_row(table=self.contacts_table.contacts_table,
                                        name_id="contact_id",
                                        item_id=contact["contact_id"])
-        self.contacts_table.remove_group(
-            where="/{}/{}/{}".format(self.subject_id, self.session_id, self.measurement_id),
-            name=contact["contact_id"],
-            recursive=True)
+        self.contact_data_table.remove_contact(contact_id=contact["contact_id"])
+        self.contacts_index.remove_contacts(self.subject_id, self.session_id, self.measurement_id,
+                                            contact_id=contact["contact_id"])
+        contact_data_cache.discard_measurement(self.subject_id, self.session_id, self.measurement_id)
+        try:
+            self.contacts_table.remove_group(
+                where="/{}/{}/{}".format(self.subject_id, self.session_id, self.measurement_id),
+                name=contact["contact_id"],
+                recursive=True)
+        except table.NoSuchNodeError:
+            pass
 
     def get_contacts(self, plate, measurement):
         new_contacts = []
@@ -123,18 +178,16 @@ class Contacts(object):
                                              subject_id=self.subject_id,
                                              session_id=self.session_id,
                                              measurement_id=measurement_id)
-        # Get the rows from the table and their corresponding data
-        contact_data = contact_data_table.get_contact_data()
+        # Only get the rows from the table, the arrays are loaded when a contact needs them
         contacts = contacts_table.get_contacts()
         # Create Contact instances out of them
-        for x, y in izip(contacts, contact_data):
+        for x in contacts:
             contact = Contact(subject_id=self.subject_id,
                               session_id=self.session_id,
                               measurement_id=self.measurement_id)
             # Restore it from the dictionary object
-            # http://stackoverflow.com/questions/38987/how-can-i-merge-union-two-python-dictionaries-in-a-single-expression
-            # This basically merges the two dicts into one
-            contact.restore(dict(x, **y))
+            contact.restore(x)
+            contact.contact_data_table = contact_data_table
             new_contacts.append(contact)
         return new_contacts
 
@@ -143,6 +196,9 @@ class Contacts(object):
 
     # @profile
     def track_contacts(self, measurement, measurement_data, plate):
+        # Tracking relies on OpenCV, which we only import when we actually need it
+        from ..functions import tracking
+
         pub.sendMessage("update_statusbar", status="Starting tracking")
         # Add padding to the measurement
         x = measurement.number_of_rows
@@ -221,59 +277,39 @@ class Contacts(object):
         contacts.
         """
 
-        other_contact_lookup = {
-            0: {"stride": 0, "step": 2, "ipsi": 1, "diag": 3},
-            1: {"stride": 1, "step": 3, "ipsi": 0, "diag": 2},
-            2: {"stride": 2, "step": 0, "ipsi": 3, "diag": 1},
-            3: {"stride": 3, "step": 1, "ipsi": 2, "diag": 0},
-        }
-
         # These results require multiple contacts...
-        distances, label_lookup = calculations.temporal_spatial(contacts,
-                                                                plate.sensor_width, plate.sensor_height,
-                                                                measurement.frequency)
-        gait_velocity = calculations.gait_velocity(contacts, distances)
-        pattern = "-".join([str(contact.contact_label) for contact in contacts])
-        for index, contact in enumerate(contacts):
-            distance = distances[index]
-            contact_label = contact.contact_label
+        labels, bounding_boxes, min_z, orientation = calculations.contact_arrays(contacts)
+        results = calculations.temporal_spatial(labels, bounding_boxes, min_z, orientation,
+                                                plate.sensor_width, plate.sensor_height, measurement.frequency)
+        gait_velocity = calculations.gait_velocity(results)
+        # The pattern of the entire measurement gets stored, the pattern of every stride is only returned
+        pattern = calculations.find_gait_pattern(labels)
+        results["stride_pattern"] = calculations.assign_gait_patterns(labels)
+
+        stance_duration = np.array([getattr(contact, "stance_duration", np.nan) for contact in contacts],
+                                   dtype=np.float64)
+        results["swing_duration"] = results["stride_duration"] - stance_duration
+        # The stride duration can never be shorter than the stance time itself
+        with np.errstate(invalid="ignore", divide="ignore"):
+            results["stance_percentage"] = np.where(results["stride_duration"] > stance_duration,
+                                                    (stance_duration * 100.) / results["stride_duration"], np.nan)
+
+        # Only the results we found a contact for are set, the rest keep their default
+        columns = []
+        for relation in calculations.GAIT_RELATIONS:
+            found = results["{}_index".format(relation)] >= 0
+            for name in ["width", "length", "duration"]:
+                columns.append(("{}_{}".format(relation, name), found))
+        columns.append(("swing_duration", results["stride_index"] >= 0))
+        columns.append(("stance_percentage", ~np.isnan(results["stance_percentage"])))
+
+        for contact in contacts:
             contact.gait_velocity = gait_velocity
-            contact.gait_pattern = calculations.find_gait_pattern(pattern=pattern)
-
-            if contact_label < 0:
-                continue
-
-            stride_label = other_contact_lookup[contact_label]["stride"]
-            stride_contact = distance.get(stride_label)
-            if stride_contact:
-                contact.stride_width = stride_contact[0]
-                contact.stride_length = stride_contact[1]
-                contact.stride_duration = stride_contact[2]
-                contact.swing_duration = contact.stride_duration - contact.stance_duration
-                # The stride duration can never be shorter than the stance time itself
-                if contact.stride_duration > contact.stance_duration:
-                    contact.stance_percentage = (contact.stance_duration * 100.) / contact.stride_duration
-
-            step_label = other_contact_lookup[contact_label]["step"]
-            step_contact = distance.get(step_label)
-            if step_contact:
-                contact.step_width = step_contact[0]
-                contact.step_length = step_contact[1]
-                contact.step_duration = step_contact[2]
-
-            ipsi_label = other_contact_lookup[contact_label]["ipsi"]
-            ipsi_contact = distance.get(ipsi_label)
-            if ipsi_contact:
-                contact.ipsi_width = ipsi_contact[0]
-                contact.ipsi_length = ipsi_contact[1]
-                contact.ipsi_duration = ipsi_contact[2]
-
-            diag_label = other_contact_lookup[contact_label]["diag"]
-            diag_contact = distance.get(diag_label)
-            if diag_contact:
-                contact.diag_width = diag_contact[0]
-                contact.diag_length = diag_contact[1]
-                contact.diag_duration = diag_contact[2]
+            contact.gait_pattern = pattern
+        for key, found in columns:
+            for index in np.flatnonzero(found):
+                setattr(contacts[index], key, float(results[key][index]))
+        return results
 
 
 class Contact(object):
@@ -333,6 +369,10 @@ class Contact(object):
     diag_width = tables.FloatCol()
     """
 
+    data_attributes = ["data", "force_over_time", "pixel_count_over_time", "surface_over_time",
+                       "pressure_over_time",
+                       "cop_x", "cop_y", "vcop_xy", "vcop_x", "vcop_y", "max_of_max"]
+
     def __init__(self, subject_id, session_id, measurement_id):
         self.subject_id = subject_id
         self.session_id = session_id
@@ -380,9 +420,8 @@ class Contact(object):
                                  "ipsi_duration", "ipsi_length", "ipsi_width", "diag_duration", "diag_length",
                                  "diag_width"]
 
-        self.data_attributes = ["data", "force_over_time", "pixel_count_over_time", "surface_over_time",
-                                "pressure_over_time",
-                                "cop_x", "cop_y", "vcop_xy", "vcop_x", "vcop_y", "max_of_max"]
+        # Contacts restored from the database use this to load their data_attributes
+        self.contact_data_table = None
 
     def create_contact(self, contact, measurement_data, orientation):
         self.orientation = orientation  # True means the contact is upside down
@@ -426,6 +465,8 @@ class Contact(object):
         """
         Creates self.measurement_data which contains the pixels that are enclosed by the contour
         """
+        import cv2
+
         # Create an empty array that should fit the entire contact
         self.data = np.zeros((self.width, self.height, self.length))
 
@@ -516,6 +557,36 @@ class Contact(object):
             return True
         return False
 
+    def __getattr__(self, name):
+        """
+        This only gets called when an attribute can't be found, so when a contact restored from the database
+        needs one of its arrays, we get it from the cache or else from the table
+        """
+        contact_data_table = self.__dict__.get("contact_data_table")
+        if contact_data_table is None or name not in Contact.data_attributes:
+            raise AttributeError(name)
+
+        key = (self.subject_id, self.session_id, self.measurement_id, self.contact_id, name)
+        # We're usually on the GUI thread here, while the database worker may be using the same handle,
+        # so the read and the cache (which the loader also fills) stay behind the HDF5 lock
+        with table.hdf5_lock:
+            value = contact_data_cache.get(key)
+            if value is None:
+                value = contact_data_table.get_item(contact_id=self.contact_id, item_id=name)
+                if value is not None:
+                    contact_data_cache.put(key, value)
+        return value
+
+    def load_data(self):
+        """
+        Load all the arrays that haven't been loaded yet and stop relying on the table
+        """
+        if self.contact_data_table is None:
+            return
+        for item_id in Contact.data_attributes:
+            setattr(self, item_id, getattr(self, item_id))
+        self.contact_data_table = None
+
     # TODO This should be converted to a @classmethod
     # http://scipy-lectures.github.io/advanced/advanced_python/#id11
     def restore(self, contact):
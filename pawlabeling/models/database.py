@@ -0,0 +1,212 @@
+"""
+PyTables isn't thread-safe, so background work on the database goes through a queue to a single worker thread.
+
+    future = settings.settings.database_worker().submit(function, *args)
+    result = future.result()
+
+The function gets called on the worker thread with the database as its first argument. Reads that shouldn't have to
+wait for the writes queued before them can go to a SnapshotReader, which reads the newest snapshot (see access.py)
+on a thread of its own.
+
+The worker shares the file handle of the GUI thread: PyTables won't open the same file twice for writing.
+So it's hdf5_lock (see table.py) that keeps them apart. Every request holds it while it runs and every method of
+a table.Table takes it as well, so the GUI thread only has to use locked for code that touches a handle directly.
+"""
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+if sys.version_info[0] >= 3:
+    def reraise(exc_info):
+        raise exc_info[1].with_traceback(exc_info[2])
+else:
+    # The three argument raise is a syntax error on Python 3
+    exec("def reraise(exc_info):\n    raise exc_info[0], exc_info[1], exc_info[2]\n")
+
+from pawlabeling.models import access, table
+
+# Held by any thread that's using PyTables, a request of one worker can't run at the same time as that of another
+hdf5_lock = table.hdf5_lock
+locked = table.locked
+
+
+class CancelledError(Exception):
+    pass
+
+
+class Future(object):
+    """
+    The result of a request, once the worker gets to it.
+    Callbacks are called on the worker thread, so use a Qt signal to get back to the GUI thread.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.state = "pending"
+        self.value = None
+        self.exc_info = None
+        self.callbacks = []
+
+    def start(self):
+        """
+        Returns False if the request was cancelled before it got started
+        """
+        with self.lock:
+            if self.state != "pending":
+                return False
+            self.state = "running"
+            return True
+
+    def cancel(self):
+        """
+        Requests that are still waiting in the queue can be cancelled, returns True if it was cancelled
+        """
+        with self.lock:
+            if self.state != "pending":
+                return self.state == "cancelled"
+            self.state = "cancelled"
+        self.finish()
+        return True
+
+    def cancelled(self):
+        return self.state == "cancelled"
+
+    def done(self):
+        return self.event.is_set()
+
+    def set_result(self, value):
+        self.value = value
+        self.state = "finished"
+        self.finish()
+
+    def set_exception(self, exc_info):
+        self.exc_info = exc_info
+        self.state = "finished"
+        self.finish()
+
+    def finish(self):
+        with self.lock:
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        with self.lock:
+            if not self.done():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def result(self, timeout=None):
+        """
+        Wait for the result, if the request raised an exception, it gets raised here
+        """
+        if not self.event.wait(timeout):
+            raise RuntimeError("The database didn't get to the request within {} seconds".format(timeout))
+        if self.state == "cancelled":
+            raise CancelledError("The request was cancelled")
+        if self.exc_info is not None:
+            # With the traceback of the worker, so we can tell where it went wrong
+            reraise(self.exc_info)
+        return self.value
+
+
+class DatabaseWorker(threading.Thread):
+    """
+    Works through the requests in the order they were submitted.
+    open_database is called on the worker thread. The handle it returns doesn't have to be its own, the one of
+    settings.database_worker is the GUI thread's handle, that's why every request holds hdf5_lock.
+    If close_database is given, it gets called with the database once the worker stops.
+    """
+    def __init__(self, open_database=None, close_database=None, name="DatabaseWorker"):
+        super(DatabaseWorker, self).__init__(name=name)
+        # Don't keep the application alive because the worker is still waiting for requests
+        self.daemon = True
+        self.open_database = open_database
+        self.close_database = close_database
+        self.requests = queue.Queue()
+        self.table = None
+
+    def submit(self, function, *args, **kwargs):
+        future = Future()
+        self.requests.put((future, function, args, kwargs))
+        return future
+
+    def stop(self, timeout=None):
+        """
+        Finish the requests that were already submitted and stop
+        """
+        self.requests.put(None)
+        if self.is_alive():
+            self.join(timeout)
+
+    def open(self):
+        return self.open_database()
+
+    def close(self):
+        if self.close_database is not None and self.table is not None:
+            self.close_database(self.table)
+
+    def before_request(self):
+        pass
+
+    def run(self):
+        try:
+            with hdf5_lock:
+                self.table = self.open()
+        except Exception:
+            # Without a database, all we can do is tell everyone why
+            exc_info = sys.exc_info()
+            for request in iter(self.requests.get, None):
+                future = request[0]
+                if future.start():
+                    future.set_exception(exc_info)
+            return
+
+        try:
+            while True:
+                request = self.requests.get()
+                if request is None:
+                    break
+                future, function, args, kwargs = request
+                if not future.start():
+                    continue
+                try:
+                    with hdf5_lock:
+                        self.before_request()
+                        value = function(self.table, *args, **kwargs)
+                except Exception:
+                    future.set_exception(sys.exc_info())
+                else:
+                    future.set_result(value)
+        finally:
+            with hdf5_lock:
+                self.close()
+
+
+class SnapshotReader(DatabaseWorker):
+    """
+    Answers requests using the newest snapshot of the database, so they don't have to wait for the writer.
+    It checks for a newer snapshot before every request
+    """
+    def __init__(self, database_file, name="SnapshotReader"):
+        super(SnapshotReader, self).__init__(name=name)
+        self.database_file = database_file
+        self.snapshot = None
+
+    def open(self):
+        self.snapshot = access.ReadOnlyDatabase(self.database_file)
+        return self.snapshot.table
+
+    def before_request(self):
+        if self.snapshot.refresh():
+            self.table = self.snapshot.table
+
+    def close(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
@@ -0,0 +1,117 @@
+"""
+Maintenance commands for a Paw Labeling database. They only need PyTables, so they can be run without the GUI.
+
+Usage: python -m pawlabeling.models.maintenance consolidate path/to/data.h5
+       python -m pawlabeling.models.maintenance repack path/to/data.h5 archival
+       python -m pawlabeling.models.maintenance compact path/to/data.h5
+       python -m pawlabeling.models.maintenance reindex path/to/data.h5
+       python -m pawlabeling.models.maintenance shard path/to/data.h5
+"""
+from __future__ import print_function
+import argparse
+import os
+
+from pawlabeling.models import table
+
+
+def consolidate(database_file):
+    """
+    Convert the per contact groups into the consolidated contact data layout
+    """
+    converted = 0
+    for file_name in [database_file] + table.shard_files(database_file):
+        database = table.load_table(file_name)
+        try:
+            converted += table.consolidate_contact_data(database)
+        finally:
+            database.close()
+    print("Consolidated the contact data of {} measurements".format(converted))
+
+
+def repack(database_file, storage_profile):
+    """
+    Convert the database to another storage profile (fast, balanced or archival)
+    """
+    database_files = [database_file] + table.shard_files(database_file)
+    old_size = sum(os.path.getsize(file_name) for file_name in database_files)
+    for file_name in database_files:
+        table.repack_database(file_name, storage_profile)
+    new_size = sum(os.path.getsize(file_name) for file_name in database_files)
+    print("Repacked to {}: {:.1f} MB -> {:.1f} MB".format(storage_profile, old_size / 1024. ** 2,
+                                                          new_size / 1024. ** 2))
+
+
+def compact(database_file):
+    """
+    Get back the space left behind by everything that was removed or replaced
+    """
+    database_files = [database_file] + table.shard_files(database_file)
+    old_size = sum(os.path.getsize(file_name) for file_name in database_files)
+    reclaimed = sum(table.repack_database(file_name) for file_name in database_files)
+    print("Reclaimed {:.1f} MB of {:.1f} MB".format(reclaimed / 1024. ** 2, old_size / 1024. ** 2))
+
+
+def reindex(database_file):
+    """
+    Rebuild the contacts index from the contacts tables of every measurement
+    """
+    database = table.load_table(database_file)
+    try:
+        number_of_contacts = table.rebuild_contacts_index(database)
+        if table.is_sharded(database):
+            for subject_id in database.root.subjects.col("subject_id"):
+                shard = table.get_shard(database, table.decode(subject_id))
+                number_of_contacts += table.rebuild_contacts_index(shard)
+    finally:
+        table.close_shards(database)
+        database.close()
+    print("Indexed {} contacts".format(number_of_contacts))
+
+
+def shard(database_file):
+    """
+    Move every subject into a file of its own, next to the database
+    """
+    database = table.load_table(database_file)
+    try:
+        moved = table.shard_database(database)
+    finally:
+        table.close_shards(database)
+        database.close()
+    # The master file still has the space of everything we moved out
+    table.repack_database(database_file)
+    print("Moved {} subjects to {}".format(moved, table.shard_folder(database_file)))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Maintenance commands for a Paw Labeling database")
+    subparsers = parser.add_subparsers(dest="command")
+    consolidate_parser = subparsers.add_parser("consolidate", help=consolidate.__doc__.strip())
+    consolidate_parser.add_argument("database_file")
+    repack_parser = subparsers.add_parser("repack", help=repack.__doc__.strip())
+    repack_parser.add_argument("database_file")
+    repack_parser.add_argument("storage_profile", choices=sorted(table.STORAGE_PROFILES))
+    compact_parser = subparsers.add_parser("compact", help=compact.__doc__.strip())
+    compact_parser.add_argument("database_file")
+    reindex_parser = subparsers.add_parser("reindex", help=reindex.__doc__.strip())
+    reindex_parser.add_argument("database_file")
+    shard_parser = subparsers.add_parser("shard", help=shard.__doc__.strip())
+    shard_parser.add_argument("database_file")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.command == "consolidate":
+        consolidate(arguments.database_file)
+    elif arguments.command == "repack":
+        repack(arguments.database_file, arguments.storage_profile)
+    elif arguments.command == "compact":
+        compact(arguments.database_file)
+    elif arguments.command == "reindex":
+        reindex(arguments.database_file)
+    elif arguments.command == "shard":
+        shard(arguments.database_file)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
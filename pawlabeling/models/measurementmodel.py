@@ -35,8 +35,9 @@ class Measurements(object):
             return
 
         measurement = measurement_object.to_dict()
-        # Finally we create the contact
-        self.measurement_group = self.measurements_table.create_measurement(**measurement)
+        # Finally we create the contact, the row and its group are written in one go
+        with self.measurements_table.write_batch():
+            self.measurement_group = self.measurements_table.create_measurement(**measurement)
         return measurement_object
 
     def delete_measurement(self, measurement):
@@ -71,7 +72,8 @@ class Measurements(object):
     def create_measurement_data(self, measurement, measurement_data):
         self.measurements_table.store_data(group=self.measurement_group,
                                            item_id=measurement.measurement_id,
-                                           data=measurement_data)
+                                           data=measurement_data,
+                                           kind="measurement")
 
     def get_measurement_data(self, measurement):
         group = self.measurements_table.get_group(self.measurements_table.session_group,
@@ -1,23 +1,20 @@
 from collections import defaultdict
 # import numpy as np
-import pandas as pd
 from pubsub import pub
 # from ..functions import utility, io, tracking, calculations
 from ..settings import settings
-from ..models import table, subjectmodel, sessionmodel, measurementmodel, contactmodel, platemodel
+from ..models import table, database, subjectmodel, sessionmodel, measurementmodel, contactmodel, platemodel, \
+    sessionloader
 # from memory_profiler import profile
 
 
-class Model():
+class Model(object):
     def __init__(self):
         self.file_paths = defaultdict(dict)
         self.measurement_folder = settings.settings.measurement_folder()
-        self.table = settings.settings.table
-        self.plate_model = platemodel.Plates()
-        # Create the plates if they do not yet exists
-        self.plate_model.create_plates()
-
-        self.subject_model = subjectmodel.Subjects()
+        # These need the database, so they're created on first use, see the properties below
+        self._plate_model = None
+        self._subject_model = None
         self.subject = None
         self.subject_id = ""
         self.subject_name = ""
@@ -34,6 +31,10 @@ class Model():
         self.measurement_name = ""
         self.measurement = None
         self.measurements = {}
+        self.contact_models = {}
+        # The loader of the session we're waiting for, the generation tells stale loaders apart
+        self.session_loader = None
+        self.session_generation = 0
         self.contacts = defaultdict(list)
         self.selected_contacts = defaultdict()
         self.contacts_table = None
@@ -46,7 +47,11 @@ class Model():
         self.plate_id = ""
         self.shape = None
         self.sensor_surface = None
-        self.average_data = defaultdict()
+        # Running sums of the contacts of every label, so labeling a contact doesn't average the entire session
+        self.average = sessionmodel.AverageData()
+        self.average_data = self.average.average_data
+        # The mean and variance of every label as {contact_label: (count, mean, variance)}, see get_statistics
+        self.statistics = None
         self.results = defaultdict(lambda: defaultdict(list))
         self.max_results = defaultdict()
         self.n_max = 0
@@ -54,17 +59,45 @@ class Model():
         self.filtered_length = 0
         self.outlier_toggle = False
         self.average_toggle = False
-        self.dataframe = None
+        # What the analysis widgets show, for all contacts and without the filtered ones, see current_summary
+        self.summary = {}
+        # The time normalized series of every contact, so relabeling doesn't mean resampling everything again
+        self.curves = sessionmodel.NormalizedCurves()
+        # The results outliers are judged on, so changing the rule doesn't mean collecting them all again
+        self.outliers = sessionmodel.OutlierFilter()
+        self.outlier_rule = "sd"
 
         # Various
         pub.subscribe(self.changed_settings, "changed_settings")
         pub.subscribe(self.filter_outliers, "model_filter_outliers")
         pub.subscribe(self.show_average_results, "model_show_average_results")
-
+        pub.subscribe(self.cancel_session_load, "model_cancel_session_load")
+
+    # The model gets created when this module is imported, so we don't touch the database until we need it
+    @property
+    def table(self):
+        return settings.settings.table
+
+    @property
+    def plate_model(self):
+        if self._plate_model is None:
+            self._plate_model = platemodel.Plates()
+            # Create the plates if they do not yet exists
+            self._plate_model.create_plates()
+        return self._plate_model
+
+    @property
+    def subject_model(self):
+        if self._subject_model is None:
+            self._subject_model = subjectmodel.Subjects()
+        return self._subject_model
+
+    @database.locked
     def create_subject(self, subject):
         self.subject_id = self.subject_model.create_subject(subject=subject)
         pub.sendMessage("update_statusbar", status="Model.create_subject: Subject created")
 
+    @database.locked
     def create_session(self, session):
         if not self.subject_id:
             pub.sendMessage("update_statusbar", status="Model.create_session: Subject not selected")
@@ -75,6 +108,7 @@ class Model():
         self.session_id = self.session_model.create_session(session=session)
         pub.sendMessage("update_statusbar", status="Model.create_session: Session created")
 
+    @database.locked
     def create_measurement(self, measurement):
         if not self.session_id:
             pub.sendMessage("update_statusbar", status="Model.create_measurement: Session not selected")
@@ -113,14 +147,17 @@ class Model():
         pub.sendMessage("update_statusbar", status=status)
         settings.settings.logger.info("model.create_contact: {}".format(status))
 
+    @database.locked
     def get_subjects(self):
         self.subjects = self.subject_model.get_subjects()
         pub.sendMessage("get_subjects")
 
+    @database.locked
     def get_sessions(self):
         self.sessions = self.session_model.get_sessions()
         pub.sendMessage("get_sessions")
 
+    @database.locked
     def get_measurements(self):
         self.measurements = self.measurement_model.get_measurements()
         pub.sendMessage("get_measurements")
@@ -131,11 +168,13 @@ class Model():
         self.current_contact_index = 0
         pub.sendMessage("get_contacts")
 
+    @database.locked
     def get_measurement_data(self):
         self.measurement_data = self.measurement_model.get_measurement_data(self.measurement)
         # TODO damn, I'm triggering events from the wrong place again...
         pub.sendMessage("get_measurement_data")
 
+    @database.locked
     def get_plates(self):
         self.plates = self.plate_model.get_plates()
         pub.sendMessage("get_plates")
@@ -151,6 +190,7 @@ class Model():
             self.put_plate(plate)
             return plate
 
+    @database.locked
     def put_subject(self, subject):
         self.subject = subject
         self.subject_id = subject.subject_id
@@ -166,49 +206,98 @@ class Model():
         self.get_sessions()
 
     def put_session(self, session):
+        # If we were still loading another session, we don't need it anymore
+        self.stop_session_load()
         self.clear_cached_values()
         self.session = session
         self.session_id = session.session_id
         settings.settings.logger.info("Session ID set to {}".format(self.session_id))
         pub.sendMessage("update_statusbar", status="Session: {}".format(self.session.session_name))
 
-        self.measurements_table = table.MeasurementsTable(table=self.table,
-                                                          subject_id=self.subject_id,
-                                                          session_id=self.session_id)
+        # Anything the GUI does while the session is loading should already go to this session
         self.measurement_model = measurementmodel.Measurements(subject_id=self.subject_id,
                                                                session_id=self.session_id)
+        self.measurements_table = self.measurement_model.measurements_table
         pub.sendMessage("put_session")
 
-        # TODO How did I manage to keep making this stuff so complicated?!?
-        # TODO perhaps I should roll these below functions into one, then call get_blabla on the results later
-
+        # Everything else is loaded on the database worker, see session_loaded for what happens when its done
+        self.session_generation += 1
+        self.session_loader = sessionloader.SessionLoader(subject_id=self.subject_id,
+                                                          session_id=self.session_id,
+                                                          measurement_model=self.measurement_model,
+                                                          plates=self.plates,
+                                                          filtering=self.outlier_toggle,
+                                                          outlier_rule=settings.settings.outlier_rule(),
+                                                          generation=self.session_generation,
+                                                          progress=self.session_load_progress,
+                                                          finished=self.session_loaded)
         pub.sendMessage("update_progress", progress=0)
-        # Load all the measurements for this session
-        self.get_measurements()
+        pub.sendMessage("session_load_started")
+        self.session_loader.start()
+
+    def session_load_progress(self, loader, progress):
+        # Progress of a load we've already given up on shouldn't move the progress bar
+        if loader.generation == self.session_generation:
+            pub.sendMessage("update_progress", progress=progress)
+
+    def session_loaded(self, loader):
+        if loader.generation != self.session_generation or loader.cancelled:
+            return
+        self.session_loader = None
+        pub.sendMessage("session_load_finished")
+
+        if loader.error is not None:
+            pub.sendMessage("update_progress", progress=0)
+            pub.sendMessage("update_statusbar", status="Loading the session failed: {}".format(loader.error))
+            return
+
+        self.measurements = loader.measurements
+        pub.sendMessage("get_measurements")
         # If there are no measurements yet, stop right here
         if not self.measurements:
+            pub.sendMessage("update_progress", progress=100)
             return
 
-        pub.sendMessage("update_progress", progress=50)
-        # Create Contacts instances for each measurement
-        self.contact_models = {}
-        for measurement in self.measurements.values():
-            contact_model = contactmodel.Contacts(subject_id=self.subject_id,
-                                                  session_id=self.session_id,
-                                                  measurement_id=measurement.measurement_id)
-            self.contact_models[measurement.measurement_name] = contact_model
-
-        self.get_plate()
-        # Load the contacts, but have it not send out anything
-        self.load_contacts()
-        pub.sendMessage("update_progress", progress=75)
-        self.update_n_max()
-        # Pray this doesn't have side-effects
-        self.calculate_results()
+        self.contact_models = loader.contact_models
+        self.put_plate(loader.plate)
+        self.contacts.update(loader.contacts)
+        # This notifies the measurement_trees which measurements have contacts assigned to them
+        pub.sendMessage("update_measurement_status")
+        self.n_max = loader.n_max
+        pub.sendMessage("update_n_max")
+
+        self.shape = loader.shape
+        self.average = loader.average
+        self.average_data = self.average.average_data
+        self.statistics = None
+        self.max_length = self.shape[2]
+        self.filtered_length = self.max_length
+        self.summary = loader.summary
+        self.curves = loader.curves
+        self.outliers = loader.outliers
+        self.outlier_rule = loader.outlier_rule
+        pub.sendMessage("update_average")
         pub.sendMessage("update_progress", progress=100)
 
+    def stop_session_load(self):
+        """
+        Returns whether there was a load to stop
+        """
+        if self.session_loader is None:
+            return False
+        self.session_loader.cancel()
+        self.session_loader = None
+        pub.sendMessage("session_load_finished")
+        return True
+
+    def cancel_session_load(self):
+        # Only when the user pressed cancel, switching sessions just starts the next load
+        if self.stop_session_load():
+            pub.sendMessage("update_progress", progress=0)
+            pub.sendMessage("update_statusbar", status="Stopped loading the session")
 
     # TODO This function is messed up again!
+    @database.locked
     def put_measurement(self, measurement_id):
         measurement = self.measurements[measurement_id]
         self.measurement = measurement
@@ -246,6 +335,7 @@ class Model():
         self.sensor_surface = self.plate.sensor_surface
         settings.settings.logger.info("Plate ID set to {}".format(self.plate_id))
 
+    @database.locked
     def delete_subject(self, subject):
         self.subject_model.delete_subject(subject)
         # Have all widgets refresh their trees, they might be empty
@@ -253,17 +343,22 @@ class Model():
         self.get_sessions()
         self.get_measurements()
 
+    @database.locked
     def delete_session(self, session):
         self.session_model.delete_session(session)
         # Have all widgets refresh their view of the subjects by calling get_sessions
         self.get_sessions()
         self.get_measurements()
 
+    @database.locked
     def delete_measurement(self, measurement):
         self.measurement_model.delete_measurement(measurement)
         self.get_measurements()
 
     def update_current_contact(self):
+        # The labels changed, current_summary and get_statistics calculate these again once they're needed
+        self.summary = {}
+        self.statistics = None
         # Notify everyone things have been updated
         self.update_average()
         pub.sendMessage("update_current_contact")
@@ -273,6 +368,8 @@ class Model():
         This function tries to select a contact that's not filtered or invalid
         """
         self.outlier_toggle = not self.outlier_toggle
+        # They were calculated with or without the filtered contacts
+        self.statistics = None
 
         # Update the average, because we want to get rid of the filtered contacts
         self.update_average()
@@ -302,6 +399,13 @@ class Model():
 
     # TODO Store every contact, from every measurement?
     def store_contacts(self):
+        self.write_contacts()
+        # Let processes reading the database know about the new results. The worker copies the database once it
+        # gets to it, so we don't hold on to the lock for that
+        settings.settings.publish_snapshot()
+
+    @database.locked
+    def write_contacts(self):
         measurement_data = self.measurement_model.get_measurement_data(self.measurement)
         # Make sure the results are up to date
         self.contact_model.recalculate_results(self.contacts[self.measurement_name],
@@ -309,6 +413,8 @@ class Model():
                                                self.measurement,
                                                measurement_data)
         self.contact_model.create_contacts(contacts=self.contacts[self.measurement_name])
+        self.summary = {}
+        self.statistics = None
         settings.settings.logger.info("Model.store_contacts: Results for {} have been successfully saved".format(
             self.measurement_name))
         pub.sendMessage("update_statusbar", status="Results saved")
@@ -319,6 +425,7 @@ class Model():
 
     # TODO This should only be used when you've changed tracking thresholds
     # Else it makes no sense at all
+    @database.locked
     def repeat_track_contacts(self):
         contacts = self.contact_model.repeat_track_contacts(measurement=self.measurement,
                                                             measurement_data=self.measurement_data,
@@ -329,70 +436,63 @@ class Model():
         # Notify the measurement tree that something has changed
         pub.sendMessage("update_measurement_status")
 
-    # TODO Make sure this function doesn't have to pass along data
-    def load_contacts(self):
-        """
-        Check if there if any measurements for this subject have already been processed
-        If so, retrieve the measurement_data and convert them to a usable format
-        """
-        settings.settings.logger.info(
-            "Model.load_contacts: Loading all measurements for subject: {}, session: {}".format(
-                self.subject_name, self.session.session_name))
-        self.contacts.clear()
-
-        measurements = {}
-        for measurement_id, measurement in self.measurements.iteritems():
-            contact_model = self.contact_models[measurement.measurement_name]
-            plate = self.plates[measurement.plate_id]
-            contacts = contact_model.get_contacts(plate, measurement)
-            if contact_model.verify_contacts(contacts):
-                measurement_data = self.measurement_model.get_measurement_data(measurement)
-                contact_model.recalculate_results(contacts, plate, measurement, measurement_data)
-                # Given the stored data is dirty, store it
-                contact_model.create_contacts(contacts)
-
-            if contacts:
-                self.contacts[measurement.measurement_name] = contacts
-
-            if not all([True if contact.contact_label < 0 else False for contact in contacts]):
-                measurements[measurement.measurement_name] = measurement
-
-        # This notifies the measurement_trees which measurements have contacts assigned to them
-        pub.sendMessage("update_measurement_status")
-
+    @database.locked
     def update_average(self):
         self.shape = self.session_model.calculate_shape(contacts=self.contacts)
-        self.average_data = self.session_model.calculate_average_data(contacts=self.contacts,
-                                                                      shape=self.shape,
-                                                                      filtering=self.outlier_toggle)
+        # Only the contacts that got a different label or were (un)filtered are added or subtracted
+        self.average.update(contacts=self.contacts, shape=self.shape, filtering=self.outlier_toggle)
         self.max_length = self.shape[2]
         self.filtered_length = self.max_length
         pub.sendMessage("update_average")
 
+    @database.locked
     def calculate_results(self):
+        self.outlier_rule = settings.settings.outlier_rule()
+        # This updates contacts in place, before the average, because that might leave out the filtered contacts
+        self.session_model.calculate_results(contacts=self.contacts, outliers=self.outliers, rule=self.outlier_rule)
         self.update_average()
-        # This updates contacts in place
-        self.session_model.calculate_results(contacts=self.contacts)
-        results = []
-        for measurement_id, contacts in self.contacts.items():
-            for contact in contacts:
-                row = [measurement_id, contact.contact_id, contact.contact_label, contact.invalid, contact.filtered,
-                       contact.peak_force, contact.peak_pressure, contact.peak_surface, contact.vertical_impulse,
-                       contact.stance_duration, contact.stance_percentage, contact.step_duration, contact.step_length]
-                results.append(row)
-
-        self.dataframe = pd.DataFrame(results,
-                                      columns=["measurement_id", "contact_id", "contact_label", "invalid", "filtered",
-                                               "peak_force", "peak_pressure", "peak_surface", "vertical_impulse",
-                                               "stance_duration", "stance_percentage", "step_duration", "step_length",
-                                               ])
+        # This reads it from the session's group, unless the labels have changed since it was stored
+        self.summary = self.session_model.get_summary(session_id=self.session_id, contacts=self.contacts,
+                                                      curves=self.curves)
+        # These have to go through every contact's data, so they're only recalculated when someone asks for them
+        self.statistics = None
+
+    @database.locked
+    def get_statistics(self):
+        """
+        The mean and variance of every label, calculated the first time they're needed after the results changed.
+        The SD map of the analysis tab shows them
+        """
+        if not any(self.contacts.values()):
+            return {}
+        if self.statistics is None:
+            # This reads them from the session's group, unless the labels have changed since they were stored
+            self.statistics = self.session_model.get_statistics(session_id=self.session_id, contacts=self.contacts,
+                                                                shape=self.shape, filtering=self.outlier_toggle)
+        return self.statistics
+
+    @database.locked
+    def current_summary(self):
+        """
+        The summary for the outlier toggle's current state, or an empty dict if there are no results yet.
+        If the labels or results changed since calculate_results, the summary is calculated again
+        """
+        if not self.summary and any(self.contacts.values()):
+            self.summary = self.session_model.get_summary(session_id=self.session_id, contacts=self.contacts,
+                                                          curves=self.curves)
+        return self.summary.get("filtered" if self.outlier_toggle else "all", {})
 
+    @database.locked
     def update_n_max(self):
         self.n_max = self.measurement_model.update_n_max()
         pub.sendMessage("update_n_max")
 
     def changed_settings(self):
         self.measurement_folder = settings.settings.measurement_folder()
+        # Another rule only has to be applied to the results we already have
+        if self.contacts and settings.settings.outlier_rule() != self.outlier_rule:
+            self.calculate_results()
+            pub.sendMessage("filter_outliers")
 
     def clear_cached_values(self):
         # TODO Figure out what can be cleared and when, perhaps I can use an argument to check the level of clearing
@@ -403,7 +503,11 @@ class Model():
         self.contact = None
         self.contacts.clear()
         self.selected_contacts.clear()
-        self.average_data.clear()
+        self.average.clear()
+        self.statistics = None
+        self.summary = {}
+        self.curves.clear()
+        self.outliers.clear()
         self.results.clear()
         self.max_results.clear()
         self.n_max = 0
@@ -0,0 +1,119 @@
+"""
+Loads a session on the database worker, so the GUI stays responsive while it's loading.
+Every measurement is a request of its own, that way the GUI can get to the database in between measurements
+and a load can be cancelled before it gets to the next one.
+"""
+import sys
+from collections import defaultdict
+
+from ..functions import gui
+from ..settings import settings
+from ..models import contactmodel, sessionmodel
+
+
+class SessionLoader(object):
+    """
+    Everything it loads is kept on the loader itself, the model only gets it once the loader is done,
+    by calling finished on the GUI thread. The generation tells the model whether the loader is still the
+    one it's waiting for, progress is called on the GUI thread as well.
+    The measurement_model is the one the model already made for this session, the loader only reads through it.
+    """
+    def __init__(self, subject_id, session_id, measurement_model, plates, filtering, outlier_rule, generation,
+                 progress, finished):
+        self.subject_id = subject_id
+        self.session_id = session_id
+        self.measurement_model = measurement_model
+        self.plates = plates
+        self.filtering = filtering
+        self.outlier_rule = outlier_rule
+        self.generation = generation
+        self.progress = progress
+        self.finished = finished
+
+        self.cancelled = False
+        self.error = None
+        self.futures = []
+        self.session_model = None
+        self.measurements = {}
+        self.contact_models = {}
+        self.contacts = defaultdict(list)
+        self.plate = None
+        self.n_max = 0
+        self.shape = None
+        self.average = sessionmodel.AverageData()
+        self.summary = {}
+        self.curves = sessionmodel.NormalizedCurves()
+        self.outliers = sessionmodel.OutlierFilter()
+        self.number_of_measurements = 0
+        self.loaded_measurements = 0
+
+    def start(self):
+        self.submit(self.load_measurements)
+
+    def cancel(self):
+        self.cancelled = True
+        for future in self.futures:
+            future.cancel()
+
+    def submit(self, function, *args):
+        self.futures.append(settings.settings.database_worker().submit(self.run_step, function, *args))
+
+    def run_step(self, table, function, *args):
+        if self.cancelled or self.error is not None:
+            return
+        try:
+            function(*args)
+        except Exception:
+            self.error = sys.exc_info()[1]
+            settings.settings.logger.exception("SessionLoader: Loading session {} failed".format(self.session_id))
+            gui.call_in_gui_thread(self.finished, self)
+
+    def load_measurements(self):
+        self.session_model = sessionmodel.Sessions(subject_id=self.subject_id)
+        self.measurements = self.measurement_model.get_measurements()
+        self.number_of_measurements = len(self.measurements)
+
+        for measurement in self.measurements.values():
+            contact_model = contactmodel.Contacts(subject_id=self.subject_id,
+                                                  session_id=self.session_id,
+                                                  measurement_id=measurement.measurement_id)
+            self.contact_models[measurement.measurement_name] = contact_model
+            # Like Model.get_plate, the model gets the plate of the last measurement
+            self.plate = self.plates[measurement.plate_id]
+            self.submit(self.load_contacts, measurement)
+
+        self.submit(self.calculate_results)
+
+    def load_contacts(self, measurement):
+        """
+        Check if the measurement has already been processed, if so retrieve its contacts
+        """
+        contact_model = self.contact_models[measurement.measurement_name]
+        plate = self.plates[measurement.plate_id]
+        contacts = contact_model.get_contacts(plate, measurement)
+        if contact_model.verify_contacts(contacts):
+            measurement_data = self.measurement_model.get_measurement_data(measurement)
+            contact_model.recalculate_results(contacts, plate, measurement, measurement_data)
+            # Given the stored data is dirty, store it
+            contact_model.create_contacts(contacts)
+
+        if contacts:
+            self.contacts[measurement.measurement_name] = contacts
+
+        self.loaded_measurements += 1
+        # The results at the end take about as long as a measurement
+        progress = int(100. * self.loaded_measurements / (self.number_of_measurements + 1))
+        gui.call_in_gui_thread(self.progress, self, progress)
+
+    def calculate_results(self):
+        if self.measurements:
+            self.n_max = self.measurement_model.update_n_max()
+            self.shape = self.session_model.calculate_shape(contacts=self.contacts)
+            # This updates contacts in place, before the average, because that might leave out the filtered contacts
+            self.session_model.calculate_results(contacts=self.contacts, outliers=self.outliers,
+                                                 rule=self.outlier_rule)
+            self.average.update(contacts=self.contacts, shape=self.shape, filtering=self.filtering)
+            # After calculate_results, because the filtered contacts are part of the key these are cached by
+            self.summary = self.session_model.get_summary(session_id=self.session_id, contacts=self.contacts,
+                                                          curves=self.curves)
+        gui.call_in_gui_thread(self.finished, self)
@@ -1,4 +1,5 @@
 import logging
+import hashlib
 from collections import defaultdict
 from itertools import izip
 import numpy as np
@@ -8,6 +9,50 @@ from ..settings import settings
 from ..functions import calculations, utility
 
 
+# The results the analysis widgets show for every label
+SUMMARY_COLUMNS = ["peak_force", "peak_pressure", "peak_surface", "vertical_impulse",
+                   "stance_duration", "stance_percentage", "step_duration", "step_length"]
+# The labels the asymmetry view compares, left against right
+ASYMMETRY_COMPARISONS = {
+    "front": ([0], [2]),
+    "hind": ([1], [3]),
+    "pt": ([0, 2], [1, 3]),
+}
+# The number of samples every series is normalized to, one for every percent of the contact
+INTERPOLATE_LENGTH = 101
+# How many contacts get resampled at once for the normalized average, which bounds the size of the padded stack
+INTERPOLATE_CHUNK_SIZE = 16
+# The results a contact is compared to the other contacts of its label on, when filtering outliers
+OUTLIER_COLUMNS = ["pressure", "force", "surface", "length"]
+
+
+def standard_deviation_bounds(values, num_std=1.96):
+    mean = np.mean(values, axis=0)
+    std = np.std(values, axis=0)
+    return mean - num_std * std, mean + num_std * std
+
+
+def median_absolute_deviation_bounds(values, num_mad=3.):
+    median = np.median(values, axis=0)
+    # Scaled so it matches the standard deviation for normally distributed values
+    mad = 1.4826 * np.median(np.abs(values - median), axis=0)
+    return median - num_mad * mad, median + num_mad * mad
+
+
+def interquartile_range_bounds(values, factor=1.5):
+    lower_quartile, upper_quartile = np.percentile(values, [25, 75], axis=0)
+    iqr = upper_quartile - lower_quartile
+    return lower_quartile - factor * iqr, upper_quartile + factor * iqr
+
+
+# Every rule takes the (n_contacts, n_columns) results of a label and returns a lower and upper bound per column
+OUTLIER_RULES = {
+    "sd": standard_deviation_bounds,
+    "mad": median_absolute_deviation_bounds,
+    "iqr": interquartile_range_bounds,
+}
+
+
 class Sessions(object):
     def __init__(self, subject_id):
         self.subject_id = subject_id
@@ -58,9 +103,10 @@ class Sessions(object):
         mz = 0
 
         # Iterate over the contacts and retrieve the overall size
+        # The dimensions are in the table, so we don't have to load the data of every contact
         for measurement_name, contacts in contacts.iteritems():
             for contact in contacts:
-                x, y, z = contact.data.shape
+                x, y, z = contact.width, contact.height, contact.length
                 if x > mx:
                     mx = x
                 if y > my:
@@ -73,130 +119,181 @@ class Sessions(object):
         my += 4
         return mx, my, mz
 
-    # TODO see when this function is being called and make sure it doesn't happen unnecessarily
-    # TODO perhaps I should even include -1, so I automatically get the correctly shaped current_contact
     def calculate_average_data(self, contacts, shape, filtering):
-        num_contacts = defaultdict(int)
-        mx, my, mz = shape
-        average_data = defaultdict(lambda: np.zeros(shape))
-        for measurement_name, contacts in contacts.iteritems():
-            for contact in contacts:
-                # Skip any contacts if we're filtering
-                if filtering and (contact.filtered or contact.invalid):
+        average = AverageData()
+        average.update(contacts=contacts, shape=shape, filtering=filtering)
+        return average.average_data
+
+    def calculate_statistics(self, contacts, shape, filtering):
+        """
+        The mean and variance of every label, in a single pass over the contacts.
+        Only one contact's data is needed at a time, so contacts restored from the database are read one by one
+        """
+        statistics = {}
+        for measurement_name, contact_list in contacts.iteritems():
+            for contact in contact_list:
+                contact_label = AverageData.get_label(contact, filtering)
+                if contact_label is None:
                     continue
-                if contact.contact_label >= 0:
-                    num_contacts[contact.contact_label] += 1
+                if contact_label not in statistics:
+                    statistics[contact_label] = RunningStatistics(shape)
+                statistics[contact_label].add(contact.data)
+        return statistics
+
+    def get_statistics(self, session_id, contacts, shape, filtering):
+        """
+        Returns the mean and variance of every label as {contact_label: (count, mean, variance)}.
+        They're cached in the session's group, so they're only calculated again if the contacts have changed
+        """
+        session_data_table = table.SessionDataTable(table=self.table, subject_id=self.subject_id,
+                                                    session_id=session_id)
+        key = contacts_key(contacts, shape=tuple(int(length) for length in shape), filtering=bool(filtering))
+        statistics = session_data_table.get_statistics(key)
+        if statistics is None:
+            statistics = {}
+            for contact_label, running_statistics in self.calculate_statistics(contacts, shape, filtering).items():
+                statistics[contact_label] = (running_statistics.count, running_statistics.mean,
+                                             running_statistics.variance())
+            session_data_table.store_statistics(key, statistics)
+        return statistics
+
+    def get_summary(self, session_id, contacts, curves=None):
+        """
+        Returns what the analysis widgets show, see calculate_summary. It's cached in the session's group,
+        so it's only calculated again if the labels or filtered contacts have changed
+        """
+        session_data_table = table.SessionDataTable(table=self.table, subject_id=self.subject_id,
+                                                    session_id=session_id)
+        key = contacts_key(contacts)
+        summary = session_data_table.get_summary(key)
+        if summary is None:
+            summary = self.calculate_summary(contacts, curves=curves)
+            session_data_table.store_summary(key, summary)
+        return summary
+
+    def calculate_summary(self, contacts, curves=None):
+        """
+        Everything the analysis widgets show, once for all contacts and once without the filtered ones:
+        - results: the mean and standard deviation of every column for every label
+        - asymmetry: the mean and standard deviation of the ASI's of every measurement for every comparison
+        - curves: the time normalized series of every contact of a label, see NormalizedCurves,
+          with their mean and std
+        - max: the longest contact and the highest pressure and force, to scale the plots
+        - average: the average contact of every label in normalized time, see calculate_normalized_average
+        Pass the NormalizedCurves you used last time, so only new contacts have to be resampled
+        """
+        if curves is None:
+            curves = NormalizedCurves()
+        curves.update(contacts)
+        shape = self.calculate_shape(contacts)
+        data_frame = self.create_dataframe(contacts)
+        summary = {}
+        for name, filtering in [("all", False), ("filtered", True)]:
+            rows = data_frame
+            if filtering:
+                rows = data_frame[(data_frame["filtered"] == False) & (data_frame["invalid"] == False)]
+            summary[name] = {
+                "results": self.summarize_results(rows),
+                "asymmetry": self.summarize_asymmetry(rows),
+                "curves": self.summarize_curves(curves.get_matrices(contacts, filtering)),
+                "max": curves.get_maximum(contacts, filtering),
+                "average": self.calculate_normalized_average(contacts, shape, filtering),
+            }
+        return summary
+
+    def calculate_normalized_average(self, contacts, shape, filtering):
+        """
+        Like calculate_average_data, but every contact is resampled to INTERPOLATE_LENGTH frames before averaging,
+        so contacts of different durations line up from start to end instead of frame by frame.
+        The contacts of a label are resampled INTERPOLATE_CHUNK_SIZE at a time in float32 and summed as we go,
+        so a label with hundreds of contacts doesn't need a padded copy of all of them at once
+        """
+        mx, my, mz = shape
+        labeled = defaultdict(list)
+        for measurement_name, contact_list in contacts.iteritems():
+            for contact in contact_list:
+                contact_label = AverageData.get_label(contact, filtering)
+                if contact_label is not None:
+                    labeled[contact_label].append(contact)
+
+        average = {}
+        for contact_label, contact_list in labeled.items():
+            total = np.zeros((mx, my, INTERPOLATE_LENGTH), dtype=np.float32)
+            for start in range(0, len(contact_list), INTERPOLATE_CHUNK_SIZE):
+                chunk = contact_list[start:start + INTERPOLATE_CHUNK_SIZE]
+                lengths = [contact.data.shape[2] for contact in chunk]
+                # Only as long as the longest contact of this chunk
+                data = np.zeros((len(chunk), mx, my, max(lengths)), dtype=np.float32)
+                for index, contact in enumerate(chunk):
                     x, y, z = contact.data.shape
                     offset_x = int((mx - x) / 2)
                     offset_y = int((my - y) / 2)
-                    data = average_data[contact.contact_label]
-                    data[offset_x:offset_x + x, offset_y:offset_y + y, :z] += contact.data
-
-        for contact_label, data in average_data.iteritems():
-            if num_contacts[contact_label] > 0:
-                weight = 1. / num_contacts[contact_label]
-                average_data[contact_label] = np.multiply(data, weight)
-
-        return average_data
-
-    def calculate_results(self, contacts):
-        # TODO Do I really need to do this here? Its not like I'm really calculating anything
-        results = defaultdict(lambda: defaultdict(list))
-        max_results = defaultdict()
-
-        for measurement_name, contact_list in contacts.iteritems():
+                    data[index, offset_x:offset_x + x, offset_y:offset_y + y, :z] = contact.data
+                resampled = calculations.interpolate_contacts_batch(data, lengths, INTERPOLATE_LENGTH)
+                total += np.sum(resampled, axis=0)
+            average[contact_label] = total / len(contact_list)
+        return average
+
+    def summarize_results(self, data_frame):
+        results = {}
+        for contact_label, data in data_frame.groupby("contact_label"):
+            if contact_label < 0:
+                continue
+            results[int(contact_label)] = dict((column, (np.mean(data[column].dropna()), np.std(data[column].dropna())))
+                                               for column in SUMMARY_COLUMNS)
+        return results
+
+    def summarize_asymmetry(self, data_frame):
+        summary = asymmetry_summary(asymmetry_report(data_frame))
+        asymmetry = {}
+        for comparison in ASYMMETRY_COMPARISONS:
+            asymmetry[comparison] = {}
+            for column in SUMMARY_COLUMNS:
+                # Without any measurement that has all the labels, there's nothing to summarize
+                if len(summary):
+                    asymmetry[comparison][column] = (float(summary[(comparison, column, "mean")].iloc[0]),
+                                                     float(summary[(comparison, column, "std")].iloc[0]))
+                else:
+                    asymmetry[comparison][column] = (np.nan, np.nan)
+        return asymmetry
+
+    def summarize_curves(self, matrices):
+        for contact_label, curve in matrices.items():
+            for item_id in NormalizedCurves.series:
+                curve["mean_{}".format(item_id)] = np.mean(curve[item_id], axis=0)
+                curve["std_{}".format(item_id)] = np.std(curve[item_id], axis=0)
+        return matrices
+
+    def calculate_results(self, contacts, outliers=None, rule="sd"):
+        """
+        Marks the labeled contacts that are outliers of their label as filtered, this updates contacts in place.
+        Pass an OutlierFilter to hold on to the results of the contacts, so they don't have to be collected again
+        """
+        if outliers is None:
+            outliers = OutlierFilter()
+        outliers.update(contacts)
+        outliers.apply(rule)
+
+    def create_dataframe(self, contacts):
+        """
+        One row with the results of every contact, for the analysis widgets
+        """
+        # pandas takes a while to import and we only need it once we get to the analysis
+        import pandas as pd
+
+        results = []
+        for measurement_id, contact_list in contacts.items():
             for contact in contact_list:
-                if contact.contact_label >= 0:
-                    force = contact.force_over_time
-                    results[contact.contact_label]["force"].append(force)
-                    max_force = np.max(force)
-                    if max_force > max_results.get("force", 0):
-                        max_results["force"] = max_force
-
-                    pressure = contact.pressure_over_time
-                    results[contact.contact_label]["pressure"].append(pressure)
-                    max_pressure = np.max(pressure)
-                    if max_pressure > max_results.get("pressure", 0):
-                        max_results["pressure"] = max_pressure
-
-                    surface = contact.surface_over_time
-                    results[contact.contact_label]["surface"].append(surface)
-                    max_surface = np.max(surface)
-                    if max_surface > max_results.get("surface", 0):
-                        max_results["surface"] = max_surface
-
-                    cop_x = contact.cop_x
-                    cop_y = contact.cop_y
-                    results[contact.contact_label]["cop"].append((cop_x, cop_y))
-
-                    length = contact.length
-                    results[contact.contact_label]["length"].append(length)
-                    if length > max_results.get("length", 0):
-                        max_results["length"] = length
-
-        # Calculate the bounds based on all the (labeled) contacts
-        lower_bound, upper_bound = self.calculate_bounds(results)
+                row = [measurement_id, contact.contact_id, contact.contact_label, contact.invalid, contact.filtered,
+                       contact.peak_force, contact.peak_pressure, contact.peak_surface, contact.vertical_impulse,
+                       contact.stance_duration, contact.stance_percentage, contact.step_duration, contact.step_length]
+                results.append(row)
 
-        for measurement_name, contact_list in contacts.iteritems():
-            for contact in contact_list:
-                if contact.contact_label >= 0:
-                    pressure = np.max(contact.pressure_over_time)
-                    force = np.max(contact.force_over_time)
-                    surface = np.max(contact.surface_over_time)
-                    length = contact.length
-
-                    lower_bound_pressure = lower_bound[contact.contact_label]["pressure"]
-                    upper_bound_pressure = upper_bound[contact.contact_label]["pressure"]
-                    lower_bound_force = lower_bound[contact.contact_label]["force"]
-                    upper_bound_force = upper_bound[contact.contact_label]["force"]
-                    lower_bound_surface = lower_bound[contact.contact_label]["surface"]
-                    upper_bound_surface = upper_bound[contact.contact_label]["surface"]
-                    lower_bound_length = lower_bound[contact.contact_label]["length"]
-                    upper_bound_length = upper_bound[contact.contact_label]["length"]
-
-                    # TODO This is what its all really about!
-
-                    if not (lower_bound_pressure < pressure < upper_bound_pressure and
-                                        lower_bound_force < force < upper_bound_force and
-                                        lower_bound_surface < surface < upper_bound_surface and
-                                        lower_bound_length < length < upper_bound_length):
-                        contact.filtered = True
-                    else:
-                        contact.filtered = False
-
-        return results, max_results
-
-    def calculate_bounds(self, results, num_std=1.96):
-        lower_bound = defaultdict(lambda: defaultdict(list))
-        upper_bound = defaultdict(lambda: defaultdict(list))
-        for contact_label, values in results.iteritems():
-            pressure = [np.max(p) for p in values["pressure"]]
-            force = [np.max(f) for f in values["force"]]
-            surface = [np.max(s) for s in values["surface"]]
-            duration = [d for d in values["length"]]
-
-            # Get mean +/- num_std's * std
-            mean_length = np.mean(pressure)
-            std_length = np.std(pressure)
-            lower_bound[contact_label]["pressure"] = mean_length - num_std * std_length
-            upper_bound[contact_label]["pressure"] = mean_length + num_std * std_length
-
-            mean_forces = np.mean(force)
-            std_forces = np.std(force)
-            lower_bound[contact_label]["force"] = mean_forces - num_std * std_forces
-            upper_bound[contact_label]["force"] = mean_forces + num_std * std_forces
-
-            mean_surface = np.mean(surface)
-            std_surface = np.std(surface)
-            lower_bound[contact_label]["surface"] = mean_surface - num_std * std_surface
-            upper_bound[contact_label]["surface"] = mean_surface + num_std * std_surface
-
-            mean_duration = np.mean(duration)
-            std_duration = np.std(duration)
-            lower_bound[contact_label]["length"] = mean_duration - num_std * std_duration
-            upper_bound[contact_label]["length"] = mean_duration + num_std * std_duration
-
-        return lower_bound, upper_bound
+        return pd.DataFrame(results,
+                            columns=["measurement_id", "contact_id", "contact_label", "invalid", "filtered",
+                                     "peak_force", "peak_pressure", "peak_surface", "vertical_impulse",
+                                     "stance_duration", "stance_percentage", "step_duration", "step_length",
+                                     ])
 
     def create_session_data(self, average_contact):
         # Get the label we're dealing with
@@ -218,16 +315,349 @@ class Sessions(object):
             self.contact_group = self.sessions_table.create_group(parent=self.session_group, item_id=contact_label)
 
         for item_id, data in results.iteritems():
+            # The average contact and its max_of_max are read as a whole, the rest are series
+            kind = "contact" if item_id in ("data", "max_of_max") else "series"
             result = self.sessions_table.get_data(group=self.contact_group, item_id=item_id)
             if not result:
                 self.sessions_table.store_data(group=self.contact_group,
                                                item_id=item_id,
-                                               data=data)
+                                               data=data,
+                                               kind=kind)
             elif not np.array_equal(result, data):
                 print "Stored session data is not equal to new data"
                 self.sessions_table.store_data(group=self.contact_group,
                                                item_id=item_id,
-                                               data=data)
+                                               data=data,
+                                               kind=kind)
+
+
+class MockSessions(Sessions):
+    def __init__(self, subject_id):
+        self.subject_id = subject_id
+        # We don't want to call super, because we don't want a table connection
+
+
+def asymmetry_report(data_frame, by=("measurement_id",), comparisons=ASYMMETRY_COMPARISONS, columns=SUMMARY_COLUMNS):
+    """
+    The ASI of every comparison for every column, for every group of contacts (a measurement by default).
+    This works on Sessions.create_dataframe, but also on table.query_contacts, so with
+    by=["session_id", "measurement_id"] it does all sessions at once. Returns a DataFrame with a row for every group
+    and a (comparison, column) column, NaN where a label is missing or its results are still at their default
+    """
+    import pandas as pd
+
+    by = list(by)
+    labels = sorted(set(contact_label for left_labels, right_labels in comparisons.values()
+                        for contact_label in left_labels + right_labels))
+    labeled = data_frame[data_frame["contact_label"] >= 0]
+    if len(labeled):
+        means = labeled.groupby(by + ["contact_label"])[columns].mean().unstack("contact_label")
+    else:
+        means = pd.DataFrame(index=pd.MultiIndex.from_arrays([[]] * len(by), names=by))
+    # Missing labels become NaN columns, so their comparisons come out as NaN too
+    means = means.reindex(columns=pd.MultiIndex.from_product([columns, labels]))
+
+    asi = {}
+    for comparison, (left_labels, right_labels) in comparisons.items():
+        left = sum(means.xs(contact_label, axis=1, level=1) for contact_label in left_labels)
+        right = sum(means.xs(contact_label, axis=1, level=1) for contact_label in right_labels)
+        # Somehow one or the other can have an opposite sign, so make them absolute
+        if "step_length" in columns:
+            left["step_length"] = left["step_length"].abs()
+            right["step_length"] = right["step_length"].abs()
+        # Only calculate the ASI if we've progressed from the default
+        asi[comparison] = calculations.asymmetry_index(left, right).where((left > 0) & (right > 0))
+    return pd.concat(asi, axis=1, names=["comparison", "column"]).sort_index(axis=1)
+
+
+def asymmetry_summary(report, by=None):
+    """
+    The mean and standard deviation of the ASI's of an asymmetry_report, over all its rows or for every value of by,
+    like session_id. Returns a DataFrame with a (comparison, column, "mean"/"std") column
+    """
+    import pandas as pd
+
+    keys = report.index.get_level_values(by) if by else np.zeros(len(report), dtype=int)
+    grouped = report.groupby(keys)
+    summary = pd.concat({"mean": grouped.mean(), "std": grouped.std(ddof=0)}, axis=1)
+    return summary.reorder_levels([1, 2, 0], axis=1).sort_index(axis=1)
+
+
+class AverageData(object):
+    """
+    Keeps a running sum and count of the contacts of every label, so when a contact gets (re)labeled,
+    marked invalid or filtered, only that contact has to be subtracted or added again.
+    Everything only gets summed again when the shape of the session changes.
+    """
+    def __init__(self):
+        self.shape = None
+        self.sums = {}
+        self.counts = defaultdict(int)
+        self.average_data = defaultdict()
+        # The contact and the label it was added to, or None if it wasn't, for every contact we've seen
+        self.labels = {}
+
+    def clear(self):
+        self.shape = None
+        self.sums.clear()
+        self.counts.clear()
+        self.average_data.clear()
+        self.labels.clear()
+
+    @staticmethod
+    def get_label(contact, filtering):
+        if contact.contact_label < 0:
+            return None
+        # Skip any contacts if we're filtering
+        if filtering and (contact.filtered or contact.invalid):
+            return None
+        return contact.contact_label
+
+    def add(self, contact, contact_label, weight):
+        mx, my, mz = self.shape
+        x, y, z = contact.data.shape
+        offset_x = int((mx - x) / 2)
+        offset_y = int((my - y) / 2)
+        if contact_label not in self.sums:
+            self.sums[contact_label] = np.zeros(self.shape)
+        data = self.sums[contact_label][offset_x:offset_x + x, offset_y:offset_y + y, :z]
+        if weight > 0:
+            data += contact.data
+        else:
+            data -= contact.data
+        self.counts[contact_label] += weight
+
+    def update(self, contacts, shape, filtering):
+        """
+        Updates average_data in place and returns the labels whose average changed
+        """
+        if shape != self.shape:
+            self.clear()
+            self.shape = shape
+
+        changed = set()
+        labels = {}
+        for measurement_name, contact_list in contacts.iteritems():
+            for contact in contact_list:
+                contact_label = self.get_label(contact, filtering)
+                labels[id(contact)] = (contact, contact_label)
+                _, old_label = self.labels.pop(id(contact), (contact, None))
+                if old_label == contact_label:
+                    continue
+                if old_label is not None:
+                    self.add(contact, old_label, -1)
+                    changed.add(old_label)
+                if contact_label is not None:
+                    self.add(contact, contact_label, 1)
+                    changed.add(contact_label)
+
+        # Whatever is left are contacts that are gone, like after tracking a measurement again
+        for contact, old_label in self.labels.itervalues():
+            if old_label is not None:
+                self.add(contact, old_label, -1)
+                changed.add(old_label)
+        self.labels = labels
+
+        for contact_label in changed:
+            if self.counts[contact_label] > 0:
+                weight = 1. / self.counts[contact_label]
+                self.average_data[contact_label] = np.multiply(self.sums[contact_label], weight)
+            else:
+                # Start from zero again, so there's no rounding errors left behind
+                del self.sums[contact_label]
+                del self.counts[contact_label]
+                self.average_data.pop(contact_label, None)
+        return changed
+
+
+class NormalizedCurves(object):
+    """
+    The series of every contact resampled to INTERPOLATE_LENGTH samples, so they can be compared in normalized time.
+    Every contact only gets resampled once: all new contacts together, in one batch per series.
+    When a contact gets another label, its rows simply end up in the matrix of that label.
+    This assumes a contact's series don't change, tracking a measurement again gives us new contacts anyway
+    """
+    series = ["force", "pressure", "surface", "cop_x", "cop_y"]
+
+    def __init__(self):
+        # For every contact we've seen: the contact, its resampled series, its length and the maximum of its series
+        self.rows = {}
+
+    def clear(self):
+        self.rows.clear()
+
+    def get_series(self, contact, item_id):
+        if item_id in ("cop_x", "cop_y"):
+            data = getattr(contact, item_id, None)
+            # Missing results show up as NaN, instead of as a COP in the corner
+            return np.array([np.nan]) if data is None else data
+        # Pad the series, so they start and end at zero
+        return np.pad(getattr(contact, "{}_over_time".format(item_id)), 1, mode="constant", constant_values=0)
+
+    def update(self, contacts):
+        contact_list = [contact for measurement_name, contact_list in contacts.iteritems() for contact in contact_list]
+        current = set(id(contact) for contact in contact_list)
+        for key in list(self.rows.keys()):
+            if key not in current:
+                del self.rows[key]
+
+        new_contacts = [contact for contact in contact_list if id(contact) not in self.rows]
+        if not new_contacts:
+            return
+        series = dict((item_id, [self.get_series(contact, item_id) for contact in new_contacts])
+                      for item_id in NormalizedCurves.series)
+        resampled = dict((item_id, calculations.interpolate_time_series_batch(series[item_id], INTERPOLATE_LENGTH))
+                         for item_id in NormalizedCurves.series)
+        for index, contact in enumerate(new_contacts):
+            rows = dict((item_id, resampled[item_id][index]) for item_id in NormalizedCurves.series)
+            maximum = dict((item_id, float(np.max(series[item_id][index]))) for item_id in ["pressure", "force"])
+            self.rows[id(contact)] = (contact, rows, len(series["pressure"][index]), maximum)
+
+    def included(self, contacts, filtering):
+        for measurement_name, contact_list in contacts.iteritems():
+            for contact in contact_list:
+                if not (filtering and (contact.filtered or contact.invalid)):
+                    yield self.rows[id(contact)]
+
+    def get_matrices(self, contacts, filtering):
+        """
+        Returns {contact_label: {series: (n_contacts, INTERPOLATE_LENGTH) matrix, "length": the length of every contact}}
+        """
+        rows = defaultdict(list)
+        for contact, contact_rows, length, maximum in self.included(contacts, filtering):
+            if contact.contact_label >= 0:
+                rows[contact.contact_label].append((contact_rows, length))
+
+        matrices = {}
+        for contact_label, label_rows in rows.items():
+            matrices[contact_label] = dict((item_id, np.array([contact_rows[item_id] for contact_rows, _ in label_rows]))
+                                           for item_id in NormalizedCurves.series)
+            matrices[contact_label]["length"] = np.array([length for _, length in label_rows])
+        return matrices
+
+    def get_maximum(self, contacts, filtering):
+        """
+        The longest contact and the highest pressure and force, labeled or not
+        """
+        maximum = {"duration": 0, "pressure": 0., "force": 0.}
+        for contact, contact_rows, length, contact_maximum in self.included(contacts, filtering):
+            maximum["duration"] = max(maximum["duration"], length)
+            for item_id, value in contact_maximum.items():
+                maximum[item_id] = max(maximum[item_id], value)
+        return maximum
+
+
+class OutlierFilter(object):
+    """
+    The OUTLIER_COLUMNS of every labeled contact as one array, so applying a (different) rule takes
+    one array operation per label instead of going through every contact again.
+    Like NormalizedCurves, this assumes a contact's results don't change once we've seen it
+    """
+    def __init__(self):
+        # For every contact we've seen: the contact and its row
+        self.rows = {}
+        self.contacts = []
+        self.labels = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros((0, len(OUTLIER_COLUMNS)))
+
+    def clear(self):
+        self.rows.clear()
+        self.contacts = []
+        self.labels = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros((0, len(OUTLIER_COLUMNS)))
+
+    def get_row(self, contact):
+        # The peaks are the maxima of the series, but they're stored with the contact, so we don't load any arrays
+        return [contact.peak_pressure, contact.peak_force, contact.peak_surface, contact.length]
+
+    def update(self, contacts):
+        rows = {}
+        self.contacts = []
+        for measurement_name, contact_list in contacts.iteritems():
+            for contact in contact_list:
+                if contact.contact_label < 0:
+                    continue
+                key = id(contact)
+                rows[key] = self.rows[key] if key in self.rows else (contact, self.get_row(contact))
+                self.contacts.append(contact)
+        # Contacts that are gone, like after tracking a measurement again, are dropped
+        self.rows = rows
+
+        self.labels = np.array([contact.contact_label for contact in self.contacts], dtype=np.int64)
+        self.values = np.array([self.rows[id(contact)][1] for contact in self.contacts], dtype=np.float64)
+        self.values = self.values.reshape(len(self.contacts), len(OUTLIER_COLUMNS))
+
+    def outliers(self, rule="sd"):
+        """
+        Returns a boolean for every contact, True if any of its results falls outside the bounds of its label
+        """
+        bounds = OUTLIER_RULES[rule]
+        outliers = np.zeros(len(self.contacts), dtype=bool)
+        for contact_label in np.unique(self.labels):
+            mask = self.labels == contact_label
+            values = self.values[mask]
+            lower_bound, upper_bound = bounds(values)
+            # A result that's the same for every contact can't tell us which ones are outliers
+            spread = upper_bound > lower_bound
+            inside = (lower_bound < values) & (values < upper_bound)
+            outliers[mask] = ~np.all(inside | ~spread, axis=1)
+        return outliers
+
+    def apply(self, rule="sd"):
+        for contact, filtered in izip(self.contacts, self.outliers(rule)):
+            contact.filtered = bool(filtered)
+
+
+class RunningStatistics(object):
+    """
+    Welford's algorithm for the pixel-wise mean and variance of the contacts of a label, one contact at a time.
+    Everything is float32, which is plenty for pressures and halves the memory of the average contacts
+    """
+    def __init__(self, shape):
+        self.shape = shape
+        self.count = 0
+        self.mean = np.zeros(shape, dtype=np.float32)
+        self.m2 = np.zeros(shape, dtype=np.float32)
+        # Every contact gets padded into this, so we don't need a new array for each one
+        self.padded = np.zeros(shape, dtype=np.float32)
+
+    def add(self, data):
+        mx, my, mz = self.shape
+        x, y, z = data.shape
+        offset_x = int((mx - x) / 2)
+        offset_y = int((my - y) / 2)
+        self.padded.fill(0)
+        self.padded[offset_x:offset_x + x, offset_y:offset_y + y, :z] = data
+
+        self.count += 1
+        delta = self.padded - self.mean
+        self.mean += delta / self.count
+        # The second delta uses the new mean
+        self.padded -= self.mean
+        self.m2 += delta * self.padded
+
+    def variance(self):
+        if self.count == 0:
+            return np.zeros(self.shape, dtype=np.float32)
+        return self.m2 / self.count
+
+
+def contacts_key(contacts, **kwargs):
+    """
+    A hash of everything the results of a session depend on: the label, state, length and summarized results of
+    every contact, plus anything else that's passed, like the shape or the filtering
+    """
+    key = hashlib.md5()
+    key.update(repr(sorted(kwargs.items())).encode("utf-8"))
+    for measurement_name in sorted(contacts.keys()):
+        for contact in contacts[measurement_name]:
+            state = (measurement_name, contact.contact_id, int(contact.contact_label), bool(contact.invalid),
+                     bool(contact.filtered))
+            # Tracking the contacts again or recalculating their results doesn't change their ids or labels
+            values = [getattr(contact, column, None) for column in ["length"] + SUMMARY_COLUMNS]
+            values = tuple(None if value is None else float(value) for value in values)
+            key.update(repr(state + values).encode("utf-8"))
+    return key.hexdigest()
 
 
 class Session(object):
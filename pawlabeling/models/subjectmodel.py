@@ -36,7 +36,7 @@ class Subjects(object):
         self.subjects_table.remove_row(table=self.subjects_table.subjects_table,
                                        name_id="subject_id",
                                        item_id=subject.subject_id)
-        self.subjects_table.remove_group(where="/", name=subject.subject_id)
+        self.subjects_table.remove_subject_group(subject.subject_id)
 
         # If we've removed all the sessions, clean up after yourself
         try:
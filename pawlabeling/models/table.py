@@ -1,35 +1,198 @@
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+import inspect
+import os
+import threading
+import numpy as np
 import tables
 from tables.exceptions import ClosedNodeError, NoSuchNodeError, NodeError
 
+# Increase this whenever the layout of the tables changes, so check_schema knows to update older databases
+SCHEMA_VERSION = 2
+# The size we aim for when chunking arrays, small enough to decompress quickly, large enough to compress well
+CHUNK_BYTES = 64 * 1024
+# The compression settings a database can use, it remembers its profile in the storage_profile attribute of its root.
+# Lower levels make writing a lot cheaper for a little more disk space, so use fast when importing lots of data
+# and repack to archival when you're done with it
+STORAGE_PROFILES = {
+    "fast": dict(complib="blosc", complevel=1),
+    "balanced": dict(complib="blosc", complevel=5),
+    "archival": dict(complib="zlib", complevel=9),
+}
+DEFAULT_STORAGE_PROFILE = "balanced"
+
+# PyTables isn't thread-safe and the GUI thread shares its file handle with the DatabaseWorker (see database.py),
+# so anything that uses a handle has to hold this. Every method of a Table does so by itself
+hdf5_lock = threading.RLock()
+
+
+def locked(function):
+    """
+    For code that uses the database outside of a Table, so it doesn't run in the middle of somebody else's request
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with hdf5_lock:
+            return function(*args, **kwargs)
+    return wrapper
+
+
+class LockedMethods(type):
+    """
+    Wraps every method of the class in locked, so none of the Table subclasses can forget to take the lock
+    """
+    def __new__(metaclass, name, bases, attributes):
+        for key, value in list(attributes.items()):
+            if inspect.isfunction(value):
+                attributes[key] = locked(value)
+        return super(LockedMethods, metaclass).__new__(metaclass, name, bases, attributes)
+
+
 class MissingIdentifier(Exception):
     pass
 
+
+class WriteBatch(object):
+    """
+    Keeps track of everything written inside Table.write_batch.
+    The rows are only appended when the batch is committed, groups and arrays are written straight away,
+    but can be undone using PyTables' undo mechanism.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.rows = []
+        self.enabled_undo = False
+        self.mark = None
+
+    def begin(self):
+        # If someone else already enabled undo, we just add our own mark
+        if not self.table.is_undo_enabled():
+            self.table.enable_undo()
+            self.enabled_undo = True
+        self.mark = self.table.mark()
+
+    def find_rows(self, table, column_name, value):
+        """
+        Returns the pending rows for this table where column_name equals value
+        """
+        return [row for pending_table, row in self.rows
+                if pending_table is table and row.get(column_name) == value]
+
+    def commit(self):
+        for table, kwargs in self.rows:
+            append_row(table, kwargs)
+        self.rows = []
+        self.table.flush()
+        self.end()
+
+    def rollback(self):
+        self.rows = []
+        self.table.undo(self.mark)
+        self.end()
+
+    def end(self):
+        # Disabling undo also cleans up the undo log
+        if self.enabled_undo:
+            self.table.disable_undo()
+
+
+# The shard files we've opened, by the name of their master file and their subject id
+shards = {}
+
+# Batches are shared by every Table using the same file, so they're looked up by the file handle
+write_batches = {}
+
 # I should add some helper function to check if something can be found, if not raise an exception or log something
-class Table(object):
+# Creating the base like this works on both Python 2 and 3, unlike the __metaclass__ attribute
+class Table(LockedMethods("LockedTable", (object,), {})):
+    # The column holding the ids we hand out in get_new_id
+    id_column = None
+
     def __init__(self, table):
         # The settings has a table connection, we just create a copy of that
         # So not every subclass of this Table class will create its own copy
         self.table = table
         self.table_name = "table"
-        self.filters = tables.Filters(complib="blosc", complevel=9)
-        self.table.filters = self.filters
+        self.filters = storage_filters(get_storage_profile(table))
+        # Snapshots are opened read-only, see access.py
+        if self.table.mode != "r":
+            self.table.filters = self.filters
 
     def create_row(self, table, **kwargs):
-        row = table.row
-
-        for attr, value in kwargs.items():
-            row[attr] = value
+        # Keep the id counter in step with the rows, so get_new_id never has to scan the table.
+        # Every row counts, just like when we used the number of rows as the lower bound
+        if self.id_column in kwargs:
+            last_id = max(get_last_id(table, self.id_column) + 1, parse_id(kwargs[self.id_column]))
+
+        batch = write_batches.get(self.table)
+        if batch is not None:
+            # The row gets appended when the batch is committed
+            batch.rows.append((table, kwargs))
+        else:
+            append_row(table, kwargs)
 
-        # Append the row to the table
-        row.append()
+        if self.id_column in kwargs:
+            table.attrs.last_id = last_id
         # Flush the changes
+        self.flush(table)
+
+    def flush(self, table=None):
+        """
+        Flush the changes, unless we're inside a write batch, then they get flushed once at the end
+        """
+        if self.table in write_batches:
+            return
+        if table is None:
+            table = self.table
         table.flush()
 
+    @contextmanager
+    def write_batch(self):
+        """
+        Everything written inside the with block gets flushed once, when it ends.
+        If an exception is raised, the buffered rows are dropped and any groups or arrays that were
+        created or removed are rolled back. Updating or removing rows that were already written can't be undone.
+        Nested batches are simply part of the outer batch.
+        """
+        # The whole batch holds the lock, so another thread's writes don't end up in (or get rolled back with) it
+        with hdf5_lock:
+            batch = write_batches.get(self.table)
+            if batch is not None:
+                yield batch
+                return
+
+            batch = WriteBatch(self.table)
+            write_batches[self.table] = batch
+            try:
+                batch.begin()
+                yield batch
+                batch.commit()
+            except BaseException:
+                batch.rollback()
+                raise
+            finally:
+                del write_batches[self.table]
+
+    def next_id(self, table):
+        """
+        Returns the id following the table's last_id counter
+        """
+        return "{}_{}".format(self.table_name, get_last_id(table, self.id_column) + 1)
+
     def check_availability(self, table, column_name, value):
-        for row in table:
-            if row[column_name] == value[column_name]:
-                raise AssertionError("Value in {} {} already taken!".format(table, column_name))
+        batch = write_batches.get(self.table)
+        pending_rows = batch.find_rows(table, column_name, value[column_name]) if batch is not None else []
+        if len(self.find_rows(table, column_name, value[column_name])) or pending_rows:
+            raise AssertionError("Value in {} {} already taken!".format(table, column_name))
+
+    def find_rows(self, table, column_name, value):
+        """
+        Returns the row numbers where column_name equals value.
+        The value is passed as a condition variable, so the query can use the column's index
+        """
+        condition = "({} == value)".format(column_name)
+        return table.get_where_list(condition, condvars={"value": value})
 
     def create_group(self, parent, item_id):
         # If the group already exists, delete it
@@ -38,20 +201,27 @@ class Table(object):
         except:
             self.table.remove_node(where=parent, name=item_id, recursive=True)
             group = self.table.create_group(where=parent, name=item_id)
-        self.table.flush()
+        self.flush()
         return group
 
     def search_table(self, table, **kwargs):
-        # Create a query out of the kwargs
-        query = " & ".join(
-            ["({} == '{}')".format(key, value) for key, value in kwargs.items() if value != ""])
-        rows = table.read_where(query)
+        # Create a query out of the kwargs, the values are passed as condvars so PyTables can use the indexes
+        conditions = []
+        condvars = {}
+        for index, (key, value) in enumerate(kwargs.items()):
+            if value == "":
+                continue
+            name = "value_{}".format(index)
+            conditions.append("({} == {})".format(key, name))
+            condvars[name] = value
+        query = " & ".join(conditions)
+        rows = table.where(query, condvars=condvars) if conditions else table.iterrows()
 
         results = []
         for row in rows:
             result = defaultdict()
-            for key, value in zip(table.colnames, row):
-                result[key] = value
+            for key in table.colnames:
+                result[key] = row[key]
             results.append(result)
 
         # It can happen that there's nothing to return
@@ -63,13 +233,16 @@ class Table(object):
 
     # This function can be used for measurement_data, contact_data and normalized_contact_data
     # Actually also for all the different results (at least the time series)
-    def store_data(self, group, item_id, data):
+    def store_data(self, group, item_id, data, kind=None):
+        """
+        The kind of array (measurement, contact or series) determines its chunk shape, see chunk_shape
+        """
         atom = tables.Atom.from_dtype(data.dtype)
-        filters = tables.Filters(complib="blosc", complevel=9)
-        data_array = self.table.create_carray(where=group, name=item_id,
-                                             atom=atom, shape=data.shape, filters=filters)
+        chunkshape = chunk_shape(kind, data.shape, data.dtype.itemsize)
+        data_array = self.table.create_carray(where=group, name=item_id, atom=atom, shape=data.shape,
+                                              filters=self.filters, chunkshape=chunkshape)
         data_array[:] = data
-        self.table.flush()
+        self.flush()
 
     def get_group(self, parent, group_id):
         return parent.__getattr__(group_id)
@@ -82,7 +255,7 @@ class Table(object):
     def remove_group(self, where, name, recursive=True):
         # Recursive remove is on by default
         self.table.remove_node(where=where, name=name, recursive=recursive)
-        self.table.flush()
+        self.flush()
 
     def remove_row(self, table, name_id, item_id):
         """
@@ -90,15 +263,44 @@ class Table(object):
         # Note removing a single row can be done using the specific remove_row() method.
         This should receive the index of the row to remove
         """
-        condition = "({} == '{}')".format(name_id, item_id)
-        index = table.get_where_list(condition)[0]
+        index = self.find_rows(table, name_id, item_id)[0]
         try:
             table.remove_rows(start=index, stop=index+1)
         except NotImplementedError:
             # If we're removing the last row, we can just delete the whole table
             self.table.remove_node(where=table, recursive=True)
 
-        self.table.flush()
+        self.flush()
+
+    def update_row(self, table, name_id, item_id, **kwargs):
+        """
+        Update the row(s) where name_id equals item_id in place.
+        Returns False if there was no such row
+        """
+        # Rows that are waiting in a write batch can simply be changed before they get written
+        batch = write_batches.get(self.table)
+        if batch is not None:
+            pending_rows = batch.find_rows(table, name_id, item_id)
+            for row in pending_rows:
+                row.update(kwargs)
+            if pending_rows:
+                return True
+
+        coordinates = self.find_rows(table, name_id, item_id)
+        if not len(coordinates):
+            return False
+
+        for index in coordinates:
+            rows = table.read(start=index, stop=index + 1)
+            # Only write the columns that actually changed, else every index gets marked dirty and rebuilt
+            names = [key for key, value in kwargs.items() if key != name_id and rows[key][0] != value]
+            if not names:
+                continue
+            for key in names:
+                rows[key] = kwargs[key]
+            table.modify_columns(start=index, stop=index + 1, columns=[rows[key] for key in names], names=names)
+        self.flush(table)
+        return True
 
     def close_table(self):
         """
@@ -109,6 +311,9 @@ class Table(object):
 
 
 class SubjectsTable(Table):
+    id_column = "subject_id"
+    index_columns = ["subject_id", "first_name", "last_name", "birthday"]
+
     class Subjects(tables.IsDescription):
         subject_id = tables.StringCol(64)
         first_name = tables.StringCol(32)
@@ -131,6 +336,7 @@ class SubjectsTable(Table):
         else:
             self.subjects_table = self.table.root.subjects
 
+        create_indexes(self.subjects_table, self.index_columns)
         self.column_names = self.subjects_table.colnames
 
     def create_subject(self, **kwargs):
@@ -141,19 +347,20 @@ class SubjectsTable(Table):
         self.check_availability(self.subjects_table, "subject_id", kwargs)
 
         self.create_row(self.subjects_table, **kwargs)
+        # In the sharded layout the subject's group lives in its own file
+        if is_sharded(self.table):
+            return get_shard(self.table, kwargs["subject_id"]).root.__getattr__(kwargs["subject_id"])
         group = self.create_group(parent=self.table.root, item_id=kwargs["subject_id"])
         return group
 
-    def get_new_id(self):
-        subjects = self.get_subjects()
-        max_id = len(subjects)
-        for subject in subjects:
-            subject_id = int(subject["subject_id"].split("_")[-1])
-            if subject_id > max_id:
-                max_id = subject_id
+    def remove_subject_group(self, subject_id):
+        if is_sharded(self.table):
+            remove_shard(self.table, subject_id)
+        else:
+            self.remove_group(where="/", name=subject_id)
 
-        max_id += 1
-        return "{}_{}".format(self.table_name, max_id)
+    def get_new_id(self):
+        return self.next_id(self.subjects_table)
 
     def get_subject(self, plate="", last_name="", birthday=""):
         return self.search_table(self.subjects_table, first_name=plate,
@@ -171,6 +378,9 @@ class SubjectsTable(Table):
 
 
 class SessionsTable(Table):
+    id_column = "session_id"
+    index_columns = ["session_id", "session_name"]
+
     class Sessions(tables.IsDescription):
         session_id = tables.StringCol(64)
         subject_id = tables.StringCol(64)
@@ -183,7 +393,7 @@ class SessionsTable(Table):
         session_label = tables.StringCol(64)
 
     def __init__(self, table, subject_id):
-        super(SessionsTable, self).__init__(table=table)
+        super(SessionsTable, self).__init__(table=get_shard(table, subject_id))
         self.table_name = "session"
         self.subject_id = subject_id
         self.subject_group = self.table.root.__getattr__(self.subject_id)
@@ -198,6 +408,7 @@ class SessionsTable(Table):
                                    filters=self.filters)
 
         self.sessions_table = self.subject_group.sessions
+        create_indexes(self.sessions_table, self.index_columns)
         self.column_names = self.sessions_table.colnames
 
     def create_session(self, **kwargs):
@@ -211,15 +422,7 @@ class SessionsTable(Table):
         return group
 
     def get_new_id(self):
-        sessions = self.get_sessions()
-        max_id = len(sessions)
-        for session in sessions:
-            session_id = int(session["session_id"].split("_")[-1])
-            if session_id > max_id:
-                max_id = session_id
-
-        max_id += 1
-        return "{}_{}".format(self.table_name, max_id)
+        return self.next_id(self.sessions_table)
 
     def get_session(self, session_name=""):
         return self.search_table(self.sessions_table, session_name=session_name)
@@ -236,6 +439,9 @@ class SessionsTable(Table):
 
 # TODO: See if you can reduce the precision, so we don't needlessly waste tons and tons of space
 class MeasurementsTable(Table):
+    id_column = "measurement_id"
+    index_columns = ["measurement_id", "measurement_name"]
+
     class Measurements(tables.IsDescription):
         measurement_id = tables.StringCol(64)
         session_id = tables.StringCol(64)
@@ -253,7 +459,7 @@ class MeasurementsTable(Table):
         processed = tables.BoolCol()
 
     def __init__(self, table, subject_id, session_id):
-        super(MeasurementsTable, self).__init__(table=table)
+        super(MeasurementsTable, self).__init__(table=get_shard(table, subject_id))
         self.table_name = "measurement"
         self.subject_id = subject_id
         self.session_id = session_id
@@ -272,6 +478,7 @@ class MeasurementsTable(Table):
 
         self.contacts_table = self.session_group.contacts
         self.measurements_table = self.session_group.measurements
+        create_indexes(self.measurements_table, self.index_columns)
         self.column_names = self.measurements_table.colnames
 
     def create_measurement(self, **kwargs):
@@ -285,15 +492,7 @@ class MeasurementsTable(Table):
         return group
 
     def get_new_id(self):
-        measurements = self.get_measurements()
-        max_id = len(measurements)
-        for measurement in measurements:
-            measurement_id = int(measurement["measurement_id"].split("_")[-1])
-            if measurement_id > max_id:
-                max_id = measurement_id
-
-        max_id += 1
-        return "{}_{}".format(self.table_name, max_id)
+        return self.next_id(self.measurements_table)
 
     def get_measurement(self, measurement_name=""):
         return self.search_table(self.measurements_table, measurement_name=measurement_name)
@@ -309,15 +508,13 @@ class MeasurementsTable(Table):
         return measurements
 
     def update_measurement(self, item_id, **kwargs):
-        for row in self.measurements_table:
-            if row["measurement_id"] == item_id:
-                for attr, value in kwargs.items():
-                    row[attr] = value
-                row.update()
-        self.measurements_table.flush()
+        self.update_row(self.measurements_table, "measurement_id", item_id, **kwargs)
 
 
 class ContactsTable(Table):
+    id_column = "contact_id"
+    index_columns = ["contact_id"]
+
     class Contacts(tables.IsDescription):
         measurement_id = tables.StringCol(64)
         session_id = tables.StringCol(64)
@@ -370,7 +567,7 @@ class ContactsTable(Table):
         diag_width = tables.FloatCol()
 
     def __init__(self, table, subject_id, session_id, measurement_id):
-        super(ContactsTable, self).__init__(table=table)
+        super(ContactsTable, self).__init__(table=get_shard(table, subject_id))
         self.table_name = "contact"
         self.subject_id = subject_id
         self.session_id = session_id
@@ -384,6 +581,7 @@ class ContactsTable(Table):
                                                          title="Contacts", filters=self.filters)
 
         self.contacts_table = self.measurement_group.contacts
+        create_indexes(self.contacts_table, self.index_columns)
         self.column_names = self.contacts_table.colnames
 
     def create_contact(self, **kwargs):
@@ -392,34 +590,14 @@ class ContactsTable(Table):
 
         self.check_availability(self.contacts_table, "contact_id", kwargs)
 
+        # The arrays are stored by the ContactDataTable
         self.create_row(self.contacts_table, **kwargs)
-        group = self.create_group(parent=self.measurement_group, item_id=kwargs["contact_id"])
-        return group
 
     def get_new_id(self):
-        contacts = self.get_contacts()
-        max_id = len(contacts)
-        for contact in contacts:
-            contact_id = int(contact["contact_id"].split("_")[-1])
-            if contact_id > max_id:
-                max_id = contact_id
-
-        max_id += 1
-        return "{}_{}".format(self.table_name, max_id)
+        return self.next_id(self.contacts_table)
 
     def update_contact(self, **kwargs):
-        found = False
-        for row in self.contacts_table:
-            if row["contact_id"] == kwargs["contact_id"]:
-                found = True
-                # Update any fields that have changed
-                for key, value in kwargs.items():
-                    row[key] = value
-                    row.update()
-        if found:
-            self.contacts_table.flush()
-            return True
-        return False
+        return self.update_row(self.contacts_table, "contact_id", kwargs["contact_id"], **kwargs)
 
     def get_contact(self, contact_id=""):
         return self.search_table(self.contacts_table, contact_id=contact_id)
@@ -436,8 +614,23 @@ class ContactsTable(Table):
 
 
 class ContactDataTable(Table):
+    """
+    The arrays of all the contacts of a measurement are stored together: every item gets one extendable array
+    with the flattened data of all contacts concatenated and the offsets table tells where each contact's data
+    starts and stops and what shape it had.
+    Databases that haven't been consolidated yet have a group for each contact with an array per item.
+    """
+    class Offsets(tables.IsDescription):
+        contact_id = tables.StringCol(16)
+        item_id = tables.StringCol(32)
+        start = tables.Int64Col()
+        stop = tables.Int64Col()
+        # Padded with zeros, ndim tells how many dimensions are actually used
+        shape = tables.Int64Col(shape=(3,))
+        ndim = tables.UInt8Col()
+
     def __init__(self, table, subject_id, session_id, measurement_id):
-        super(ContactDataTable, self).__init__(table=table)
+        super(ContactDataTable, self).__init__(table=get_shard(table, subject_id))
         self.table_name = "contact_data"
         self.subject_id = subject_id
         self.session_id = session_id
@@ -447,10 +640,89 @@ class ContactDataTable(Table):
         self.item_ids = ["data", "max_of_max", "pressure_over_time", "force_over_time", "surface_over_time",
                          "pixel_count_over_time", "cop_x", "cop_y", "vcop_xy", "vcop_x", "vcop_y",]
 
+    def get_contact_data_group(self, create=False):
+        # We look it up every time, because it gets removed and created again when the contacts are replaced
+        if self.table_name in self.measurement_group:
+            return self.measurement_group.__getattr__(self.table_name)
+        if create:
+            group = self.table.create_group(where=self.measurement_group, name=self.table_name)
+            self.table.create_table(where=group, name="offsets", description=ContactDataTable.Offsets,
+                                    title="Offsets", filters=self.filters)
+            return group
+
+    def store_contact_data(self, contact_id, arrays):
+        """
+        Append the arrays of this contact to the arrays of the measurement
+        """
+        group = self.get_contact_data_group(create=True)
+        for item_id, data in arrays.items():
+            data = np.asarray(data)
+            if item_id not in group:
+                # Most contacts fit in one or two chunks and the series of an entire measurement in a single one
+                chunkshape = (max(1, CHUNK_BYTES // data.dtype.itemsize),)
+                self.table.create_earray(where=group, name=item_id, atom=tables.Atom.from_dtype(data.dtype),
+                                         shape=(0,), filters=self.filters, chunkshape=chunkshape)
+            array = group.__getattr__(item_id)
+            start = array.nrows
+            array.append(data.ravel())
+            shape = list(data.shape) + [0] * (3 - data.ndim)
+            append_row(group.offsets, dict(contact_id=contact_id, item_id=item_id, start=start,
+                                           stop=array.nrows, shape=shape, ndim=data.ndim))
+        self.flush()
+
     def get_contact_data(self):
+        group = self.get_contact_data_group()
+        if group is None:
+            return self.get_legacy_contact_data()
+
+        # Read every array in one go and cut it up per contact afterwards
+        arrays = {}
+        for item_id in self.item_ids:
+            if item_id in group:
+                arrays[item_id] = group.__getattr__(item_id).read()
+        offsets = {}
+        for offset in group.offsets.read():
+            offsets[(decode(offset["contact_id"]), decode(offset["item_id"]))] = offset
+
+        contacts = []
+        for contact_id in self.measurement_group.contacts.col("contact_id"):
+            contact_data = defaultdict()
+            for item_id in self.item_ids:
+                # We try to retrieve what's available, if its not available, it should be computed later on
+                offset = offsets.get((decode(contact_id), item_id))
+                if offset is None or item_id not in arrays:
+                    contact_data[item_id] = None
+                    continue
+                shape = tuple(offset["shape"][:offset["ndim"]])
+                contact_data[item_id] = arrays[item_id][offset["start"]:offset["stop"]].reshape(shape)
+            contacts.append(contact_data)
+        return contacts
+
+    def get_item(self, contact_id, item_id):
+        """
+        Read a single array of a single contact, returns None if it's not available
+        """
+        group = self.get_contact_data_group()
+        if group is None:
+            contact_id = decode(contact_id)
+            if contact_id not in self.measurement_group:
+                return None
+            return self.get_data(group=self.measurement_group.__getattr__(contact_id), item_id=item_id)
+
+        if item_id not in group:
+            return None
+        offsets = group.offsets.read_where("(contact_id == contact) & (item_id == item)",
+                                           condvars={"contact": contact_id, "item": item_id})
+        if not len(offsets):
+            return None
+        offset = offsets[-1]
+        shape = tuple(offset["shape"][:offset["ndim"]])
+        return group.__getattr__(item_id)[offset["start"]:offset["stop"]].reshape(shape)
+
+    def get_legacy_contact_data(self):
         contacts = []
         for contact in self.measurement_group.contacts:
-            contact_id = contact["contact_id"]
+            contact_id = decode(contact["contact_id"])
             group = self.measurement_group.__getattr__(contact_id)
             contact_data = defaultdict()
             for item_id in self.item_ids:
@@ -462,6 +734,109 @@ class ContactDataTable(Table):
             contacts.append(contact_data)
         return contacts
 
+    def remove_contact(self, contact_id):
+        """
+        Drop the offsets of this contact, its data stays in the arrays until the database gets compacted
+        """
+        group = self.get_contact_data_group()
+        if group is None:
+            return
+        for index in reversed(self.find_rows(group.offsets, "contact_id", contact_id)):
+            try:
+                group.offsets.remove_rows(start=index, stop=index + 1)
+            except NotImplementedError:
+                # PyTables can't remove the last row, so remove everything
+                self.remove_contact_data()
+                return
+        self.flush()
+
+    def remove_contact_data(self):
+        if self.table_name in self.measurement_group:
+            self.remove_group(where=self.measurement_group, name=self.table_name)
+
+
+class ContactsIndexTable(Table):
+    """
+    One flat table at the root with the scalar columns of every contact in the database,
+    so questions about contacts of lots of subjects don't have to open the contacts table of every measurement.
+    Contacts.create_contacts keeps it up to date.
+    """
+    index_columns = ["subject_id", "session_id", "measurement_id", "contact_label"]
+
+    def __init__(self, table):
+        super(ContactsIndexTable, self).__init__(table=table)
+        self.table_name = "contacts_index"
+
+        if self.table_name not in self.table.root:
+            self.contacts_index = self.table.create_table(where="/", name=self.table_name,
+                                                          description=ContactsTable.Contacts,
+                                                          title="Contacts index", filters=self.filters)
+            # Every measurement replaces its rows, we'd rather not rebuild every index each time.
+            # The indexes are brought up to date when we query the table
+            self.contacts_index.autoindex = False
+        else:
+            self.contacts_index = self.table.root.__getattr__(self.table_name)
+
+        create_indexes(self.contacts_index, self.index_columns)
+
+    def replace_contacts(self, subject_id, session_id, measurement_id, contacts):
+        """
+        Replace the rows of this measurement with the contacts, which are dicts like the rows of the ContactsTable
+        """
+        self.remove_contacts(subject_id, session_id, measurement_id)
+        for contact in contacts:
+            append_row(self.contacts_index, contact)
+        self.flush(self.contacts_index)
+
+    def remove_contacts(self, subject_id, session_id, measurement_id, contact_id=None):
+        """
+        Remove the rows of this measurement or only the one of contact_id
+        """
+        condition = "(subject_id == subject) & (session_id == session) & (measurement_id == measurement)"
+        condvars = {"subject": subject_id, "session": session_id, "measurement": measurement_id}
+        if contact_id is not None:
+            condition += " & (contact_id == contact)"
+            condvars["contact"] = contact_id
+        coordinates = self.contacts_index.get_where_list(condition, condvars=condvars)
+        remove_coordinates(self.contacts_index, coordinates)
+        self.flush(self.contacts_index)
+
+    def query(self, columns=None, **kwargs):
+        """
+        Returns a pandas DataFrame with the contacts where every column equals its keyword's value.
+        If the value is a list, it can be any of its values. For example the peak force of all left front contacts
+        of two subjects: query(columns=["subject_id", "peak_force"], contact_label=0,
+                               subject_id=["subject_1", "subject_4"])
+        """
+        import pandas as pd
+
+        conditions = []
+        condvars = {}
+        for key, values in kwargs.items():
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            names = []
+            for value in values:
+                name = "value_{}".format(len(condvars))
+                names.append("({} == {})".format(key, name))
+                condvars[name] = value
+            conditions.append("({})".format(" | ".join(names)))
+
+        # Only the indexes of measurements that changed since the last query have to be rebuilt
+        if self.table.mode != "r":
+            self.contacts_index.reindex_dirty()
+        if conditions:
+            rows = self.contacts_index.read_where(" & ".join(conditions), condvars=condvars)
+        else:
+            rows = self.contacts_index.read()
+
+        data_frame = pd.DataFrame.from_records(rows, columns=columns)
+        for column in data_frame.columns:
+            if rows.dtype[column].kind == "S":
+                data_frame[column] = data_frame[column].map(decode)
+        return data_frame
+
+
 class SessionDataTable(Table):
     class Contacts(tables.IsDescription):
         session_id = tables.StringCol(64)
@@ -479,7 +854,7 @@ class SessionDataTable(Table):
         length = tables.UInt16Col()
 
     def __init__(self, table, subject_id, session_id):
-        super(SessionDataTable, self).__init__(table=table)
+        super(SessionDataTable, self).__init__(table=get_shard(table, subject_id))
         self.table_name = "session_data"
         self.subject_id = subject_id
         self.session_id = session_id
@@ -487,6 +862,84 @@ class SessionDataTable(Table):
         self.item_ids = ["data", "max_of_max", "pressure_over_time", "force_over_time", "surface_over_time",
                          "cop_x", "cop_y"]
 
+    def store_statistics(self, key, statistics):
+        """
+        statistics maps every contact label to its count and mean and variance arrays.
+        The key tells what contacts they were calculated from, get_statistics only returns them for the same key
+        """
+        group = self.create_group(parent=self.session_group, item_id="statistics")
+        group._v_attrs.key = key
+        for contact_label, (count, mean, variance) in statistics.items():
+            label_group = self.table.create_group(where=group, name="label_{}".format(contact_label))
+            label_group._v_attrs.contact_label = contact_label
+            label_group._v_attrs.count = count
+            self.store_data(group=label_group, item_id="mean", data=mean, kind="contact")
+            self.store_data(group=label_group, item_id="variance", data=variance, kind="contact")
+        self.flush()
+
+    def get_statistics(self, key):
+        """
+        Returns None if there are no statistics or if they were calculated from different contacts
+        """
+        if "statistics" not in self.session_group:
+            return None
+        group = self.session_group.statistics
+        if getattr(group._v_attrs, "key", None) != key:
+            return None
+        statistics = {}
+        for label_group in group._f_iter_nodes(classname="Group"):
+            statistics[int(label_group._v_attrs.contact_label)] = (int(label_group._v_attrs.count),
+                                                                   label_group.mean.read(),
+                                                                   label_group.variance.read())
+        return statistics
+
+    def store_summary(self, key, summary):
+        """
+        The summary is a tree of dicts, see Sessions.calculate_summary,
+        it's only returned by get_summary for the same key
+        """
+        group = self.create_group(parent=self.session_group, item_id="summary")
+        group._v_attrs.key = key
+        self.store_tree(group, summary)
+        self.flush()
+
+    def get_summary(self, key):
+        if "summary" not in self.session_group:
+            return None
+        group = self.session_group.summary
+        if getattr(group._v_attrs, "key", None) != key:
+            return None
+        return self.read_tree(group)
+
+    def store_tree(self, group, tree):
+        """
+        Dicts become groups and arrays become arrays, everything else is kept in the values attribute of the group.
+        Labels are ints, so the keys are kept in an attribute as well, instead of in the name of the node
+        """
+        values = {}
+        for index, (key, value) in enumerate(tree.items()):
+            if isinstance(value, dict):
+                node = self.table.create_group(where=group, name="node_{}".format(index))
+                self.store_tree(node, value)
+            elif isinstance(value, np.ndarray) and value.size:
+                self.store_data(group=group, item_id="node_{}".format(index), data=value, kind="series")
+                node = group.__getattr__("node_{}".format(index))
+            else:
+                values[key] = value
+                continue
+            node._v_attrs.key = key
+        if values:
+            group._v_attrs.values = values
+
+    def read_tree(self, group):
+        tree = dict(getattr(group._v_attrs, "values", {}))
+        for node in group._f_iter_nodes():
+            key = node._v_attrs.key
+            if isinstance(key, np.integer):
+                key = int(key)
+            tree[key] = self.read_tree(node) if isinstance(node, tables.Group) else node.read()
+        return tree
+
     def get_contact_data(self):
         contacts = []
         for contact in self.session_group.contacts:
@@ -499,6 +952,8 @@ class SessionDataTable(Table):
         return contacts
 
 class PlatesTable(Table):
+    index_columns = ["plate_id", "brand", "model"]
+
     class Plates(tables.IsDescription):
         plate_id = tables.StringCol(64)
         brand = tables.StringCol(32)
@@ -519,6 +974,7 @@ class PlatesTable(Table):
         else:
             self.plates_table = self.table.root.plates
 
+        create_indexes(self.plates_table, self.index_columns)
         self.column_names = self.plates_table.colnames
 
     def create_plate(self, **kwargs):
@@ -545,124 +1001,522 @@ class PlatesTable(Table):
         return plates
 
 
-def verify_tables(table):
-    # If there isn't even a subjects table, no need to do anything
-    if not hasattr(table.root,  "subjects"):
+def chunk_shape(kind, shape, itemsize):
+    """
+    Returns the chunk shape for an array of this kind:
+    - measurement: whole frames, as many as fit in CHUNK_BYTES, so showing a frame only decompresses one chunk
+    - contact: the whole cube, because a contact is always read as a whole
+    - series: a single chunk
+    If kind is None, PyTables gets to pick the chunk shape
+    """
+    if kind is None or not all(shape):
+        return None
+    if kind == "measurement":
+        rows, columns, frames = shape
+        frames_per_chunk = max(1, CHUNK_BYTES // (rows * columns * itemsize))
+        return rows, columns, min(frames, frames_per_chunk)
+    if kind in ("contact", "series"):
+        return tuple(shape)
+    raise ValueError("Unknown kind of array: {}".format(kind))
+
+
+def is_sharded(table):
+    return bool(getattr(table.root._v_attrs, "sharded", False))
+
+
+def shard_folder(database_file):
+    return os.path.splitext(database_file)[0] + "_shards"
+
+
+def shard_files(database_file):
+    """
+    Returns the file names of every shard of the database
+    """
+    folder = shard_folder(database_file)
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, file_name) for file_name in sorted(os.listdir(folder)) if file_name.endswith(".h5")]
+
+
+def open_shard(table, subject_id):
+    """
+    Open (or create) the shard file of this subject, it has the same layout as the master file used to have,
+    but only for this subject
+    """
+    key = (table.filename, subject_id)
+    shard = shards.get(key)
+    if shard is not None and shard.isopen:
+        return shard
+
+    folder = shard_folder(table.filename)
+    if not os.path.exists(folder) and table.mode != "r":
+        os.makedirs(folder)
+    file_name = os.path.join(folder, "{}.h5".format(subject_id))
+    # The shards of a read-only database are read-only as well
+    if table.mode == "r":
+        shard = tables.open_file(file_name, mode="r")
+        shards[key] = shard
+        return shard
+
+    shard = load_table(file_name)
+    if subject_id not in shard.root:
+        shard.root._v_attrs.storage_profile = get_storage_profile(table)
+        shard.create_group(where="/", name=subject_id)
+    check_schema(shard)
+    shards[key] = shard
+    return shard
+
+
+@locked
+def get_shard(table, subject_id):
+    """
+    Returns the file that holds the sessions, measurements and contacts of this subject.
+    In the sharded layout every subject has its own file, else it's the database itself.
+    A shard isn't sharded itself, so a process can also open a shard directly and use that as its table
+    """
+    if not is_sharded(table):
+        return table
+    return open_shard(table, subject_id)
+
+
+@locked
+def close_shards(table):
+    for key in [key for key in shards if key[0] == table.filename]:
+        shard = shards.pop(key)
+        if shard.isopen:
+            shard.close()
+
+
+def remove_shard(table, subject_id):
+    shard = shards.pop((table.filename, subject_id), None)
+    if shard is not None and shard.isopen:
+        shard.close()
+    file_name = os.path.join(shard_folder(table.filename), "{}.h5".format(subject_id))
+    if os.path.exists(file_name):
+        os.remove(file_name)
+
+
+def shard_database(table):
+    """
+    Move every subject to its own shard file, the master file only keeps the subjects and plates.
+    Everything gets copied before we switch to the sharded layout, so if this fails halfway the database
+    is still intact. Returns the number of subjects that were moved, repack the master file to get its space back
+    """
+    if is_sharded(table):
+        return 0
+
+    groups = list(table.root._f_iter_nodes(classname="Group"))
+    for group in groups:
+        shard = open_shard(table, group._v_name)
+        shard_group = shard.root.__getattr__(group._v_name)
+        group._v_attrs._f_copy(shard_group)
+        group._f_copy_children(shard_group, recursive=True, overwrite=True, propindexes=True)
+        rebuild_contacts_index(shard)
+        shard.flush()
+
+    table.root._v_attrs.sharded = True
+    for group in groups:
+        group._f_remove(recursive=True)
+    # The contacts are in the indexes of the shards now
+    rebuild_contacts_index(table)
+    table.flush()
+    return len(groups)
+
+
+@locked
+def query_contacts(table, columns=None, **kwargs):
+    """
+    Query the contacts index, see ContactsIndexTable.query. In the sharded layout every shard has its own index,
+    so we only open the shards of the subjects we're looking for
+    """
+    if not is_sharded(table):
+        return ContactsIndexTable(table=table).query(columns=columns, **kwargs)
+
+    import pandas as pd
+
+    subject_ids = kwargs.get("subject_id")
+    if subject_ids is None:
+        subject_ids = [decode(subject_id) for subject_id in table.root.subjects.col("subject_id")]
+    elif not isinstance(subject_ids, (list, tuple)):
+        subject_ids = [subject_ids]
+
+    data_frames = [ContactsIndexTable(table=get_shard(table, subject_id)).query(columns=columns, **kwargs)
+                   for subject_id in subject_ids]
+    if not data_frames:
+        return ContactsIndexTable(table=table).query(columns=columns, **kwargs)
+    return pd.concat(data_frames, ignore_index=True)
+
+
+def get_storage_profile(table):
+    """
+    Returns the name of the storage profile this database uses
+    """
+    return decode(getattr(table.root._v_attrs, "storage_profile", DEFAULT_STORAGE_PROFILE))
+
+
+def storage_filters(storage_profile):
+    if storage_profile not in STORAGE_PROFILES:
+        raise ValueError("Unknown storage profile: {}".format(storage_profile))
+    return tables.Filters(**STORAGE_PROFILES[storage_profile])
+
+
+def set_storage_profile(table, storage_profile):
+    """
+    Everything written from now on uses this profile, use repack_database to convert what's already stored
+    """
+    table.filters = storage_filters(storage_profile)
+    table.root._v_attrs.storage_profile = storage_profile
+    table.flush()
+
+
+def copy_database(database_file, output_file, storage_profile):
+    """
+    Copy everything in the database to a new file, compressing every array and table with the storage profile.
+    The chunk shapes, attributes and indexes are kept as they are
+    """
+    filters = storage_filters(storage_profile)
+    source = tables.open_file(database_file, mode="r")
+    try:
+        destination = tables.open_file(output_file, mode="w", title=source.title, filters=filters)
+        try:
+            source.root._v_attrs._f_copy(destination.root)
+            source.root._f_copy_children(destination.root, recursive=True, filters=filters, propindexes=True)
+            destination.root._v_attrs.storage_profile = storage_profile
+        finally:
+            destination.close()
+    finally:
+        source.close()
+
+
+def replace_file(file_name, new_file_name):
+    """
+    Move new_file_name over file_name. On Windows you can't rename onto an existing file,
+    so we move the old file out of the way first and put it back if something goes wrong
+    """
+    backup_file_name = file_name + ".backup"
+    os.rename(file_name, backup_file_name)
+    try:
+        os.rename(new_file_name, file_name)
+    except BaseException:
+        os.rename(backup_file_name, file_name)
+        raise
+    os.remove(backup_file_name)
+
+
+def compact_contact_data(table):
+    """
+    Removing a contact only drops its offsets, so its data is still taking up space in the arrays.
+    Rewrite the contact data of every measurement that has data none of its contacts refer to anymore.
+    Returns the number of measurements that were rewritten
+    """
+    rewritten = 0
+    for node, table_class in walk_tables(table):
+        if table_class is not ContactsTable:
+            continue
+        measurement_group = node._v_parent
+        if "contact_data" not in measurement_group:
+            continue
+
+        group = measurement_group.contact_data
+        offsets = group.offsets.read()
+        used = defaultdict(int)
+        for offset in offsets:
+            used[decode(offset["item_id"])] += offset["stop"] - offset["start"]
+        arrays = dict((array._v_name, array) for array in group._f_iter_nodes(classname="EArray"))
+        if all(used[item_id] == array.nrows for item_id, array in arrays.items()):
+            continue
+
+        # Cut out the data that's still used, then store it again contact by contact
+        arrays = dict((item_id, array.read()) for item_id, array in arrays.items())
+        contacts = OrderedDict()
+        for offset in offsets:
+            item_id = decode(offset["item_id"])
+            shape = tuple(offset["shape"][:offset["ndim"]])
+            data = arrays[item_id][offset["start"]:offset["stop"]].reshape(shape)
+            contacts.setdefault(decode(offset["contact_id"]), {})[item_id] = data
+
+        session_group = measurement_group._v_parent
+        contact_data_table = ContactDataTable(table=table, subject_id=session_group._v_parent._v_name,
+                                              session_id=session_group._v_name,
+                                              measurement_id=measurement_group._v_name)
+        contact_data_table.remove_contact_data()
+        for contact_id, contact_arrays in contacts.items():
+            contact_data_table.store_contact_data(contact_id, contact_arrays)
+        rewritten += 1
+    table.flush()
+    return rewritten
+
+
+def repack_database(database_file, storage_profile=None):
+    """
+    Copy the live tree of the database into a new file and swap it in. HDF5 never reuses the space of removed nodes,
+    so this is the only way to get it back. Without a storage profile, the database keeps the one it has.
+    The database shouldn't be opened by anyone else. Returns the number of bytes that were reclaimed
+    """
+    if storage_profile is None:
+        database = tables.open_file(database_file, mode="r")
+        try:
+            storage_profile = get_storage_profile(database)
+        finally:
+            database.close()
+
+    old_size = os.path.getsize(database_file)
+    repacked_file = database_file + ".repack"
+    try:
+        copy_database(database_file, repacked_file, storage_profile)
+        # Only the copy gets changed, so if anything goes wrong the database is left alone
+        repacked = tables.open_file(repacked_file, mode="a")
+        try:
+            compact_contact_data(repacked)
+        finally:
+            repacked.close()
+        replace_file(database_file, repacked_file)
+    finally:
+        if os.path.exists(repacked_file):
+            os.remove(repacked_file)
+    return old_size - os.path.getsize(database_file)
+
+
+def create_indexes(table, columns):
+    """
+    Create a PyTables index on each of the columns, unless it already has one
+    """
+    for column_name in columns:
+        column = table.cols._f_col(column_name)
+        if not column.is_indexed:
+            column.create_index()
+
+
+def remove_coordinates(table, coordinates):
+    """
+    Remove the rows at these coordinates, taking out consecutive rows in one go
+    """
+    if len(coordinates) == table.nrows and table.nrows:
+        # PyTables won't remove every row of a table
+        table.truncate(0)
         return
 
-    # Check SubjectsTable
-    subjects_description = table.root.subjects.description._v_dtypes
-    subject_difference = False
-    for key, value in SubjectsTable.Subjects.columns.items():
-        if value.dtype != subjects_description.get(key):
-            subject_difference = True
-
-    # If there are any differences, copy over the content to a new table and then replace the old table with the new one
-    if subject_difference:
-        root_group = table.root
-        new_subjects_table = table.createTable(where="/", name="subjects2",
-                                               description=SubjectsTable.Subjects,
-                                               title="Subjects", filters=table.filters)
-        subjects_table = table.root.subjects
-        subjects_table.attrs._f_copy(new_subjects_table)
-        for i in xrange(subjects_table.nrows):
-            new_subjects_table.row.append()
-        new_subjects_table.flush()
-
-        description = table.description._v_colObjects
-        for col in description:
-            getattr(new_subjects_table.cols, col)[:] = getattr(subjects_table.cols, col)[:]
-
-        subjects_table.remove()
-        new_subjects_table.move(root_group, "subjects")
-
-    # Check SessionsTable
-    for subject in table.root.subjects:
-        session_difference = False
-        subject_id = subject["subject_id"]
-        subject_group = table.root.__getattr__(subject_id)
-        sessions_description = subject_group.sessions.description._v_dtypes
-        for key, value in SessionsTable.Sessions.columns.items():
-            if value.dtype != sessions_description.get(key):
-                session_difference = True
-
-        if session_difference:
-            new_sessions_table = table.createTable(where="/", name="sessions2",
-                                                   description=SessionsTable.Sessions,
-                                                   title="Sessions", filters=table.filters)
-            sessions_table = subject_group.sessions
-            sessions_table.attrs._f_copy(new_sessions_table)
-            for i in xrange(sessions_table.nrows):
-                new_sessions_table.row.append()
-            new_sessions_table.flush()
-
-            description = sessions_table.description._v_colObjects
-            for col in description:
-                getattr(new_sessions_table.cols, col)[:] = getattr(sessions_table.cols, col)[:]
-
-            sessions_table.remove()
-            new_sessions_table.move(subject_group, "sessions")
-
-        # Check the MeasurementsTable
-        for session in table.root.__getattr__(subject_id).sessions:
-            measurement_difference = False
-            session_id = session["session_id"]
-            session_group = table.root.__getattr__(subject_id).__getattr__(session_id)
-            # If an attribute is missing, skip it
-            if not hasattr(session_group, "measurements"):
-                continue
-            measurements_description = session_group.measurements.description._v_dtypes
-            for key, value in MeasurementsTable.Measurements.columns.items():
-                if value.dtype != measurements_description.get(key):
-                    measurement_difference = True
-
-            if measurement_difference:
-                new_measurements_table = table.createTable(where="/", name="measurements2",
-                                                           description=MeasurementsTable.Measurements,
-                                                           title="Measurements", filters=table.filters)
-                measurements_table = session_group.measurements
-                measurements_table.attrs._f_copy(new_measurements_table)
-                for i in xrange(measurements_table.nrows):
-                    new_measurements_table.row.append()
-                new_measurements_table.flush()
-
-                description = measurements_table.description._v_colObjects
-                for col in description:
-                    getattr(new_measurements_table.cols, col)[:] = getattr(measurements_table.cols, col)[:]
-
-                measurements_table.remove()
-                new_measurements_table.move(session_group, "measurements")
-
-            for measurement in table.root.__getattr__(subject_id).__getattr__(session_id).measurements:
-                contact_difference = False
-                measurement_id = measurement["measurement_id"]
-                measurement_group = table.root.__getattr__(subject_id).__getattr__(session_id).__getattr__(measurement_id)
-                # If an attribute is missing, skip it
-                if not hasattr(measurement_group, "contacts"):
-                    continue
-                contacts_description = measurement_group.contacts.description._v_dtypes
-                for key, value in ContactsTable.Contacts.columns.items():
-                    if value.dtype != contacts_description.get(key):
-                        contact_difference = True
-
-                if contact_difference:
-                    new_contacts_table = table.createTable(where="/", name="contacts2",
-                                                               description=ContactsTable.Contacts,
-                                                               title="Contacts", filters=table.filters)
-                    contacts_table = measurement_group.contacts
-                    contacts_table.attrs._f_copy(new_contacts_table)
-                    for i in xrange(contacts_table.nrows):
-                        new_contacts_table.row.append()
-                    new_contacts_table.flush()
-
-                    description = contacts_table.description._v_colObjects
-                    for col in description:
-                        getattr(new_contacts_table.cols, col)[:] = getattr(contacts_table.cols, col)[:]
-
-                    contacts_table.remove()
-                    new_contacts_table.move(measurement_group, "contacts")
+    # Start at the end, so the coordinates we still have to remove don't shift
+    stop = None
+    for index in sorted(coordinates, reverse=True):
+        if stop is None:
+            start, stop = index, index + 1
+        elif index == start - 1:
+            start = index
+        else:
+            table.remove_rows(start=start, stop=stop)
+            start, stop = index, index + 1
+    if stop is not None:
+        table.remove_rows(start=start, stop=stop)
+
+
+def walk_tables(table):
+    """
+    Yields every (table node, Table class) pair in the database.
+    The node name and depth tell us what kind of table we're dealing with, this way we don't have to
+    walk through all the subjects, sessions and measurements by their ids.
+    """
+    table_classes = {
+        ("plates", 1): PlatesTable,
+        ("subjects", 1): SubjectsTable,
+        ("sessions", 2): SessionsTable,
+        ("measurements", 3): MeasurementsTable,
+        ("contacts", 4): ContactsTable,
+    }
+    # Create a list first, because the caller might be modifying the tree
+    for node in list(table.walk_nodes("/", classname="Table")):
+        # Which also means it might have removed this node already
+        if not node._v_isopen:
+            continue
+        table_class = table_classes.get((node._v_name, node._v_depth))
+        if table_class is not None:
+            yield node, table_class
+
+
+def index_tables(table):
+    """
+    Make sure every table in an existing database has its indexes
+    """
+    for node, table_class in walk_tables(table):
+        create_indexes(node, table_class.index_columns)
+    table.flush()
+
+
+def append_row(table, kwargs):
+    row = table.row
+    for attr, value in kwargs.items():
+        row[attr] = value
+    # Append the row to the table
+    row.append()
+
+
+def decode(value):
+    """
+    PyTables hands back bytes for string columns, node names need a string
+    """
+    if isinstance(value, bytes):
+        return value.decode("ascii")
+    return value
+
+
+def parse_id(item_id):
+    """
+    Returns the number at the end of an id like subject_12
+    """
+    return int(decode(item_id).split("_")[-1])
+
+
+def get_last_id(table, column_name):
+    """
+    Returns the highest id number handed out for this table, which is stored in its last_id attribute.
+    Tables that were created before we kept a counter get it backfilled from their rows once
+    """
+    if "last_id" not in table.attrs:
+        last_id = table.nrows
+        for item_id in table.col(column_name):
+            last_id = max(last_id, parse_id(item_id))
+        table.attrs.last_id = last_id
+    return int(table.attrs.last_id)
+
+
+def backfill_id_counters(table):
+    """
+    Make sure every table in an existing database has its last_id counter
+    """
+    for node, table_class in walk_tables(table):
+        if table_class.id_column is not None:
+            get_last_id(node, table_class.id_column)
+    table.flush()
+
+
+def consolidate_contact_data(table):
+    """
+    Move the arrays from the group every contact used to have into the consolidated layout of the ContactDataTable.
+    Returns the number of measurements that were converted
+    """
+    converted = 0
+    for node, table_class in walk_tables(table):
+        if table_class is not ContactsTable:
+            continue
+
+        measurement_group = node._v_parent
+        contact_ids = [decode(contact_id) for contact_id in node.col("contact_id")
+                       if decode(contact_id) in measurement_group]
+        if not contact_ids:
+            continue
+
+        session_group = measurement_group._v_parent
+        contact_data_table = ContactDataTable(table=table, subject_id=session_group._v_parent._v_name,
+                                              session_id=session_group._v_name,
+                                              measurement_id=measurement_group._v_name)
+        # If anything goes wrong, we're left with the old groups
+        with contact_data_table.write_batch():
+            contact_data_table.remove_contact_data()
+            legacy_contact_data = contact_data_table.get_legacy_contact_data()
+            for contact_id, contact_data in zip(node.col("contact_id"), legacy_contact_data):
+                arrays = dict((item_id, data) for item_id, data in contact_data.items() if data is not None)
+                contact_data_table.store_contact_data(contact_id, arrays)
+            for contact_id in contact_ids:
+                contact_data_table.remove_group(where=measurement_group, name=contact_id)
+        converted += 1
+    return converted
+
+
+def convert_rows(rows, description):
+    """
+    Convert the rows to the current description, columns that didn't exist yet get their default value
+    """
+    columns = description.columns
+    new_rows = np.empty(len(rows), dtype=tables.description.dtype_from_descr(description))
+    for name in new_rows.dtype.names:
+        if name in rows.dtype.names:
+            new_rows[name] = rows[name]
+        else:
+            new_rows[name] = columns[name].dflt
+    return new_rows
+
+
+def rebuild_contacts_index(table):
+    """
+    Fill the contacts index with the rows of every contacts table in the database
+    """
+    if "contacts_index" in table.root:
+        table.remove_node(where="/", name="contacts_index")
+    contacts_index = ContactsIndexTable(table=table).contacts_index
+    for node, table_class in walk_tables(table):
+        if table_class is ContactsTable:
+            contacts_index.append(convert_rows(node.read(), ContactsTable.Contacts))
+    contacts_index.flush()
+    contacts_index.reindex_dirty()
+    return contacts_index.nrows
+
+
+def migrate_table(table, node, description):
+    """
+    Replace node with a table using the current description. The rows are copied in bulk,
+    columns that didn't exist yet get their default value.
+    """
+    new_rows = convert_rows(node.read(), description)
+
+    parent = node._v_parent
+    name = node._v_name
+    new_table = table.create_table(where=parent, name="{}2".format(name), description=description,
+                                   title=node._v_title, filters=node.filters)
+    node.attrs._f_copy(new_table)
+    new_table.append(new_rows)
+    new_table.flush()
+
+    node.remove()
+    new_table.move(parent, name)
+    return new_table
+
+
+def verify_tables(table):
+    """
+    Compare every table with the current description of its columns and migrate the ones that differ
+    """
+    descriptions = {
+        SubjectsTable: SubjectsTable.Subjects,
+        SessionsTable: SessionsTable.Sessions,
+        MeasurementsTable: MeasurementsTable.Measurements,
+        ContactsTable: ContactsTable.Contacts,
+    }
+    for node, table_class in walk_tables(table):
+        description = descriptions.get(table_class)
+        if description is None:
+            continue
+
+        dtypes = node.description._v_dtypes
+        for key, value in description.columns.items():
+            if value.dtype != dtypes.get(key):
+                migrate_table(table, node, description)
+                break
+    table.flush()
+    return True
 
+
+def check_schema(table):
+    """
+    Bring a database created with an older schema up to date.
+    If it's already up to date, this is just a single attribute read.
+    Returns True if anything had to be updated
+    """
+    version = getattr(table.root._v_attrs, "schema_version", 0)
+    if version >= SCHEMA_VERSION:
+        return False
+
+    verify_tables(table)
+    # Databases created before we used indexes won't have them yet
+    index_tables(table)
+    # Same goes for the counters get_new_id uses
+    backfill_id_counters(table)
+    # And the contacts index, which we can only fill now every contacts table is up to date
+    rebuild_contacts_index(table)
+
+    table.root._v_attrs.schema_version = SCHEMA_VERSION
+    table.flush()
     return True
 
+
 def load_table(database_file):
     return tables.open_file(database_file, mode="a", title="Data")
\ No newline at end of file
@@ -1,9 +1,10 @@
 import os
 import sys
+import time
 from collections import defaultdict
 from PySide import QtGui, QtCore
 from pubsub import pub
-from ..models import table
+from ..models import table, access, database
 import logging
 
 __version__ = '0.2'
@@ -41,15 +42,17 @@ class Settings(QtCore.QSettings):
                            "end_force_percentage",
                            "tracking_temporal",
                            "tracking_spatial",
-                           "tracking_surface"],
-            "application": ["zip_files", "show_maximized", "restore_last_session"],
+                           "tracking_surface",
+                           "outlier_rule"],
+            "application": ["zip_files", "show_maximized", "restore_last_session", "contact_cache_size",
+                            "snapshot_interval"],
         }
 
-        # Create a database connection with PyTables
-        database_file = self.database_file()
-        self.table = table.load_table(database_file)
-        # Verify the table layout and if its not up to date, update it (though perhaps ask the user?)
-        table.verify_tables(self.table)
+        # The database connection is only created once something needs it, see table
+        self.database = None
+        self.last_snapshot = 0
+        # The thread that owns the database, see database_worker
+        self.worker = None
 
         # Possibly I could provide a getter/setter such that you could change this on the fly
         self.create_contact_dict()
@@ -58,6 +61,66 @@ class Settings(QtCore.QSettings):
         # Set up the logger
         self.setup_logging()
 
+    @property
+    def table(self):
+        # The worker gets here from its own thread as well, so only one of them gets to open the database
+        with table.hdf5_lock:
+            # Create a database connection with PyTables
+            if self.database is None:
+                database_file = self.database_file()
+                self.database = table.load_table(database_file)
+                # Verify the table layout and if its not up to date, update it (though perhaps ask the user?)
+                # This only walks through the entire database if it was created with an older schema
+                table.check_schema(self.database)
+            return self.database
+
+    def database_worker(self):
+        """
+        Returns the thread that does the database work in the background, it's started the first time we need it.
+        Anything that touches the database from another thread than the GUI thread should go through here.
+        It uses the same handle as the GUI thread, see database.py for how hdf5_lock keeps them apart
+        """
+        if self.worker is None:
+            self.worker = database.DatabaseWorker(open_database=lambda: self.table)
+            self.worker.start()
+        return self.worker
+
+    def close_table(self):
+        # Let the worker finish whatever it's doing, before we pull the database from under it
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+        # If we never opened the database, there's nothing to close
+        if self.database is not None:
+            # Leave a snapshot with everything we've done for the readers, the worker is gone so we do it ourselves
+            with table.hdf5_lock:
+                self.write_snapshot(self.database, force=True)
+                table.close_shards(self.database)
+                self.database.close()
+                self.database = None
+
+    def publish_snapshot(self, force=False):
+        """
+        Publish a snapshot of the database for processes that want to read it, see models/access.py.
+        Copying the files takes a while, so it's done on the database worker and this returns its future
+        """
+        if self.database is None:
+            return
+        return self.database_worker().submit(self.write_snapshot, force)
+
+    def write_snapshot(self, database, force=False):
+        """
+        Unless we're forced, we wait at least snapshot_interval minutes between snapshots.
+        This has to hold hdf5_lock, so nothing gets written to the database while we copy it
+        """
+        interval = self.snapshot_interval()
+        if not interval:
+            return
+        if not force and time.time() - self.last_snapshot < interval * 60:
+            return
+        access.publish_snapshot(database)
+        self.last_snapshot = time.time()
+
     def create_contact_dict(self):
         # Lookup table for converting indices to labels
         if __human__:
@@ -257,6 +320,16 @@ class Settings(QtCore.QSettings):
         value = float(self.value(key, 0.25))
         return value
 
+    def outlier_rule(self):
+        # See sessionmodel.OUTLIER_RULES: mean +/- 1.96 std, median +/- 3 scaled MAD or Tukey's fences
+        key = "thresholds/outlier_rule"
+        default_value = "sd"
+        setting_value = self.value(key)
+        if setting_value in ("sd", "mad", "iqr"):
+            return str(setting_value)
+        else:
+            return default_value
+
     def padding_factor(self):
         key = "thresholds/padding_factor"
         return int(self.value(key, 1))
@@ -414,6 +487,26 @@ class Settings(QtCore.QSettings):
         else:
             return default_value
 
+    def contact_cache_size(self):
+        # In megabytes
+        key = "application/contact_cache_size"
+        default_value = 256
+        setting_value = self.value(key)
+        if setting_value:
+            return int(setting_value)
+        else:
+            return default_value
+
+    def snapshot_interval(self):
+        # In minutes, 0 means we don't publish any snapshots
+        key = "application/snapshot_interval"
+        default_value = 0
+        setting_value = self.value(key)
+        if setting_value:
+            return int(setting_value)
+        else:
+            return default_value
+
     def read_settings(self):
         """
         This function is used by the settings widget to get information about all the keys available
@@ -442,6 +535,7 @@ class Settings(QtCore.QSettings):
         self.settings["thresholds/tracking_temporal"] = self.tracking_temporal()
         self.settings["thresholds/tracking_spatial"] = self.tracking_spatial()
         self.settings["thresholds/tracking_surface"] = self.tracking_surface()
+        self.settings["thresholds/outlier_rule"] = self.outlier_rule()
         self.settings["thresholds/padding_factor"] = self.padding_factor()
 
         self.settings["widgets/main_window_left"] = self.main_window_left()
@@ -463,6 +557,8 @@ class Settings(QtCore.QSettings):
         self.settings["application/label_font"] = self.label_font()
         self.settings["application/date_format"] = self.date_format()
         self.settings["application/restore_last_session"] = self.restore_last_session()
+        self.settings["application/contact_cache_size"] = self.contact_cache_size()
+        self.settings["application/snapshot_interval"] = self.snapshot_interval()
 
         return self.settings
 
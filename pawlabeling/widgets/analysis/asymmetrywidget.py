@@ -19,9 +19,10 @@ class AsymmetryWidget(QtGui.QWidget):
         self.parent = parent
         self.active = False
 
-        self.asymmetry_front = AsymmetryView(self, "Asymmetry Front", compare=[[0],[2]])
-        self.asymmetry_hind = AsymmetryView(self, "Asymmetry Hind", compare=[[1],[3]])
-        self.asymmetry_pt = AsymmetryView(self, "Asymmetry PT", compare=[[0,2],[1,3]])
+        # See sessionmodel.ASYMMETRY_COMPARISONS for the labels that get compared
+        self.asymmetry_front = AsymmetryView(self, "Asymmetry Front", comparison="front")
+        self.asymmetry_hind = AsymmetryView(self, "Asymmetry Hind", comparison="hind")
+        self.asymmetry_pt = AsymmetryView(self, "Asymmetry PT", comparison="pt")
 
         self.asymmetry_list = [self.asymmetry_front,
                                self.asymmetry_hind,
@@ -50,14 +51,14 @@ class AsymmetryWidget(QtGui.QWidget):
 
 
 class AsymmetryView(QtGui.QWidget):
-    def __init__(self, parent, label, compare):
+    def __init__(self, parent, label, comparison):
         super(AsymmetryView, self).__init__(parent)
         label_font = settings.settings.label_font()
         self.label = QtGui.QLabel(label)
         self.label.setFont(label_font)
         self.parent = parent
         self.model = model.model
-        self.compare = compare
+        self.comparison = comparison
 
         self.frame = -1
         self.length = 0
@@ -100,55 +101,13 @@ class AsymmetryView(QtGui.QWidget):
             self.draw()
 
     def draw(self):
-        if len(self.model.dataframe) == 0:
+        asymmetry = self.model.current_summary().get("asymmetry", {})
+        if self.comparison not in asymmetry:
             return
 
-        asi = defaultdict(list)
-
-        index = self.model.dataframe.index
-        if self.model.outlier_toggle:
-            index = self.model.dataframe[self.model.dataframe["filtered"]==False].index
-
-        # I probably should calculate this in the model as well
-        for measurement_id, measurement_group in self.model.dataframe.ix[index].groupby("measurement_id"):
-            contact_group = measurement_group.groupby("contact_label")
-
-            # Check if all the compare contacts are present
-            present = True
-            for l in self.compare[0]:
-                if l not in contact_group.groups:
-                    present = False
-            for r in self.compare[1]:
-                if r not in contact_group.groups:
-                    present = False
-
-            if not present:
-                continue
-
-            for column in self.columns:
-                left = 0.
-                right = 0.
-                for l in self.compare[0]:
-                    if l in contact_group.groups:
-                        left += np.mean(contact_group.get_group(l)[column].dropna())
-                for r in self.compare[1]:
-                    if r in contact_group.groups:
-                        right += np.mean(contact_group.get_group(r)[column].dropna())
-
-                # Somehow one or the other can have an opposite sign, so make them absolute
-                if column == "step_length":
-                    left = abs(left)
-                    right = abs(right)
-                # Only calculate the ASI if we've progressed from the default
-                if left > 0 and right > 0:
-                    asi[column].append(calculations.asymmetry_index(left, right))
-
         for column in self.columns:
-            #print column, asi[column]
-            self.text_boxes[column].setText("{:>6} +/- {:>5}".format("{:.2f}".format(np.mean(asi[column])),
-                                                                    "{:.2f}".format(np.std(asi[column]))))
-
-
+            mean, std = asymmetry[self.comparison][column]
+            self.text_boxes[column].setText("{:>6} +/- {:>5}".format("{:.2f}".format(mean), "{:.2f}".format(std)))
 
     def clear_cached_values(self):
         # Put the screen to black
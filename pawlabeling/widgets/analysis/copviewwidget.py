@@ -80,8 +80,7 @@ class ContactView(QtGui.QWidget):
         self.parent = parent
         self.model = model.model
         self.degree = settings.settings.interpolation_results()
-        self.image_color_table = utility.ImageColorTable()
-        self.color_table = self.image_color_table.create_color_table()
+        self.color_buffer = utility.ColorMapBuffer()
         self.mx = 1
         self.my = 1
         self.mz = 1
@@ -254,7 +253,7 @@ class ContactView(QtGui.QWidget):
         self.data = np.rot90(np.rot90(self.data))
         self.data = self.data[:, ::-1]
         # Display the average measurement_data for the requested frame
-        self.pixmap = utility.get_qpixmap(self.data, self.degree, self.model.n_max, self.color_table)
+        self.pixmap = utility.get_qpixmap(self.data, self.degree, self.model.n_max, buffer=self.color_buffer)
         self.image.setPixmap(self.pixmap)
         self.resizeEvent()
 
@@ -271,7 +270,7 @@ class ContactView(QtGui.QWidget):
         self.data = np.zeros((self.mx, self.my))
         # Put the screen to black
         self.image.setPixmap(
-            utility.get_qpixmap(np.zeros((self.mx, self.my)), self.degree, self.model.n_max, self.color_table))
+            utility.get_qpixmap(np.zeros((self.mx, self.my)), self.degree, self.model.n_max, buffer=self.color_buffer))
         for point in self.cop_ellipses:
             self.scene.removeItem(point)
         self.cop_ellipses = []
@@ -4,9 +4,9 @@ from PySide import QtGui
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 from pubsub import pub
-from ...functions import utility, calculations
+from ...functions import calculations
 from ...settings import settings
-from ...models import model
+from ...models import model, sessionmodel
 
 
 class ForceViewWidget(QtGui.QWidget):
@@ -83,8 +83,6 @@ class ContactView(QtGui.QWidget):
         self.parent = parent
         self.model = model.model
         self.frame = 0
-        self.image_color_table = utility.ImageColorTable()
-        self.color_table = self.image_color_table.create_color_table()
         self.x = 100
         self.y = 100
 
@@ -123,33 +121,21 @@ class ContactView(QtGui.QWidget):
             return
 
         self.clear_axes()
-        interpolate_length = 100
-        lengths = []
-
-        force_over_time = []
-        self.max_duration = 0
-        self.max_force = 0
-
-        for measurement_name, contacts in self.model.contacts.iteritems():
-            for contact in contacts:
-                # Skip contacts that have been filtered if the toggle is on
-                if self.model.outlier_toggle:
-                    if contact.filtered or contact.invalid:
-                        continue
-
-                force = np.pad(contact.force_over_time, 1, mode="constant", constant_values=0)
-                if contact.contact_label == self.contact_label:
-                    lengths.append(len(force))
-                    interpolated_force = calculations.interpolate_time_series(force, interpolate_length)
-                    force_over_time.append(interpolated_force)
-                    time_line = calculations.interpolate_time_series(np.arange(np.max(len(force))),
-                                                                     interpolate_length)
-                    self.axes.plot(time_line, interpolated_force, alpha=0.5)
-
-                if len(force) > self.max_duration:
-                    self.max_duration = len(force)
-                if np.max(force) > self.max_force:
-                    self.max_force = np.max(force)
+        # The curves are calculated once per session, see Sessions.calculate_summary
+        summary = self.model.current_summary()
+        if not summary:
+            return
+        interpolate_length = sessionmodel.INTERPOLATE_LENGTH
+        self.max_duration = summary["max"]["duration"]
+        self.max_force = summary["max"]["force"]
+
+        curves = summary["curves"].get(self.contact_label)
+        if curves is not None:
+            # Every row is a contact, so they're plotted in one go. The time line of a contact is the same as
+            # interpolating np.arange(length)
+            percentages = np.linspace(0, 1, num=interpolate_length)
+            time_lines = percentages[np.newaxis, :] * (curves["length"][:, np.newaxis] - 1)
+            self.axes.plot(time_lines.T, curves["force"].T, alpha=0.5)
 
         # If there's a contact selected, plot that too
         if self.contact_label in self.model.selected_contacts:
@@ -160,15 +146,13 @@ class ContactView(QtGui.QWidget):
                                                              interpolate_length)
             self.axes.plot(time_line, interpolated_force, color="k", linewidth=4, alpha=0.75)
 
-
         # If this is empty, there were no contacts to plot
-        if not force_over_time:
+        if curves is None:
             return
-        force_over_time = np.array(force_over_time)
-        mean_length = np.mean(lengths)
+        mean_length = np.mean(curves["length"])
         interpolated_time_line = calculations.interpolate_time_series(np.arange(int(mean_length)), interpolate_length)
-        mean_force = np.mean(force_over_time, axis=0)
-        std_force = np.std(force_over_time, axis=0)
+        mean_force = curves["mean_force"]
+        std_force = curves["std_force"]
         self.axes.plot(interpolated_time_line, mean_force, color="r", linewidth=3)
         self.axes.plot(interpolated_time_line, mean_force + std_force, color="r", linewidth=1)
         self.axes.fill_between(interpolated_time_line, mean_force - std_force, mean_force + std_force, facecolor="r",
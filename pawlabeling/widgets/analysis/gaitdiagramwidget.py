@@ -53,8 +53,7 @@ class GaitDiagramView(QtGui.QWidget):
         self.model = model.model
         self.degree = settings.settings.interpolation_results()
         self.colors = settings.settings.colors
-        self.image_color_table = utility.ImageColorTable()
-        self.color_table = self.image_color_table.create_color_table()
+        self.color_buffer = utility.ColorMapBuffer()
 
         self.frame = -1
         self.length = 0
@@ -117,7 +116,7 @@ class GaitDiagramView(QtGui.QWidget):
         self.length = self.model.measurement_data.shape[2]
 
         # Update the pixmap
-        self.pixmap = utility.get_qpixmap(self.data, self.degree, self.n_max, self.color_table)
+        self.pixmap = utility.get_qpixmap(self.data, self.degree, self.n_max, buffer=self.color_buffer)
         self.image.setPixmap(self.pixmap)
 
     def update_gait_diagram(self):
@@ -184,7 +183,7 @@ class GaitDiagramView(QtGui.QWidget):
         self.frame = -1
         self.data = np.zeros((64, 256))
         # Put the screen to black
-        self.image.setPixmap(utility.get_qpixmap(self.data, self.degree, self.model.n_max, self.color_table))
+        self.image.setPixmap(utility.get_qpixmap(self.data, self.degree, self.model.n_max, buffer=self.color_buffer))
 
     def clear_bounding_box(self):
         # Remove the old ones and redraw
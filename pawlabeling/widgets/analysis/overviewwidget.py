@@ -106,20 +106,11 @@ class OverviewView(QtGui.QWidget):
             self.draw()
 
     def draw(self):
-        if len(self.model.dataframe) == 0:
-            return
-
-        index = self.model.dataframe.index
-        if self.model.outlier_toggle:
-            index = self.model.dataframe[self.model.dataframe["filtered"]==False].index
-
-        contact_group = self.model.dataframe.ix[index].groupby("contact_label")
-        if self.contact_label in contact_group.groups:
-            data = contact_group.get_group(self.contact_label)
+        results = self.model.current_summary().get("results", {})
+        if self.contact_label in results:
             for column in self.columns:
-                self.text_boxes[column].setText("{:>6} +/- {:>5}".format("{:.2f}".format(np.mean(data[column].dropna())),
-                                                                        "{:.2f}".format(np.std(data[column].dropna()))))
-
+                mean, std = results[self.contact_label][column]
+                self.text_boxes[column].setText("{:>6} +/- {:>5}".format("{:.2f}".format(mean), "{:.2f}".format(std)))
 
     def clear_cached_values(self):
         # Put the screen to black
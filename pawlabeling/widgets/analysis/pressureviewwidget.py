@@ -3,9 +3,9 @@ from PySide import QtGui
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 from pubsub import pub
-from ...functions import utility, calculations
+from ...functions import calculations
 from ...settings import settings
-from ...models import model
+from ...models import model, sessionmodel
 
 
 class PressureViewWidget(QtGui.QWidget):
@@ -84,8 +84,6 @@ class ContactView(QtGui.QWidget):
         self.frame = 0
         self.x = 0
         self.y = 0
-        self.image_color_table = utility.ImageColorTable()
-        self.color_table = self.image_color_table.create_color_table()
 
         self.dpi = 100
         self.fig = Figure((3.0, 2.0), dpi=self.dpi)
@@ -122,32 +120,21 @@ class ContactView(QtGui.QWidget):
             return
 
         self.clear_axes()
-        interpolate_length = 100
-        lengths = []
-        pressure_over_time = []
-        self.max_duration = 0
-        self.max_pressure = 0
-
-        for measurement_name, contacts in self.model.contacts.iteritems():
-            for contact in contacts:
-                # Skip contacts that have been filtered if the toggle is on
-                if self.model.outlier_toggle:
-                    if contact.filtered or contact.invalid:
-                        continue
-
-                pressure = np.pad(contact.pressure_over_time, 1, mode="constant", constant_values=0)
-                if contact.contact_label == self.contact_label:
-                    lengths.append(len(pressure))
-                    interpolated_pressure = calculations.interpolate_time_series(pressure, interpolate_length)
-                    pressure_over_time.append(interpolated_pressure)
-                    time_line = calculations.interpolate_time_series(np.arange(np.max(len(pressure))),
-                                                                     interpolate_length)
-                    self.axes.plot(time_line, interpolated_pressure, alpha=0.5)
-
-                if len(pressure) > self.max_duration:
-                    self.max_duration = len(pressure)
-                if np.max(pressure) > self.max_pressure:
-                    self.max_pressure = np.max(pressure)
+        # The curves are calculated once per session, see Sessions.calculate_summary
+        summary = self.model.current_summary()
+        if not summary:
+            return
+        interpolate_length = sessionmodel.INTERPOLATE_LENGTH
+        self.max_duration = summary["max"]["duration"]
+        self.max_pressure = summary["max"]["pressure"]
+
+        curves = summary["curves"].get(self.contact_label)
+        if curves is not None:
+            # Every row is a contact, so they're plotted in one go. The time line of a contact is the same as
+            # interpolating np.arange(length)
+            percentages = np.linspace(0, 1, num=interpolate_length)
+            time_lines = percentages[np.newaxis, :] * (curves["length"][:, np.newaxis] - 1)
+            self.axes.plot(time_lines.T, curves["pressure"].T, alpha=0.5)
 
         # If there's a contact selected, plot that too
         if self.contact_label in self.model.selected_contacts:
@@ -159,13 +146,12 @@ class ContactView(QtGui.QWidget):
             self.axes.plot(time_line, interpolated_pressure, color="k", linewidth=4, alpha=0.75)
 
         # If this is empty, there were no contacts to plot
-        if not pressure_over_time:
+        if curves is None:
             return
-        pressure_over_time = np.array(pressure_over_time)
-        mean_length = np.mean(lengths)
+        mean_length = np.mean(curves["length"])
         interpolated_time_line = calculations.interpolate_time_series(np.arange(int(mean_length)), interpolate_length)
-        mean_pressure = np.mean(pressure_over_time, axis=0)
-        std_pressure = np.std(pressure_over_time, axis=0)
+        mean_pressure = curves["mean_pressure"]
+        std_pressure = curves["std_pressure"]
         self.axes.plot(interpolated_time_line, mean_pressure, color="r", linewidth=3)
         self.axes.plot(interpolated_time_line, mean_pressure + std_pressure, color="r", linewidth=1)
         self.axes.fill_between(interpolated_time_line, mean_pressure - std_pressure, mean_pressure + std_pressure,
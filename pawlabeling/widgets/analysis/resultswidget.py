@@ -12,6 +12,7 @@ class ResultsWidget(QtGui.QWidget):
         self.parent = parent
         self.model = model
         self.two_dim_view_widget = twodimviewwidget.TwoDimViewWidget(self)
+        self.standard_deviation_widget = twodimviewwidget.StandardDeviationWidget(self)
         self.pressure_view_widget = pressureviewwidget.PressureViewWidget(self)
         self.force_view_widget = forceviewwidget.ForceViewWidget(self)
         self.cop_view_widget = copviewwidget.CopViewWidget(self)
@@ -20,6 +21,7 @@ class ResultsWidget(QtGui.QWidget):
         self.overview_widget = overviewwidget.OverviewWidget(self)
 
         self.widgets = [self.two_dim_view_widget,
+                        self.standard_deviation_widget,
                         self.pressure_view_widget,
                         self.force_view_widget,
                         self.cop_view_widget,
@@ -33,6 +35,7 @@ class ResultsWidget(QtGui.QWidget):
 
         self.tab_widget = QtGui.QTabWidget(self)
         self.tab_widget.addTab(self.two_dim_view_widget, "2D view")
+        self.tab_widget.addTab(self.standard_deviation_widget, "SD map")
         self.tab_widget.addTab(self.pressure_view_widget, "Pressure")
         self.tab_widget.addTab(self.force_view_widget, "Force")
         self.tab_widget.addTab(self.cop_view_widget, "COP")
@@ -9,24 +9,27 @@ from ...models import model
 
 
 class TwoDimViewWidget(QtGui.QWidget):
+    title = "2D View"
+
     def __init__(self, parent):
         super(TwoDimViewWidget, self).__init__(parent)
-        self.label = QtGui.QLabel("2D View")
+        self.label = QtGui.QLabel(self.title)
         self.parent = parent
         self.active = False
+        view_class = self.view_class()
 
         if settings.__human__:
-            self.left_front = ContactView(self, label="Left Front", contact_label=0)
-            self.right_front = ContactView(self, label="Right Front", contact_label=1)
+            self.left_front = view_class(self, label="Left Front", contact_label=0)
+            self.right_front = view_class(self, label="Right Front", contact_label=1)
             self.contacts_list = {
                 0: self.left_front,
                 1: self.right_front,
                 }
         else:
-            self.left_front = ContactView(self, label="Left Front", contact_label=0)
-            self.left_hind = ContactView(self, label="Left Hind", contact_label=1)
-            self.right_front = ContactView(self, label="Right Front", contact_label=2)
-            self.right_hind = ContactView(self, label="Right Hind", contact_label=3)
+            self.left_front = view_class(self, label="Left Front", contact_label=0)
+            self.left_hind = view_class(self, label="Left Hind", contact_label=1)
+            self.right_front = view_class(self, label="Right Front", contact_label=2)
+            self.right_hind = view_class(self, label="Right Hind", contact_label=3)
 
             self.contacts_list = {
                 0: self.left_front,
@@ -52,6 +55,10 @@ class TwoDimViewWidget(QtGui.QWidget):
         pub.subscribe(self.change_frame, "analysis.change_frame")
         pub.subscribe(self.active_widget, "active_widget")
 
+    def view_class(self):
+        # The classes are defined below this one
+        return ContactView
+
     def change_frame(self, frame):
         for contact_label, widget in self.contacts_list.iteritems():
             if self.active:
@@ -82,8 +89,7 @@ class ContactView(QtGui.QWidget):
         self.parent = parent
         self.model = model.model
         self.degree = settings.settings.interpolation_results()
-        self.image_color_table = utility.ImageColorTable()
-        self.color_table = self.image_color_table.create_color_table()
+        self.color_buffer = utility.ColorMapBuffer()
         self.mx = 1
         self.my = 1
         self.min_x = 0
@@ -141,11 +147,19 @@ class ContactView(QtGui.QWidget):
 
     def get_data(self):
         if self.model.average_toggle:
+            # This average is normalized in time, so every label's average lasts as long as the slider
+            average = self.model.current_summary().get("average", {}).get(self.contact_label)
+            # No results yet, or the label has no contacts left after filtering
+            if average is None:
+                self.data = np.zeros((self.mx, self.my))
+                self.length = 0
+                return
             if self.frame == -1:
-                self.data = self.model.average_data[self.contact_label].max(axis=2)
+                self.data = average.max(axis=2)
             else:
-                self.data = self.model.average_data[self.contact_label][:, :, self.frame]
-            self.length = self.model.average_data[self.contact_label].shape[2]
+                sample = int(round(self.frame * (average.shape[2] - 1.) / max(1, self.model.max_length)))
+                self.data = average[:, :, min(sample, average.shape[2] - 1)]
+            self.length = self.model.max_length + 1
         else:
             if self.frame == -1:
                 self.data = self.model.selected_contacts[self.contact_label].data.max(axis=2)
@@ -156,6 +170,9 @@ class ContactView(QtGui.QWidget):
             self.data = np.pad(self.data, 2, mode="constant", constant_values=0)
             self.length = self.model.selected_contacts[self.contact_label].data.shape[2]
 
+    def get_n_max(self):
+        return self.model.n_max
+
     def draw(self):
         self.get_data()
 
@@ -163,14 +180,14 @@ class ContactView(QtGui.QWidget):
         self.data = np.rot90(np.rot90(self.data))
         self.data = self.data[:, ::-1]
         # Display the average measurement_data for the requested frame
-        self.image.setPixmap(utility.get_qpixmap(self.data, self.degree, self.model.n_max, self.color_table))
+        self.image.setPixmap(utility.get_qpixmap(self.data, self.degree, self.get_n_max(), buffer=self.color_buffer))
         self.resizeEvent()
 
     def change_frame(self, frame):
         self.frame = frame
         # If we're not displaying the empty array
         if (self.frame < self.length and
-                    self.contact_label in self.model.average_data and
+                    self.contact_label in self.model.current_summary().get("average", {}) and
                     self.contact_label in self.model.selected_contacts):
             self.draw()
 
@@ -178,7 +195,7 @@ class ContactView(QtGui.QWidget):
         self.frame = -1
         self.data = np.zeros((self.mx, self.my))
         # Put the screen to black
-        self.image.setPixmap(utility.get_qpixmap(self.data, self.degree, self.model.n_max, self.color_table))
+        self.image.setPixmap(utility.get_qpixmap(self.data, self.degree, self.model.n_max, buffer=self.color_buffer))
 
     def resizeEvent(self, event=None):
         item_size = self.view.mapFromScene(self.image.sceneBoundingRect()).boundingRect().size()
@@ -188,4 +205,47 @@ class ContactView(QtGui.QWidget):
         if abs(1 - ratio) > 0.1:
             self.image.setTransform(QtGui.QTransform.fromScale(ratio, ratio), True)
             self.view.setSceneRect(self.view.rect())
-            self.view.centerOn(self.image)
\ No newline at end of file
+            self.view.centerOn(self.image)
+
+
+class StandardDeviationWidget(TwoDimViewWidget):
+    """
+    How much the contacts of every label vary, pixel by pixel, see Model.get_statistics
+    """
+    title = "SD Map"
+
+    def view_class(self):
+        return StandardDeviationView
+
+
+class StandardDeviationView(ContactView):
+    def __init__(self, parent, label, contact_label):
+        super(StandardDeviationView, self).__init__(parent, label, contact_label)
+        self.n_max = 0
+
+    def get_n_max(self):
+        # The deviations are much smaller than the pressures, so they get a color scale of their own
+        return self.n_max
+
+    def get_statistics(self):
+        return self.model.get_statistics().get(self.contact_label)
+
+    def get_data(self):
+        statistics = self.get_statistics()
+        if statistics is None:
+            self.data = np.zeros((self.mx, self.my))
+            self.length = 0
+            return
+        count, mean, variance = statistics
+        standard_deviation = np.sqrt(variance)
+        self.n_max = float(standard_deviation.max())
+        if self.frame == -1:
+            self.data = standard_deviation.max(axis=2)
+        else:
+            self.data = standard_deviation[:, :, min(self.frame, standard_deviation.shape[2] - 1)]
+        self.length = standard_deviation.shape[2]
+
+    def change_frame(self, frame):
+        self.frame = frame
+        if self.frame < self.length and self.get_statistics() is not None:
+            self.draw()
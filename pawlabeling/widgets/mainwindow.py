@@ -1,6 +1,8 @@
 import sys
 import os
 import logging
+# Import this first, so it can tell how long starting up takes
+from ..functions import startup
 from PySide import QtGui, QtCore
 from pubsub import pub
 # Set this right away, so its set for the whole application
@@ -13,7 +15,6 @@ matplotlib.rcParams["backend.qt4"] = "PySide"
 from ..settings import settings
 from ..functions.qsingleapplication import QtSingleApplication
 from ..models import model
-from ..widgets.analysis import analysiswidget
 from ..widgets.processing import processingwidget
 from ..widgets.database import databasewidget
 from ..widgets.settings import settingswidget
@@ -49,7 +50,8 @@ class MainWindow(QtGui.QMainWindow):
 
         self.database_widget = databasewidget.DatabaseWidget(self)
         self.processing_widget = processingwidget.ProcessingWidget(self)
-        self.analysis_widget = analysiswidget.AnalysisWidget(self)
+        # The analysis widget is only created once its tab gets activated, see create_analysis_widget
+        self.analysis_widget = None
         settings.settings_widget = settingswidget.SettingsWidget(self)
 
         self.tab_dict = {0: "Database", 1: "Processing",
@@ -61,13 +63,18 @@ class MainWindow(QtGui.QMainWindow):
         self.progress = QtGui.QProgressBar()
         self.progress.setRange(0, 100)
         self.status.addPermanentWidget(self.progress)
+        # Only shown while a session is loading
+        self.cancel_button = QtGui.QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_session_load)
+        self.cancel_button.hide()
+        self.status.addPermanentWidget(self.cancel_button)
 
         self.message_box = QtGui.QMessageBox()
 
         self.tab_widget = QtGui.QTabWidget(self)
         self.tab_widget.addTab(self.database_widget, "Database")
         self.tab_widget.addTab(self.processing_widget, "Processing")
-        self.tab_widget.addTab(self.analysis_widget, "Analysis")
+        self.tab_widget.addTab(QtGui.QWidget(self), "Analysis")
         self.tab_widget.addTab(settings.settings_widget, "Settings")
         self.tab_widget.currentChanged.connect(self.change_tabs)
 
@@ -78,9 +85,36 @@ class MainWindow(QtGui.QMainWindow):
         pub.subscribe(self.update_progress, "update_progress")
         pub.subscribe(self.launch_message_box, "message_box")
         pub.subscribe(self.changed_settings, "changed_settings")
+        pub.subscribe(self.session_load_started, "session_load_started")
+        pub.subscribe(self.session_load_finished, "session_load_finished")
 
         # This has to be called after all widgets have been created
+        # Because this opens the database, we wait until the window has been shown
+        QtCore.QTimer.singleShot(0, self.load_subjects)
+
+    def load_subjects(self):
         self.model.get_subjects()
+        startup.mark("Subjects loaded")
+        settings.settings.logger.info(startup.report())
+
+    def create_analysis_widget(self):
+        """
+        Replace the placeholder of the analysis tab with the actual widget. Its only created once its needed,
+        that way we don't have to import all the analysis widgets and matplotlib's backend when starting up
+        """
+        from ..widgets.analysis import analysiswidget
+
+        self.analysis_widget = analysiswidget.AnalysisWidget(self)
+        # Its tree missed the session that was loaded before it existed
+        pub.sendMessage("update_measurement_status")
+        # Don't let replacing the tab trigger change_tabs again
+        self.tab_widget.blockSignals(True)
+        placeholder = self.tab_widget.widget(2)
+        self.tab_widget.removeTab(2)
+        placeholder.deleteLater()
+        self.tab_widget.insertTab(2, self.analysis_widget, "Analysis")
+        self.tab_widget.setCurrentIndex(2)
+        self.tab_widget.blockSignals(False)
 
     def center(self):
         qr = self.frameGeometry()
@@ -96,6 +130,8 @@ class MainWindow(QtGui.QMainWindow):
         elif self.tab_widget.currentIndex() == 1:
             self.processing_widget.measurement_tree.select_initial_measurement()
         elif self.tab_widget.currentIndex() == 2:
+            if self.analysis_widget is None:
+                self.create_analysis_widget()
             self.analysis_widget.measurement_tree.select_initial_measurement()
             # Calculate the results if it hasn't been done already
             self.model.calculate_results()
@@ -124,6 +160,15 @@ class MainWindow(QtGui.QMainWindow):
         else:
             self.progress.setValue(progress)
 
+    def session_load_started(self):
+        self.cancel_button.show()
+
+    def session_load_finished(self):
+        self.cancel_button.hide()
+
+    def cancel_session_load(self):
+        pub.sendMessage("model_cancel_session_load")
+
     def launch_message_box(self, message):
         self.message_box.setText(message)
         self.message_box.exec_()
@@ -170,12 +215,14 @@ def main():
         sys.exit(0)
 
     app.setFont(QtGui.QFont("Helvetica", pointSize=10))
+    startup.mark("Imports done")
     window = MainWindow(app)
+    startup.mark("Main window created")
     window.show()
     window.raise_()
     app.exec_()
     # Remember to close the table when we're done
-    settings.settings.table.close()
+    settings.settings.close_table()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,6 @@
 import os
 from collections import defaultdict
 import logging
-import numpy as np
 from PySide import QtGui, QtCore
 from PySide.QtCore import Qt
 from pubsub import pub
@@ -10,14 +9,11 @@ from ..settings import settings
 from treewidgetitem import TreeWidgetItem
 
 
-class Singleton(object):
-    _instance = None
-    def __new__(class_, *args, **kwargs):
-        if not isinstance(class_._instance, class_):
-            class_._instance = object.__new__(class_, *args, **kwargs)
-        return class_._instance
-
-class MeasurementTree(QtGui.QWidget, Singleton):
+class MeasurementTree(QtGui.QWidget):
+    """
+    The processing and the analysis tab each have their own tree, a widget can only sit in one layout.
+    They're both filled from the model whenever update_measurement_status is sent
+    """
     def __init__(self, parent=None):
         super(MeasurementTree, self).__init__(parent)
         self.model = model.model
@@ -89,10 +85,9 @@ class MeasurementTree(QtGui.QWidget, Singleton):
                 contact_item.setText(0, str(contact.contact_id.split("_")[-1]))
                 contact_item.setText(1, self.contact_dict[contact.contact_label])
                 contact_item.setText(2, str(contact.length))  # Sets the frame count
-                max_surface = np.max(contact.surface_over_time)
-                contact_item.setText(3, str(int(max_surface)))
-                max_force = np.max(contact.force_over_time)
-                contact_item.setText(4, str(int(max_force)))
+                # Use the stored peaks, so filling the tree doesn't load the contact's arrays from the table
+                contact_item.setText(3, str(int(contact.peak_surface)))
+                contact_item.setText(4, str(int(contact.peak_force)))
 
                 if contact.invalid:
                     color = self.colors[-3]
@@ -150,8 +150,7 @@ class ContactWidget(QtGui.QWidget):
         self.n_max = 0
         self.label = label
         self.contact_label = contact_label
-        self.image_color_table = utility.ImageColorTable()
-        self.color_table = self.image_color_table.create_color_table()
+        self.color_buffer = utility.ColorMapBuffer()
         self.mx = 1
         self.my = 1
         self.mz = 1
@@ -219,14 +218,14 @@ class ContactWidget(QtGui.QWidget):
 
         # Make sure the contacts are facing upright
         self.data = np.rot90(np.rot90(self.average_data.max(axis=2)))[:, ::-1]
-        self.pixmap = utility.get_qpixmap(self.data, self.degree, self.model.n_max, self.color_table,
-                                          interpolation="cubic")
+        self.pixmap = utility.get_qpixmap(self.data, self.degree, self.model.n_max, interpolation="cubic",
+                                          buffer=self.color_buffer)
         self.image.setPixmap(self.pixmap)
         self.resizeEvent()
 
     def redraw(self):
-        self.pixmap = utility.get_qpixmap(self.data, self.degree, self.model.n_max, self.color_table,
-                                          interpolation="cubic")
+        self.pixmap = utility.get_qpixmap(self.data, self.degree, self.model.n_max, interpolation="cubic",
+                                          buffer=self.color_buffer)
         self.image.setPixmap(self.pixmap)
         self.resizeEvent()
 
@@ -234,7 +233,7 @@ class ContactWidget(QtGui.QWidget):
         self.data = np.zeros((self.mx, self.my))
         self.average_data = []
         # Put the screen to black
-        self.image.setPixmap(utility.get_qpixmap(np.zeros((15, 15)), self.degree, self.n_max, self.color_table))
+        self.image.setPixmap(utility.get_qpixmap(np.zeros((15, 15)), self.degree, self.n_max, buffer=self.color_buffer))
         self.max_pressure = float("inf")
         self.mean_duration = float("inf")
         self.mean_surface = float("inf")
@@ -6,7 +6,6 @@ from PySide.QtCore import Qt
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 from pubsub import pub
-from ...functions import utility
 from ...settings import settings
 from ...models import model
 
@@ -51,8 +50,6 @@ class DiagramView(QtGui.QWidget):
         self.model = model.model
         self.degree = settings.settings.interpolation_results()
         self.colors = settings.settings.colors
-        self.image_color_table = utility.ImageColorTable()
-        self.color_table = self.image_color_table.create_color_table()
 
         self.frame = -1
         self.length = 0
@@ -33,8 +33,7 @@ class EntirePlateWidget(QtGui.QWidget):
 
         self.colors = settings.settings.colors
         self.degree = settings.settings.interpolation_entire_plate()
-        self.image_color_table = utility.ImageColorTable()
-        self.color_table = self.image_color_table.create_color_table()
+        self.color_buffer = utility.ColorMapBuffer()
         self.setMinimumHeight(settings.settings.entire_plate_widget_height())
 
         # Create a slider
@@ -182,7 +181,7 @@ class EntirePlateWidget(QtGui.QWidget):
             self.data = self.measurement_data[:, :, self.frame].T
 
         # Update the pixmap
-        self.pixmap = utility.get_qpixmap(self.data, self.degree, self.model.n_max, self.color_table)
+        self.pixmap = utility.get_qpixmap(self.data, self.degree, self.model.n_max, buffer=self.color_buffer)
         self.image.setPixmap(self.pixmap)
         self.resizeEvent()
 
@@ -102,6 +102,11 @@ class SettingsWidget(QtGui.QWidget):
         self.tracking_surface_label = QtGui.QLabel("Tracking Surface Threshold")
         self.tracking_surface = QtGui.QLineEdit()
 
+        self.outlier_rule_label = QtGui.QLabel("Outlier Rule")
+        self.outlier_rule = QtGui.QComboBox(self)
+        for outlier_rule in ["sd", "mad", "iqr"]:
+            self.outlier_rule.addItem(outlier_rule)
+
         self.plate_label = QtGui.QLabel("Plate")
         self.plate = QtGui.QComboBox()
         self.update_plates()
@@ -133,7 +138,8 @@ class SettingsWidget(QtGui.QWidget):
                          "end_force_percentage_label", "end_force_percentage", ""],
                         ["tracking_temporal_label", "tracking_temporal", "",
                          "tracking_spatial_label", "tracking_spatial", "",
-                         "tracking_surface_label", "tracking_surface", ""],
+                         "tracking_surface_label", "tracking_surface", "",
+                         "outlier_rule_label", "outlier_rule"],
                         ["plate_label", "plate", "",
                          "frequency_label", "frequency"],
 
@@ -198,6 +204,10 @@ class SettingsWidget(QtGui.QWidget):
         self.tracking_spatial.setText(str(settings.settings.tracking_spatial()))
         self.tracking_surface.setText(str(settings.settings.tracking_surface()))
 
+        outlier_rule = settings.settings.outlier_rule()
+        index = self.outlier_rule.findText(outlier_rule)
+        self.outlier_rule.setCurrentIndex(index)
+
         # Check the settings for which plate to set as default
         frequency = settings.settings.frequency()
         index = self.frequency.findText(frequency)